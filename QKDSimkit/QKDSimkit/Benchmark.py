@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the benchmark of key exchanges
+
+An asyncio channel is started in this process and many alice-bob pairs exchange keys through it at the same time, for
+every combination of key size, batch size, noise and eavesdropper it reports:
+
+    keys_per_second, bits_per_second   keys obtained by alice over the wall time of the configuration
+    latency_ms                         p50/p95/p99 of a single exchange (one batch of keys)
+    retries_per_key                    photon pulses thrown away (key mismatch or too short) over the keys obtained
+    retransmissions_per_key            frames sent again by the retransmission timer over the keys obtained
+    bytes_per_key                      bytes received and sent by the channel over the keys obtained
+
+per key values are null when no key is obtained, e.g. with an eavesdropper every exchange is aborted
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import platform
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+from QKDSimkit.core import alice, bob
+from QKDSimkit.core.channel import async_channel
+from QKDSimkit.core.qexceptions import aliceerror, boberror, qsocketerror
+from QKDSimkit.core.receiver import Receiver
+from QKDSimkit.core.sender import Sender
+from QKDSimkit.core.session import Session
+
+logger = logging.getLogger("QKDSimkit")
+
+PERCENTILES = (50, 95, 99)
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    """A port of host that is not in use"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_local_channel(noise: float, eve: bool, seed: int = None, host: str = '127.0.0.1',
+                        wait: float = 5.0) -> async_channel:
+    """Start an asyncio channel in a background thread and wait until it accepts connections
+
+    Args:
+        noise (float): ratio of noise in channel
+        eve (bool): simulate an eavesdropper in channel
+        seed (int): seed of the noise models
+        host (str): address of the channel
+        wait (float): seconds to wait for the channel
+    Returns:
+        the channel, its address is host:channel.port, stop it with channel.stop()
+    """
+    channel = async_channel('{0}:{1}'.format(host, free_port(host)), noise, eve, seed=seed)
+    threading.Thread(target=channel.initiate_channel, daemon=True).start()
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            socket.create_connection((host, int(channel.port)), timeout=wait).close()
+            return channel
+        except OSError:
+            if time.monotonic() > deadline:
+                raise qsocketerror("the channel did not start")
+            time.sleep(0.01)
+
+
+def run_pair(address: str, ID: str, size: int, batch: int, exchanges: int, result: dict):
+    """Alice and bob of a pair exchange batches of keys, alice measures every exchange
+
+    Args:
+        address (str): channel address
+        ID (str): identifier of alice-bob pair
+        size (int): size of keys in bits
+        batch (int): keys of every exchange
+        exchanges (int): number of exchanges
+        result (dict): filled with keys, latencies, attempts, retransmissions and the reason of an abort
+    """
+    sessions = {'alice': Session(Sender(ID, size), address), 'bob': Session(Receiver(ID, size), address)}
+    result.update(keys=0, latencies=[], attempts=0, error=None)
+
+    def node(name: str, exchange_keys):
+        session = sessions[name]
+        try:
+            session.connect()
+            for _ in range(exchanges):
+                start = time.perf_counter()
+                keys = exchange_keys(session, size, batch)
+                if name == 'alice':
+                    result['latencies'].append(time.perf_counter() - start)
+                    result['keys'] += len(keys)
+        except (aliceerror, boberror, qsocketerror, SystemExit) as e:
+            if name == 'alice':
+                result['error'] = str(e) or type(e).__name__
+        finally:
+            session.close()
+            if name == 'alice':
+                result['attempts'] = session.exchanges
+
+    threads = [threading.Thread(target=node, args=('alice', alice.exchange_keys)),
+               threading.Thread(target=node, args=('bob', bob.exchange_keys))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # read once both nodes are done, the threads do not share the counter
+    result['retransmissions'] = sum(session.node.timer.retransmissions for session in sessions.values())
+
+
+def run_configuration(pairs: int, size: int, batch: int, noise: float, eve: bool, exchanges: int,
+                      seed: int = None) -> dict:
+    """Run many pairs at the same time on a new channel
+
+    Args:
+        pairs (int): number of alice-bob pairs
+        size (int): size of keys in bits
+        batch (int): keys of every exchange
+        noise (float): ratio of noise in channel
+        eve (bool): simulate an eavesdropper in channel
+        exchanges (int): exchanges of every pair
+        seed (int): seed of the noise models
+    Returns:
+        report of the configuration
+    """
+    channel = start_local_channel(noise, eve, seed)
+    address = '127.0.0.1:{0}'.format(channel.port)
+    results = [{} for _ in range(pairs)]
+    threads = [threading.Thread(target=run_pair, args=(address, 'bench-{0}'.format(i), size, batch, exchanges, result))
+               for i, result in enumerate(results)]
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        channel.stop()
+    elapsed = time.perf_counter() - start
+
+    keys = sum(result['keys'] for result in results)
+    latencies = np.array([latency for result in results for latency in result['latencies']])
+
+    def per_key(total):
+        return round(total / keys, 4) if keys else None
+
+    return {
+        'pairs': pairs,
+        'size': size,
+        'batch': batch,
+        'noise': noise,
+        'eve': eve,
+        'exchanges': exchanges,
+        'keys': keys,
+        'aborted': sum(result['error'] is not None for result in results),
+        'seconds': round(elapsed, 4),
+        'keys_per_second': round(keys / elapsed, 2),
+        'bits_per_second': round(keys * size / elapsed, 2),
+        'latency_ms': {'p{0}'.format(q): round(float(np.percentile(latencies, q)) * 1e3, 3) if len(latencies) else None
+                       for q in PERCENTILES},
+        'retries_per_key': per_key(sum(result['attempts'] - len(result['latencies']) for result in results)),
+        'retransmissions_per_key': per_key(sum(result['retransmissions'] for result in results)),
+        'bytes_per_key': per_key(channel.bytes_received + channel.bytes_sent),
+        'frames': channel.frames_received,
+        'bytes_received': channel.bytes_received,
+        'bytes_sent': channel.bytes_sent,
+    }
+
+
+def run_benchmark(pairs: int = 4, sizes=(256,), batches=(1,), noises=(0.0,), eves=(False,), exchanges: int = 5,
+                  seed: int = None) -> dict:
+    """Run every combination of the parameters
+
+    Args:
+        pairs (int): number of alice-bob pairs running at the same time
+        sizes (list): sizes of keys in bits
+        batches (list): keys of every exchange
+        noises (list): ratios of noise in channel
+        eves (list): True and/or False, eavesdropper in channel
+        exchanges (int): exchanges of every pair
+        seed (int): seed of the noise models
+    Returns:
+        report with the environment and a result for every configuration
+    """
+    results = []
+    for size, batch, noise, eve in itertools.product(sizes, batches, noises, eves):
+        logger.info("benchmark size={0} batch={1} noise={2} eve={3}".format(size, batch, noise, eve))
+        results.append(run_configuration(pairs, size, batch, noise, eve, exchanges, seed))
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def start_benchmark(pairs: int = 4, sizes=(256,), batches=(1,), noises=(0.0,), eve: bool = False,
+                    exchanges: int = 5, seed: int = None, output: str = None):
+    """Run the benchmark and write the report as JSON
+
+    Args:
+        eve (bool): run every configuration also with an eavesdropper in channel
+        output (str): path of the report, None for standard output
+    """
+    report = run_benchmark(pairs, sizes, batches, noises, (False, True) if eve else (False,), exchanges, seed)
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def manage_args():
+    """Manages possible arguments and provides help messages"""
+
+    parser = argparse.ArgumentParser(description='Benchmark of key exchanges for Quantumacy')
+    parser.add_argument('-p', '--pairs', default=4, type=int,
+                        help='Number of alice-bob pairs running at the same time (default: %(default)s)')
+    parser.add_argument('-x', '--exchanges', default=5, type=int,
+                        help='Exchanges of every pair for each configuration (default: %(default)s)')
+    parser.add_argument('-s', '--sizes', default=[256], type=int, nargs='+',
+                        help='Sizes of keys in bits (default: %(default)s)')
+    parser.add_argument('-b', '--batches', default=[1], type=int, nargs='+',
+                        help='Keys obtained from every exchange (default: %(default)s)')
+    parser.add_argument('-n', '--noise', default=[0.0], type=float, nargs='+', dest='noises',
+                        help='Noise values of the channel (default: %(default)s)')
+    parser.add_argument('-e', '--eve', action='store_true',
+                        help='Run every configuration also with an eavesdropper in channel')
+    parser.add_argument('--seed', default=None, type=int, help='Seed of the noise models')
+    parser.add_argument('-o', '--output', default=None, type=str, help='Write the report to this file')
+    return parser
+
+
+if __name__ == '__main__':
+    args = manage_args().parse_args()
+    start_benchmark(args.pairs, args.sizes, args.batches, args.noises, args.eve, args.exchanges, args.seed,
+                    args.output)
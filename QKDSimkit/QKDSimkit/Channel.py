@@ -13,23 +13,30 @@ import logging
 import sys
 
 from QKDSimkit.core import channel
+from QKDSimkit.core.channel_features import NOISE_MODELS
 from QKDSimkit.core.qexceptions import qsocketerror
 from QKDSimkit.core.qexceptions import qnoiseerror
 
 logger = logging.getLogger("QKDSimkit")
 
 
-def start_channel(address: str, noise: float, eve: bool):
+ENGINES = {'threads': channel.public_channel, 'asyncio': channel.async_channel}
+
+
+def start_channel(address: str, noise: float, eve: bool, engine: str = 'threads', models=(), seed: int = None):
     """Starts channel
 
     Args:
         address (str): where to bind the channel
         noise (float): ratio of noise in channel
         eve (bool): simulate an eavesdropper in channel
+        engine (str): 'threads' broadcasts frames with a thread per connection, 'asyncio' routes frames by pair ID
+        models (list): other noise models as 'name:parameter' strings
+        seed (int): seed of the noise models
     """
-    # instantiate a receiver channel
-    theChannel = channel.public_channel(address, noise, eve)
     try:
+        # instantiate a receiver channel
+        theChannel = ENGINES[engine](address, noise, eve, models, seed)
         # initiate the channel and listen for connections
         theChannel.initiate_channel()
     except qsocketerror as qs:
@@ -49,12 +56,18 @@ def manage_args():
     parser.add_argument('-n', '--noise', default=0.0, type=float,
                         help='Set a noise value for channel, type a float number in [0,1] (default: %(default)s)')
     parser.add_argument('-e', '--eve', action='store_true', help='Add an eavesdropper to the channel')
+    parser.add_argument('--engine', default='threads', choices=list(ENGINES),
+                        help='Implementation of the channel (default: %(default)s)')
+    parser.add_argument('-m', '--model', action='append', default=[], dest='models',
+                        help='Add a noise model as name:parameter, one of {0} (e.g. loss:25)'.format(
+                            ', '.join(NOISE_MODELS)))
+    parser.add_argument('--seed', default=None, type=int, help='Seed of the noise models')
     return parser
 
 
 if __name__ == '__main__':
     args = manage_args().parse_args()
     try:
-        start_channel(args.address, args.noise, args.eve)
+        start_channel(args.address, args.noise, args.eve, args.engine, args.models, args.seed)
     except Exception as e:
         logger.error(str(e))
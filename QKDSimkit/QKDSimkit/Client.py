@@ -15,21 +15,28 @@ import sys
 import urllib.parse
 
 import QKDSimkit.core as core
+from QKDSimkit.core.pool import KeyPool
 from QKDSimkit.core.utils import generate_token
-from QKDSimkit.core.qexceptions import boberror
+from QKDSimkit.core.qexceptions import boberror, poolerror
+from QKDSimkit.core.workers import ExchangePool, exchange_ids
 
 logger = logging.getLogger("QKDSimkit")
 
+# key exchanges of every call of get_key share the same limits
+exchanges = ExchangePool()
 
-def get_key(alice_address: str, channel_address: str, password: str, number: int, size: int):
+
+def get_key(alice_address: str, channel_address: str, password: str, number: int, size: int, parallel: int = 1):
     """Runs handshake and starts bob procedure
 
     Args:
         alice_address (str): address of server
         channel_address (str): address of channel
         token (str): pre shared token
-        number (int): number of keys
+        number (int): number of keys, they are split in parallel exchanges and the keys of an exchange are obtained
+            from a single photon pulse
         size (int): size of keys (bits)
+        parallel (int): number of exchanges running at the same time in worker threads
     """
     try:
         token = generate_token(password)
@@ -44,7 +51,8 @@ def get_key(alice_address: str, channel_address: str, password: str, number: int
         proof = core.utils.decrypt(token, data)
         conn.close()
         hash_proof = core.utils.hash_token(proof)
-        params = urllib.parse.urlencode({'number': number, 'size': size, 'hashed': hashed, 'hash_proof': hash_proof})
+        params = urllib.parse.urlencode({'number': number, 'size': size, 'hashed': hashed, 'hash_proof': hash_proof,
+                                         'parallel': parallel})
         conn.close()
         conn1 = http.client.HTTPConnection(f"{alice_address}")
         conn1.request("GET", f"/proof?{params}")
@@ -54,22 +62,30 @@ def get_key(alice_address: str, channel_address: str, password: str, number: int
         sys.exit()
     if r.status == 200:
         try:
-            key_list = []
-            for n in range(number):
-                res = core.bob.import_key(channel_address=channel_address, ID=hashed, size=size)
-                if res == -1:
-                    print("Can't exchange a safe key")
-                if isinstance(res, bytes):
-                    key_list.append(res.decode())
-            return key_list
-        except boberror as e:
+            calls = [{'channel_address': channel_address, 'ID': pair_ID, 'size': size, 'number': count,
+                      'batch_size': count} for pair_ID, count in exchange_ids(hashed, number, parallel)]
+            keys = [key.decode() for keys in exchanges.map(hashed, core.bob.import_keys, calls) for key in keys]
+        except (boberror, RuntimeError) as e:
             logger.error('Bob failed to exchange key: ' + str(e))
             sys.exit()
     else:
         return r.status
+    try:
+        # the keys are returned once the server has stored them too
+        params = urllib.parse.urlencode({'hashed': hashed, 'hash_proof': hash_proof})
+        conn2 = http.client.HTTPConnection(f"{alice_address}", timeout=100*number)
+        conn2.request("GET", f"/stored?{params}")
+        r = conn2.getresponse()
+        conn2.close()
+    except Exception as e:
+        logger.error("Error while connecting to server: " + str(e))
+        sys.exit()
+    if r.status != 200:
+        return r.status
+    return keys
 
 
-def start_client(alice_address, channel_address, number, size, password, show_keys):
+def start_client(alice_address, channel_address, number, size, password, show_keys, parallel=1):
     """Wrapper for get_key()
 
     Args:
@@ -77,8 +93,38 @@ def start_client(alice_address, channel_address, number, size, password, show_ke
         channel_address (str): address of channel
         number (int): number of keys
         size (int): size of keys (bits)
+        parallel (int): number of exchanges running at the same time
     """
-    keys = get_key(alice_address, channel_address, password, number, size)
+    keys = get_key(alice_address, channel_address, password, number, size, parallel)
     if show_keys:
         logger.info(keys)
     return keys
+
+
+def start_pool(alice_address: str, channel_address: str, password: str, size: int = 256, low_watermark: int = 4,
+               high_watermark: int = 16, batch_size: int = 16) -> KeyPool:
+    """Starts a pool of keys refilled in background
+
+    every refill runs the whole handshake with the server, the server appends the same keys to the pool of this user
+    so both sides take keys in the same order
+
+    Args:
+        alice_address (str): address of server
+        channel_address (str): address of channel
+        password (str): pre shared token
+        size (int): size of keys (bits)
+        low_watermark (int): refill starts when the pool holds fewer keys
+        high_watermark (int): the pool is refilled up to this number of keys
+        batch_size (int): maximum number of keys obtained from a single photon pulse
+    Returns:
+        pool (KeyPool): started pool, use get() to take a key and stats() to read its counters
+    """
+    def producer(number: int) -> list:
+        keys = get_key(alice_address, channel_address, password, number, size)
+        if not isinstance(keys, list):
+            raise poolerror("server answered with status " + str(keys))
+        return keys
+
+    pool = KeyPool(producer, low_watermark, high_watermark, batch_size)
+    pool.start()
+    return pool
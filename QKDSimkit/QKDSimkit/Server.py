@@ -19,27 +19,37 @@ import uvicorn
 
 import QKDSimkit.core as core
 
-from aiocache import Cache
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from threading import Thread
 from typing import Optional
 
-from aioredlock import Aioredlock
-
 
 from QKDSimkit.Channel import start_channel
+from QKDSimkit.core.metrics import registry, export_pool, export_token_cache
 from QKDSimkit.core.qexceptions import cacheerror
-from QKDSimkit.core.utils import generate_token
+from QKDSimkit.core.store import LocalStore, RedisStore
+from QKDSimkit.core.workers import ExchangePool, exchange_ids, MAX_EXCHANGES, MAX_USER_EXCHANGES
+from QKDSimkit.core.utils import generate_token, token_cache
 
 logger = logging.getLogger("QKDSimkit")
 
 app = FastAPI()
 
-cache = Cache(Cache.REDIS, endpoint="localhost", port=6379, namespace="QKDSimkit_server")
+REDIS_ADDRESS = 'redis://localhost:6379'
+STORES = ('local', 'redis')
+
+# users, proofs and keys, Redis shares them between processes, select another store with configure_store
+store = RedisStore(REDIS_ADDRESS, namespace="QKDSimkit_server")
 
-redis_lock = Aioredlock([('localhost', 6379)], retry_count=10, retry_delay_max=5, retry_delay_min=1)
+# key exchanges run in worker threads, the event loop only waits for their results
+exchanges = ExchangePool()
+
+# exchanges started by /proof, (hashed, hash_proof) -> task, /stored waits for them until STORED_TIMEOUT seconds after
+# they ended
+pending_keys = {}
+STORED_TIMEOUT = 60
 
 origins = ["*"]
 
@@ -54,29 +64,21 @@ async def add_user(token: str):
     """
     try:
         token = generate_token(token)
-        lock = await redis_lock.lock('users')
-        users = await cache.get('users')
-        if not users:
-            users = {}
         hashed = core.utils.hash_token(token)
-        users[hashed] = token
-        await cache.set('users', users)
-        await redis_lock.unlock(lock)
+        await store.add_user(hashed, token)
     except Exception as e:
         raise cacheerror("Failed to add user in cache: " + str(e))
 
 
-async def cache_set(key: str, value):
+async def cache_set(key: str, value: str):
     '''Save a value in cahce
 
     Args:
          key (str): key
-         value: value
+         value (str): value
     '''
     try:
-        lock = await redis_lock.lock(key)
-        await cache.set(key, value)
-        await redis_lock.unlock(lock)
+        await store.set(key, value)
     except Exception as e:
         logger.error("Failed to set cache: " + str(e))
 
@@ -88,45 +90,68 @@ async def cache_get(key: str):
         key (str): key
     '''
     try:
-        lock = await redis_lock.lock(key)
-        value = await cache.get(key)
-        await redis_lock.unlock(lock)
-        return value
-    except ZeroDivisionError as e:
+        return await store.get(key)
+    except Exception as e:
         logger.error("Failed to get cache: " + str(e))
 
-async def start_alice(number: int, size: int, ID: str):
-    """Imports keys from an alice node, saves keys in memory
+
+def configure_store(kind: str = 'redis', redis_address: str = REDIS_ADDRESS):
+    """Select where users, proofs and keys are kept
 
     Args:
-        number (int): number of keys
+        kind (str): 'redis' shares them between processes, 'local' keeps them in this process
+        redis_address (str): redis address (redis://host:port) of the redis store
+    """
+    global store
+    if kind == 'redis':
+        store = RedisStore(redis_address, namespace="QKDSimkit_server")
+    elif kind == 'local':
+        store = LocalStore()
+    else:
+        raise cacheerror("unknown store " + str(kind))
+
+
+def configure_exchanges(max_exchanges: int = MAX_EXCHANGES, max_user_exchanges: int = MAX_USER_EXCHANGES):
+    """Set the limits of key exchanges in flight
+
+    Args:
+        max_exchanges (int): maximum number of exchanges running at the same time
+        max_user_exchanges (int): maximum number of exchanges of a single user running at the same time
+    """
+    global exchanges
+    exchanges.shutdown()
+    exchanges = ExchangePool(max_exchanges, max_user_exchanges)
+
+
+async def start_alice(number: int, size: int, ID: str, parallel: int = 1):
+    """Imports keys from alice nodes running in worker threads, appends keys to the key pool of the user
+
+    Args:
+        number (int): number of keys, they are split in parallel exchanges and the keys of an exchange are obtained
+            from a single photon pulse
         size (int): size of keys (bits)
         ID (str): identifier (hash of token)
+        parallel (int): number of exchanges running at the same time, the client must use the same value
     """
     try:
         address = await cache_get('address')
-        logger.error(address)
         if not address:
             raise Exception
     except Exception:
         logger.error("Failed to retrieve address from cache")
         sys.exit()
-    key_list = []
     try:
-        for i in range(number):
-            res = core.alice.import_key(channel_address=address, ID=ID, size=size)
-            if res == -1:
-                print("Can't exchange a safe key")
-            if isinstance(res, bytes):
-                key_list.append(res.decode())
+        start = time.monotonic()
+        results = await asyncio.gather(*(
+            exchanges.run(ID, core.alice.import_keys, channel_address=address, ID=pair_ID, size=size, number=count,
+                          batch_size=count)
+            for pair_ID, count in exchange_ids(ID, number, parallel)))
+        key_list = [key.decode() for keys in results for key in keys]
+        generation_time = time.monotonic() - start
         try:
-            lock_alice = await redis_lock.lock('alice')
-            id_keys_map = await cache_get('id_keys')
-            if not id_keys_map:
-                id_keys_map = {}
-            id_keys_map[ID] = key_list
-            await cache_set('id_keys', id_keys_map)
-            await redis_lock.lock(lock_alice)
+            # keys are consumed in the same order they are generated by the client
+            await store.push_keys(ID, key_list)
+            await store.incr_stats(ID, generated=len(key_list), generation_time=generation_time)
         except Exception:
             logger.error("Failed to update key map in cache")
             sys.exit()
@@ -146,95 +171,173 @@ async def root(hashed: str):
         message (str): test message for handshake
     """
     try:
-        # loop = asyncio.get_running_loop()
-        # users = cache_get('users', loop)
-        users = await cache_get('users')
+        token = await store.get_user(hashed)
 
-        if hashed not in users.keys():
+        if token is None:
             return Response(status_code=404, content='Provided ID does not match any user')
         r = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(512))
-        #lock_aut = loop.run_until_complete(redis_lock.lock("auth"))
-        lock_aut = await redis_lock.lock("auth")
-        map_hash_r = await cache_get('proof')
-        if not map_hash_r:
-            map_hash_r = {}
-        map_hash_r[hashed] = core.utils.hash_token(r)
-        await cache_set('proof', map_hash_r)
-        #loop.run_until_complete(redis_lock.unlock(lock_aut))
-        await redis_lock.unlock(lock_aut)
-        response = core.utils.encrypt(users[hashed], r)
+        await store.set_proof(hashed, core.utils.hash_token(r))
+        response = core.utils.encrypt(token, r)
         return response
     except ZeroDivisionError as e:
         logger.error("Error while validating request " + str(e))
 
 
 @app.get("/proof")
-async def root(number: int, size: int, hashed: str, hash_proof: str, background_tasks: BackgroundTasks):
-    """Checks handshake and starts alice
+async def root(number: int, size: int, hashed: str, hash_proof: str, parallel: int = 1):
+    """Checks handshake and starts alice, the client waits with /stored until the keys are in the pool of the user
 
     Args:
         number (int): number of keys
         size (int): size of keys (bits)
         hashed (str): identifier (hash of token)
         hash_proof (str): hash of proof message
-        background_tasks: background tasks
+        parallel (int): number of exchanges running at the same time
     """
     try:
-        users = await cache_get('users')
-        map_hash_r = await cache_get('proof')
+        token = await store.get_user(hashed)
+        expected_proof = await store.get_proof(hashed)
     except Exception as e:
         logger.error("Failed to retrieve data from cache: " + str(e))
         return Response(status_code=500, content='Internal server error')
-    if hashed in users.keys() and hash_proof == map_hash_r[hashed]:
-        background_tasks.add_task(start_alice, number, size, hashed)
+    if token is not None and hash_proof == expected_proof:
+        ticket = (hashed, hash_proof)
+        pending_keys[ticket] = asyncio.ensure_future(start_alice(number, size, hashed, parallel))
+        pending_keys[ticket].add_done_callback(
+            lambda task: asyncio.get_running_loop().call_later(STORED_TIMEOUT, forget_pending, ticket, task))
         return "Verified!"
     return Response(status_code=404, content='Provided ID does not match any user')
 
 
+def forget_pending(ticket: tuple, task):
+    """Remove an exchange that nobody waited for"""
+    if pending_keys.get(ticket) is task:
+        del pending_keys[ticket]
+
+
+@app.get("/stored")
+async def stored(hashed: str, hash_proof: str):
+    """Waits until the keys of an exchange started by /proof are in the pool of the user
+
+    the client takes its keys only after this request succeeds, so the server has the same keys when they are used
+
+    Args:
+        hashed (str): identifier (hash of token)
+        hash_proof (str): hash of proof message sent to /proof
+    """
+    task = pending_keys.pop((hashed, hash_proof), None)
+    if task is None:
+        return Response(status_code=404, content='No exchange for the given proof')
+    try:
+        await task
+    except Exception as e:
+        logger.error("Failed to store keys: " + str(e))
+        return Response(status_code=500, content='Keys were not stored')
+    return "Stored!"
+
+
 @app.get("/get_key")
-async def getkey(password: Optional[str] = None):
-    """Retrieves keys from server
+async def getkey(password: Optional[str] = None, number: int = 1, hashed: Optional[str] = None):
+    """Retrieves keys from server, keys are removed from the pool of the user in the order they were generated
 
     Args:
-        password (str): hashed token
+        password (str): pre-shared token, its derivation is cached
+        number (int): number of keys to take from the pool
+        hashed (str): identifier (hash of token), it is looked up in the users table without any derivation
+    Returns:
+        the whole key map if neither password nor hashed are given, otherwise a list of keys
     """
+    if number < 1:
+        return Response(status_code=400, content='number must be at least 1')
     try:
-        id_keys_map = await cache_get('id_keys')
+        if hashed is not None:
+            if await store.get_user(hashed) is None:
+                return Response(status_code=404, content='Provided ID does not match any user')
+            ID = hashed
+        elif password is None:
+            return await store.all_keys()
+        else:
+            ID = core.utils.hash_token(generate_token(password))
+        keys = await store.pop_keys(ID, number)
+        if keys is None:
+            await store.incr_stats(ID, misses=1)
+            return Response(status_code=404, content="No keys for the given ID")
+        await store.incr_stats(ID, hits=1)
+        return keys
     except Exception as e:
         logger.error("Failed to retrieve key map from cache: " + str(e))
         return Response(status_code=404, content="No keys available")
-    if password is None:
-        return id_keys_map
-    else:
-        ID = core.utils.hash_token(generate_token(password))
 
-        if ID not in id_keys_map.keys():
-            return Response(status_code=404, content="No keys for the given ID")
-        else:
-            return id_keys_map[ID]
+
+@app.get("/pool")
+async def pool():
+    """Key pool counters of every user
+
+    Returns:
+        for each user: depth, hits, misses, generated keys and refill rate (keys per second)
+    """
+    answer = {}
+    for ID, stats in (await store.all_stats()).items():
+        answer[ID] = {
+            'depth': await store.depth(ID),
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'generated': stats['generated'],
+            'refill_rate': stats['generated'] / stats['generation_time'] if stats['generation_time'] else 0.0,
+        }
+    return answer
+
+
+@app.get("/metrics")
+async def metrics():
+    """Metrics of the key exchanges, of the exchange pool and of the token cache
+
+    Returns:
+        metrics in the Prometheus text format
+    """
+    export_pool(exchanges)
+    export_token_cache(token_cache)
+    return Response(content=registry.render(), media_type='text/plain; version=0.0.4')
 
 
 @app.middleware("http")
 async def filter_get_key(request: Request, call_next):
-    if request.client.host != '127.0.0.1' and (request.url.path == '/get_key'):
+    if request.client.host != '127.0.0.1' and (request.url.path in ('/get_key', '/pool')):
         response = Response(status_code=403, content='Forbidden')
     else:
         response = await call_next(request)
     return response
 
 
+def run_sync(coroutine):
+    """Runs a coroutine in a new event loop and closes the store connections opened in it
+
+    Args:
+        coroutine: coroutine using the store
+    Returns:
+        result of the coroutine
+    """
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await store.close()
+    return asyncio.run(run())
+
+
 def get_key_cli(id):
     """ Synchronous wrapper for get_key
 
     Returns:
           keys: list of keys for the given ID
     """
-    keys = asyncio.run(getkey(id))
+    keys = run_sync(getkey(id))
     logger.info(keys)
     return keys
 
 
-def start_server_and_channel(channel_address: str, noise: float, eve: bool, address: str):
+def start_server_and_channel(channel_address: str, noise: float, eve: bool, address: str,
+                             max_exchanges: int = MAX_EXCHANGES, max_user_exchanges: int = MAX_USER_EXCHANGES):
     """Starts both server and channel
 
     Returns:
@@ -242,13 +345,16 @@ def start_server_and_channel(channel_address: str, noise: float, eve: bool, addr
         noise (float): ratio of noise in channel
         eve (bool): simulate an eavesdropper in channel
         address (str): where to bind this server
+        max_exchanges (int): maximum number of key exchanges running at the same time
+        max_user_exchanges (int): maximum number of key exchanges of a single user running at the same time
     """
+    configure_exchanges(max_exchanges, max_user_exchanges)
     try:
         # loop = asyncio.new_event_loop()
         # add_user('token', loop)
         # cache_set('address', channel_address, loop)
-        asyncio.run(add_user('token'))
-        asyncio.run(cache_set('address', channel_address))
+        run_sync(add_user('token'))
+        run_sync(cache_set('address', channel_address))
     except cacheerror as ce:
         logger.error(str(ce))
         sys.exit()
@@ -264,16 +370,20 @@ def start_server_and_channel(channel_address: str, noise: float, eve: bool, addr
             sys.exit()
 
 
-def start_server(channel_address, address):
+def start_server(channel_address, address, max_exchanges: int = MAX_EXCHANGES,
+                 max_user_exchanges: int = MAX_USER_EXCHANGES):
     """Starts server and connect to an external channel
 
     Args:
         channel_address (str): address of channel
         address (str): where to bind this server
+        max_exchanges (int): maximum number of key exchanges running at the same time
+        max_user_exchanges (int): maximum number of key exchanges of a single user running at the same time
     """
+    configure_exchanges(max_exchanges, max_user_exchanges)
     try:
-        asyncio.run(add_user('token'))
-        asyncio.run(cache_set('address', channel_address))
+        run_sync(add_user('token'))
+        run_sync(cache_set('address', channel_address))
     except cacheerror as ce:
         logger.error(str(ce))
         sys.exit()
@@ -5,38 +5,47 @@
 #
 # (C) Copyright 2021 CERN.
 
+LOG_LEVEL = 'INFO'
 
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': True,
-    'formatters': {
-        'standard': {
-            'format': '%(asctime)s [%(levelname)s] %(name)s - %(module)s:%(lineno)d : %(message)s'
-        },
-    },
-    'handlers': {
-        'default': {
-            'level': 'DEBUG',
-            'formatter': 'standard',
-            'class': 'logging.StreamHandler',
-            'stream': 'ext://sys.stdout',  # Default is stderr
-        },
-    },
-    'loggers': {
-        '': {  # root logger
-            'handlers': ['default'],
-            'level': 'DEBUG',
-            'propagate': False
+
+def logging_config(level: str = LOG_LEVEL, sample: int = 1) -> dict:
+    """Configuration of the loggers of QKDSimkit, the root logger is left to the application
+
+    Args:
+        level (str): level of the QKDSimkit loggers, frame records are emitted at DEBUG level
+        sample (int): keep one frame record out of every sample
+    Returns:
+        dictionary for logging.config.dictConfig
+    """
+    logger = {'handlers': ['default'], 'level': level, 'propagate': False}
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'standard': {
+                'format': '%(asctime)s [%(levelname)s] %(name)s - %(module)s:%(lineno)d : %(message)s'
+            },
         },
-        'QKDSimkit': {
-            'handlers': ['default'],
-            'level': 'DEBUG',
-            'propagate': False
+        'filters': {
+            'frames': {
+                '()': 'QKDSimkit.core.logs.FrameSampler',
+                'rate': sample,
+            },
         },
-        '__main__': {  # if __name__ == '__main__'
-            'handlers': ['default'],
-            'level': 'DEBUG',
-            'propagate': False
+        'handlers': {
+            'default': {
+                'level': level,
+                'formatter': 'standard',
+                'filters': ['frames'],
+                'class': 'logging.StreamHandler',  # stderr, stdout is left to the output of the programs
+            },
         },
+        'loggers': {
+            'QKDSimkit': dict(logger),
+            'QKDSimkit_logger': dict(logger),  # core modules
+            '__main__': dict(logger),  # if __name__ == '__main__'
+        }
     }
-}
\ No newline at end of file
+
+
+LOGGING = logging_config()
@@ -9,22 +9,29 @@
 """This module contains the command line interface"""
 
 import argparse
-import asyncio
 import logging.config
-from QKDSimkit import LOGGING
 
-logging.config.dictConfig(LOGGING)
-
-from QKDSimkit.Channel import start_channel
+from QKDSimkit import LOG_LEVEL, logging_config
+from QKDSimkit.Benchmark import start_benchmark
+from QKDSimkit.Channel import ENGINES, start_channel
 from QKDSimkit.Client import start_client
 from QKDSimkit.p2p_servers import start_p2p
-from QKDSimkit.Server import start_server, start_server_and_channel, get_key_cli, add_user
+from QKDSimkit.Server import start_server, start_server_and_channel, get_key_cli, add_user, run_sync
+from QKDSimkit.Server import configure_store, REDIS_ADDRESS, STORES
+from QKDSimkit.core import logs
+from QKDSimkit.core.workers import MAX_EXCHANGES, MAX_USER_EXCHANGES
 
 
 def cli():
     """Command line interface
     single entry point for server, client, channel and peer to peer node"""
     parser = argparse.ArgumentParser(description='QKDSimkit interface: choose one of the following programs')
+    parser.add_argument('--log_level', default=LOG_LEVEL, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Level of the logs, frames are logged at DEBUG level (default: %(default)s)')
+    parser.add_argument('--log_sample', default=1, type=int,
+                        help='Log one frame out of every LOG_SAMPLE (default: %(default)s)')
+    parser.add_argument('--dump_payloads', action='store_true',
+                        help='Add the payload of every frame to the logs in hex, it implies DEBUG level')
     interfaces = parser.add_subparsers(dest='program')
 
     #   SERVER PARSER
@@ -33,6 +40,15 @@ def cli():
     server = interfaces.add_parser(name='server', description='Server for QKDSimkit')
     server.add_argument('-a', '--address', default='127.0.0.1:5002', type=str,
                         help='Bind socket to this address (default: %(default)s)')
+    server.add_argument('--max_exchanges', default=MAX_EXCHANGES, type=int,
+                        help='Maximum number of key exchanges running at the same time (default: %(default)s)')
+    server.add_argument('--max_user_exchanges', default=MAX_USER_EXCHANGES, type=int,
+                        help='Maximum number of key exchanges of a user running at the same time (default: %(default)s)')
+    server.add_argument('--store', default='redis', choices=STORES,
+                        help='Where users and keys are kept, local keeps them in the server process '
+                             '(default: %(default)s)')
+    server.add_argument('--redis', default=REDIS_ADDRESS, type=str,
+                        help='Address of the redis store (default: %(default)s)')
     channels = server.add_subparsers(title='Action', dest='action',
                                      help='Choose a possible action')
     parser_k = channels.add_parser('retrieve', help="Retrieve keys")
@@ -58,6 +74,8 @@ def cli():
     client.add_argument('channel_address', type=str, help='Address of channel [host:port]')
     client.add_argument('-n', '--number', default=1, type=int, help="Number of keys (default: %(default)s)")
     client.add_argument('-s', '--size', default=256, type=int, help="Size of keys (default: %(default)s)")
+    client.add_argument('-p', '--parallel', default=1, type=int,
+                        help="Number of key exchanges running at the same time (default: %(default)s)")
     client.add_argument('-t', '--token', default='token', help='Specify token')
     client.add_argument('-k', '--show_keys', default=False, type=bool, help='Show keys in output')
 
@@ -70,6 +88,12 @@ def cli():
     channel.add_argument('-n', '--noise', default=0.0, type=float,
                          help='Set a noise value for channel, type a float number in [0,1] (default: %(default)s)')
     channel.add_argument('-e', '--eve', action='store_true', help='Add an eavesdropper to the channel')
+    channel.add_argument('--engine', default='threads', choices=sorted(ENGINES),
+                         help='Implementation of the channel, asyncio routes frames by pair ID (default: %(default)s)')
+    channel.add_argument('-m', '--model', action='append', default=[], dest='models',
+                         help='Add a noise model as name:parameter, one of depolarizing, bitflip, loss (distance in km) '
+                              'or intercept_resend (e.g. loss:25)')
+    channel.add_argument('--seed', default=None, type=int, help='Seed of the noise models')
 
     #   PEER TO PEER PARSER
     #   ===================
@@ -82,23 +106,51 @@ def cli():
     p2p.add_argument('-a', '--address', default='127.0.0.1:5003', type=str,
                      help='Bind socket to this address (default: %(default)s)')
 
+    #   BENCHMARK PARSER
+    #   ================
+
+    benchmark = interfaces.add_parser(name='benchmark', description='Benchmark of key exchanges on a local channel')
+    benchmark.add_argument('-p', '--pairs', default=4, type=int,
+                           help='Number of alice-bob pairs running at the same time (default: %(default)s)')
+    benchmark.add_argument('-x', '--exchanges', default=5, type=int,
+                           help='Exchanges of every pair for each configuration (default: %(default)s)')
+    benchmark.add_argument('-s', '--sizes', default=[256], type=int, nargs='+',
+                           help='Sizes of keys in bits (default: %(default)s)')
+    benchmark.add_argument('-b', '--batches', default=[1], type=int, nargs='+',
+                           help='Keys obtained from every exchange (default: %(default)s)')
+    benchmark.add_argument('-n', '--noise', default=[0.0], type=float, nargs='+', dest='noises',
+                           help='Noise values of the channel (default: %(default)s)')
+    benchmark.add_argument('-e', '--eve', action='store_true',
+                           help='Run every configuration also with an eavesdropper in channel')
+    benchmark.add_argument('--seed', default=None, type=int, help='Seed of the noise models')
+    benchmark.add_argument('-o', '--output', default=None, type=str, help='Write the JSON report to this file')
+
     args = parser.parse_args()
 
+    logging.config.dictConfig(logging_config('DEBUG' if args.dump_payloads else args.log_level, args.log_sample))
+    logs.dump_payloads(args.dump_payloads)
+
     if args.program == 'server':
+        configure_store(args.store, args.redis)
         if args.action == 'retrieve':
             get_key_cli(args.identifier)
         if args.action == 'add_user':
-            asyncio.run(add_user(args.token))
+            run_sync(add_user(args.token))
         if args.action == 'local':
-            start_server_and_channel(args.channel_address, args.noise, args.eve, args.address)
+            start_server_and_channel(args.channel_address, args.noise, args.eve, args.address, args.max_exchanges,
+                                     args.max_user_exchanges)
         if args.action == 'external':
-            start_server(args.channel_address, args.address)
+            start_server(args.channel_address, args.address, args.max_exchanges, args.max_user_exchanges)
     elif args.program == 'client':
-        start_client(args.alice_address, args.channel_address, args.number, args.size, args.token, args.show_keys)
+        start_client(args.alice_address, args.channel_address, args.number, args.size, args.token, args.show_keys,
+                     args.parallel)
     elif args.program == 'channel':
-        start_channel(args.address, args.noise, args.eve)
+        start_channel(args.address, args.noise, args.eve, args.engine, args.models, args.seed)
     elif args.program == 'p2p':
         start_p2p(args.node, args.address, args.channel_address)
+    elif args.program == 'benchmark':
+        start_benchmark(args.pairs, args.sizes, args.batches, args.noises, args.eve, args.exchanges, args.seed,
+                        args.output)
     else:
         parser.print_help()
 
@@ -11,4 +11,5 @@ from .channel import *
 from .node import Node
 from .receiver import Receiver
 from .sender import Sender
+from .session import Session
 from .utils import *
@@ -12,8 +12,14 @@ import sys
 
 from base64 import urlsafe_b64encode
 
+import numpy as np
+
+from QKDSimkit.core import frames
+from QKDSimkit.core.metrics import registry
+from QKDSimkit.core.node import PULSE_FACTOR, MAX_PULSE_FACTOR
 from QKDSimkit.core.qexceptions import qsocketerror, aliceerror
 from QKDSimkit.core.sender import Sender
+from QKDSimkit.core.session import Session
 
 logger = logging.getLogger("QKDSimkit_logger")
 
@@ -26,29 +32,69 @@ def import_key(channel_address: str, ID: str, size: int = 256):
         ID (str): identifier of alice-bob pair
         size (int): size of key in bits
     """
-    channelIP, channelPort = channel_address.split(':')
-    channelPort = int(channelPort)
+    return import_keys(channel_address, ID, size, 1)[0]
+
+
+def import_keys(channel_address: str, ID: str, size: int = 256, number: int = 1, batch_size: int = 1,
+                timeout: float = None) -> list:
+    """Alice's procedure to agree on many shared keys over a single connection to the channel
+
+    Args:
+        channel_address (str): channel address
+        ID (str): identifier of alice-bob pair
+        size (int): size of keys in bits
+        number (int): number of keys
+        batch_size (int): number of keys obtained from a single photon pulse, the other node must use the same value
+        timeout (float): seconds available for all the exchanges, every exchange is also bounded by the exchange
+            timeout of the node
+    Returns:
+        list of keys
+    """
+    session = Session(Sender(ID, size), channel_address, timeout)
+    try:
+        # connect to channel
+        session.connect()
+    except qsocketerror as err:
+        raise aliceerror("Connection error while connecting to the channel (" + str(err) + "). Disconnecting.")
+    try:
+        keys = []
+        while len(keys) < number:
+            keys += exchange_keys(session, size, min(batch_size, number - len(keys)))
+        return keys
+    finally:
+        session.close()
 
+
+def exchange_keys(session: Session, size: int = 256, number: int = 1) -> list:
+    """Alice's procedure to agree on a batch of shared keys over an already connected session
+
+    a single photon pulse is exchanged, the error rate is estimated on a sample of the sifted key, the errors are
+    corrected with Cascade, the key is compressed with privacy amplification and then sliced in keys, if the final key
+    is too short the next photon pulse is longer
+
+    Args:
+        session (Session): session connected to the channel
+        size (int): size of keys in bits
+        number (int): number of keys in the batch
+    Returns:
+        list of keys
+    """
+    factor = PULSE_FACTOR
     for count in range(0, 1000):
-        alice = Sender(ID, size)
+        alice = session.next_exchange()
+        alice.photon_pulse_size = size * number * factor
+        clock = registry.stopwatch(node='alice')
         try:
-            # connect to quantum channel
-            alice.connect_to_channel(channelIP, channelPort)
             # create and send a photon pulse through the quantum channel
             photon_pulse = alice.create_photon_pulse()
+            clock.lap('pulse_creation')
             alice.send_photon_pulse(photon_pulse)
+            clock.lap('quantum_send')
         except qsocketerror as err:
             raise aliceerror("Connection error while connecting to the quantum channel (" + str(err) + "). Disconnecting.")
         except Exception as e:
             raise aliceerror('Generic error during qunatum photon exchange: ' + str(e))
 
-        # connect to classic channel
-        try:
-            alice.reset_socket()
-            alice.connect_to_channel(channelIP, channelPort)
-        except qsocketerror as err:
-            raise aliceerror("Connection error while connecting to the classic channel (" + str(err) + "). Disconnecting.")
-
         # exchange basis
         try:
             # listen for Bob's basis
@@ -56,26 +102,35 @@ def import_key(channel_address: str, ID: str, size: int = 256):
             # generate the reconciled key from Bob's basis
             alice.generate_reconciled_key()
             # create and send the basis through the classic channel
-            alice.send('alice-reconciled_key', repr(alice.reconciled_key))
+            alice.send('alice-reconciled_key', frames.encode_bits(alice.reconciled_key))
         except qsocketerror as err:
             raise aliceerror("Connection error while exchanging bases (" + str(err) + "). Disconnecting.")
         except Exception as err:
             raise aliceerror("Generic error while exchanging bases: " + str(err))
 
-        # create key and public sub key
+        clock.lap('basis_exchange')
+
+        # create the raw key and the public sample
         alice.create_keys()
+        clock.lap('sifting')
 
         # exchange sub key
         try:
             # send the public sub key
-            alice.send('alice-other_sub_key', repr(alice.sub_shared_key))
+            alice.send('alice-other_sub_key', frames.encode_bits(alice.sub_shared_key))
             # listen for Bob's public sub key
             alice.listen_for('bob', 'other_sub_key')
 
             alice.decision = alice.validate()
+            clock.lap('validation')
+            if alice.decision == 1:
+                # correct the errors and send the digest of the key
+                alice.reconcile()
+                alice.decision = alice.verify()
+                clock.lap('reconciliation')
 
             # send decision
-            alice.send('alice-other_decision', repr(alice.decision))
+            alice.send('alice-other_decision', frames.encode_decision(alice.decision))
             # listen for Alice's sub key
             alice.listen_for('bob', 'other_decision')
         except qsocketerror as err:
@@ -83,23 +138,33 @@ def import_key(channel_address: str, ID: str, size: int = 256):
         except Exception as err:
             raise aliceerror("Generic error while comparing sub_keys (" + str(err) + "). Disconnecting.")
 
-
-        alice.reset_socket()
+        clock.lap('decision')
 
         # choose what to do
         if alice.decision == alice.other_decision and alice.decision == 1:
             # return a correct key
             alice.get_key()
+            clock.lap('privacy_amplification')
+            if len(alice.key) < size * number:
+                registry.inc('exchanges_total', node='alice', result='short')
+                # both nodes have the same number of bits, they will both retry with a longer pulse
+                logger.warning("Not enough bits for the batch, trying again")
+                factor = min(factor * 2, MAX_PULSE_FACTOR)
+                continue
             logger.info("Success!")
-            alice.key = alice.key[:size]
-            alice.key = [int("".join(map(str, alice.key[i:i + 8])), 2) for i in range(0, len(alice.key), 8)]
-            return urlsafe_b64encode(bytearray(alice.key))
-        elif alice.decision == alice.other_decision and alice.decision == 0:
-            # retry
+            registry.inc('exchanges_total', node='alice', result='success')
+            registry.inc('keys_total', number, node='alice')
+            registry.observe('attempts', count + 1, node='alice')
+            batch = alice.key[:size * number].reshape(number, size)
+            return [urlsafe_b64encode(np.packbits(key).tobytes()) for key in batch]
+        elif -1 not in (alice.decision, alice.other_decision):
+            # reconciliation failed, retry
+            registry.inc('exchanges_total', node='alice', result='mismatch')
             logger.warning("Failed to match key, trying again")
             continue
         else:
             # exit
+            registry.inc('exchanges_total', node='alice', result='abort')
             raise aliceerror("Failed! Noise or eavesdropper detected")
     raise aliceerror("Error: too many attempts to find a shared key")
 
@@ -12,8 +12,14 @@ import logging
 
 from base64 import urlsafe_b64encode
 
+import numpy as np
+
+from QKDSimkit.core import frames
+from QKDSimkit.core.metrics import registry
+from QKDSimkit.core.node import PULSE_FACTOR, MAX_PULSE_FACTOR
 from QKDSimkit.core.receiver import Receiver
 from QKDSimkit.core.qexceptions import qsocketerror, boberror
+from QKDSimkit.core.session import Session
 
 logger = logging.getLogger("QKDSimkit_logger")
 
@@ -26,36 +32,74 @@ def import_key(channel_address: str, ID: str, size: int = 256):
         ID (str): identifier of alice-bob pair
         size (int): size of key in bits
     """
-    channelIP, channelPort = channel_address.split(':')
-    channelPort = int(channelPort)
+    return import_keys(channel_address, ID, size, 1)[0]
+
+
+def import_keys(channel_address: str, ID: str, size: int = 256, number: int = 1, batch_size: int = 1,
+                timeout: float = None) -> list:
+    """Bob's procedure to agree on many shared keys over a single connection to the channel
+
+    Args:
+        channel_address (str): channel address
+        ID (str): identifier of alice-bob pair
+        size (int): size of keys in bits
+        number (int): number of keys
+        batch_size (int): number of keys obtained from a single photon pulse, the other node must use the same value
+        timeout (float): seconds available for all the exchanges, every exchange is also bounded by the exchange
+            timeout of the node
+    Returns:
+        list of keys
+    """
+    session = Session(Receiver(ID, size), channel_address, timeout)
+    try:
+        # connect to channel
+        session.connect()
+    except qsocketerror as err:
+        raise boberror("Connection error while connecting to the channel (" + str(err) + "). Disconnecting.")
+    try:
+        keys = []
+        while len(keys) < number:
+            keys += exchange_keys(session, size, min(batch_size, number - len(keys)))
+        return keys
+    finally:
+        session.close()
 
+
+def exchange_keys(session: Session, size: int = 256, number: int = 1) -> list:
+    """Bob's procedure to agree on a batch of shared keys over an already connected session
+
+    a single photon pulse is exchanged, the error rate is estimated on a sample of the sifted key, the errors are
+    corrected with Cascade, the key is compressed with privacy amplification and then sliced in keys, if the final key
+    is too short the next photon pulse is longer
+
+    Args:
+        session (Session): session connected to the channel
+        size (int): size of keys in bits
+        number (int): number of keys in the batch
+    Returns:
+        list of keys
+    """
+    factor = PULSE_FACTOR
     for count in range(0, 1000):
-        bob = Receiver(ID, size)
+        bob = session.next_exchange()
+        bob.photon_pulse_size = size * number * factor
+        clock = registry.stopwatch(node='bob')
 
         try:
-            # connect to channel
-            bob.connect_to_channel(channelIP, channelPort)
             # listen for a photon pulse on the quantum channel (this calls is blocking)
             bob.listen_quantum()
+            clock.lap('quantum_receive')
             bob.measure_photon_pulse()
+            clock.lap('measurement')
         except qsocketerror as err:
             raise boberror("Connection error while connecting to the quantum channel (" + str(err) + "). Disconnecting.")
         except Exception as e:
             raise boberror('Generic error during qunatum photon exchange: ' + str(e))
 
-# now connect to classic channel
-        try:
-            # connect to channel
-            bob.reset_socket()
-            bob.connect_to_channel(channelIP, channelPort)
-        except qsocketerror as err:
-            raise boberror(
-                "Connection error while connecting to the classic channel (" + str(err) + "). Disconnecting.")
-
         # exchange basis
         try:
             # send Bob's chosen basis
-            bob.send('bob-other_bases', repr(bob.bases))
+            bob.send('bob-other_bases', frames.encode_bits(bob.bases))
             # listen for Alice's reconciled key through classic channel
             bob.listen_for('alice', 'reconciled_key')
         except qsocketerror as err:
@@ -63,8 +107,11 @@ def import_key(channel_address: str, ID: str, size: int = 256):
         except Exception as err:
             raise boberror("Generic error while exchanging bases: " + str(err))
 
-        # create key and public sub key
+        clock.lap('basis_exchange')
+
+        # create the raw key and the public sample
         bob.create_keys()
+        clock.lap('sifting')
 
         # exchange sub key
         try:
@@ -72,37 +119,54 @@ def import_key(channel_address: str, ID: str, size: int = 256):
             bob.listen_for('alice', 'other_sub_key')
 
             # send the public sub key
-            bob.send('bob-other_sub_key', repr(bob.sub_shared_key))
+            bob.send('bob-other_sub_key', frames.encode_bits(bob.sub_shared_key))
 
             bob.decision = bob.validate()
+            clock.lap('validation')
+            if bob.decision == 1:
+                # correct the errors and compare the digests of the keys
+                bob.reconcile()
+                bob.decision = bob.verify()
+                clock.lap('reconciliation')
 
             # listen for Alice's sub key
             bob.listen_for('alice', 'other_decision')
 
             # send decision
-            bob.send('bob-other_decision', repr(bob.decision))
+            bob.send('bob-other_decision', frames.encode_decision(bob.decision))
 
         except qsocketerror as err:
             raise boberror("Connection error while comparing sub_keys (" + str(err) + "). Disconnecting.")
         except Exception as err:
             raise boberror("Generic error while comparing sub_keys (" + str(err) + "). Disconnecting.")
 
-        bob.reset_socket()
+        clock.lap('decision')
 
         # choose what to do
         if bob.decision == bob.other_decision and bob.decision == 1:
             # return a correct key
             bob.get_key()
+            clock.lap('privacy_amplification')
+            if len(bob.key) < size * number:
+                registry.inc('exchanges_total', node='bob', result='short')
+                # both nodes have the same number of bits, they will both retry with a longer pulse
+                logger.warning("Not enough bits for the batch, trying again")
+                factor = min(factor * 2, MAX_PULSE_FACTOR)
+                continue
             logger.info("Success!")
-            bob.key = bob.key[:size]
-            bob.key = [int("".join(map(str, bob.key[i:i + 8])), 2) for i in range(0, len(bob.key), 8)]
-            return urlsafe_b64encode(bytearray(bob.key))
-        elif bob.decision == bob.other_decision and bob.decision == 0:
-            # retry
+            registry.inc('exchanges_total', node='bob', result='success')
+            registry.inc('keys_total', number, node='bob')
+            registry.observe('attempts', count + 1, node='bob')
+            batch = bob.key[:size * number].reshape(number, size)
+            return [urlsafe_b64encode(np.packbits(key).tobytes()) for key in batch]
+        elif -1 not in (bob.decision, bob.other_decision):
+            # reconciliation failed, retry
+            registry.inc('exchanges_total', node='bob', result='mismatch')
             logger.info("Failed to match key, trying again")
             continue
         else:
             # exit
+            registry.inc('exchanges_total', node='bob', result='abort')
             raise boberror("Failed! Noise or eavesdropper detected")
     raise boberror("Error: too many attempts to find a shared key")
 
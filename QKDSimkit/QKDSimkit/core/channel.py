@@ -7,23 +7,41 @@
 
 """This module simulates channel's operations"""
 
+import asyncio
 import socket
 import logging
 
 from threading import Thread
 
-from .channel_features import eavesdropper, random_errors
+from . import frames
+from .channel_features import apply_models, build_models
 from .qexceptions import qsocketerror
 
 logger = logging.getLogger("QKDSimkit_logger")
 
 
+def apply_features(frame: frames.Frame, models: list) -> frames.Frame:
+    """Simulate noise and eavesdropper on photon pulses, other frames are returned unchanged
+
+    Args:
+        frame (Frame): received frame
+        models (list): noise models applied in order
+    Returns:
+        frame to be forwarded
+    """
+    if models and frame.label == 'qpulse' and frame.kind == frames.DATA:
+        polarizations = apply_models(frames.decode_polarizations(frame.payload), models)
+        frame = frame._replace(payload=frames.encode_polarizations(polarizations))
+    return frame
+
+
 class public_channel(object):  # insecure public classical/quantum channel
-    def __init__(self, address: str, noise: float, eve: bool):
+    def __init__(self, address: str, noise: float, eve: bool, models=(), seed: int = None):
         self.host = address.split(':')[0]
         self.port = address.split(':')[1]
         self.noise = noise
         self.eve = eve
+        self.models = build_models(noise, eve, models, seed)
         self.buffer_size = 8192
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # reusable socket
@@ -45,12 +63,12 @@ class public_channel(object):  # insecure public classical/quantum channel
 
         self.socket.listen(1)
 
-        logger.info("initiated the channel on {0}:{1}, waiting for clients...".format(self.host, self.port))
+        logger.info("initiated the channel on %s:%s, waiting for clients...", self.host, self.port)
 
         while True:
             conn, addr = self.socket.accept()  # initiate new serving thread for every new connection:
             if conn not in self.conn_list:
-                logger.info("{0} has connected.".format(addr))
+                logger.info("%s has connected.", addr)
                 self.ip_list.append(addr)
                 self.conn_list.append(conn)
                 _thread = Thread(target=self.initiate_connection, args=(conn, addr))
@@ -60,31 +78,27 @@ class public_channel(object):  # insecure public classical/quantum channel
                 logger.info(self.ip_list)
 
     def initiate_connection(self, conn, addr):
-        """Listen for messages and broadcast them"""
+        """Listen for frames and broadcast them"""
+        reader = frames.FrameReader(conn, self.buffer_size)
         while True:
             try:
-                data = conn.recv(self.buffer_size)
-                message = data.decode()
-                if len(message.split(':')) > 1:
-                    if message.split(':')[1] == 'qpulse' and message.split(':')[2] != 'ack':
-                        if self.eve:
-                            message = eavesdropper(message.split(':', 2))
-                        if self.noise > 0:
-                            message = random_errors(message.split(':', 2), self.noise)
+                frame = reader.read()
+                if frame.label == 'join':
+                    continue
+                frame = apply_features(frame, self.models)
             except ConnectionResetError:
                 break
             except ConnectionAbortedError:
                 break
-
-            if not message:
+            except qsocketerror:
                 break
             else:
-                fwdMessage = "{0}:{1}".format(addr, message)
-                logger.info(fwdMessage)
+                message = frames.pack_frame(frame.ID, frame.label, frame.kind, frame.payload, frame.seq)
+                logger.debug("%s: %s %s (%d bytes)", addr, frame.label, frame.kind, len(message))
                 for clients in self.conn_list:
                     try:
                         if clients.getpeername() != addr:
-                            clients.sendall(fwdMessage.encode())
+                            clients.sendall(message)
                     except OSError:
                         # old connections?
                         logger.warning("Ünknown connection, ignoring...")
@@ -93,4 +107,105 @@ class public_channel(object):  # insecure public classical/quantum channel
         self.conn_list.remove(conn)
         self.ip_list.remove(addr)
 
-        logger.info(str(addr) + " has disconnected")
+        logger.info("%s has disconnected", addr)
+
+
+class async_channel(object):  # insecure public classical/quantum channel served by a single event loop
+    """Asyncio implementation of the channel
+
+    Every connection announces its pair ID with a 'join' frame, frames are forwarded only to the other connections with
+    the same pair ID, so a single process can serve many alice-bob pairs at the same time
+
+    Args:
+        address (str): where to bind the channel
+        noise (float): ratio of noise in channel
+        eve (bool): simulate an eavesdropper in channel
+        models (list): other noise models as 'name:parameter' strings
+        seed (int): seed of the noise models
+
+    Attributes:
+        frames_received (int): frames received from the nodes, join frames included
+        bytes_received (int): bytes received from the nodes
+        bytes_sent (int): bytes forwarded to the nodes
+    """
+    def __init__(self, address: str, noise: float, eve: bool, models=(), seed: int = None):
+        self.host = address.split(':')[0]
+        self.port = address.split(':')[1]
+        self.noise = noise
+        self.eve = eve
+        self.models = build_models(noise, eve, models, seed)
+        self.backlog = 1024
+        self.peers = {}  # pair ID -> set of writers
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.loop = None
+        self.stopping = None
+
+    def initiate_channel(self, *port):
+        """Start channel"""
+        if len(port) > 0:
+            self.port = str(port[0])
+        if isinstance(self.port, str):
+            self.port = int(self.port)
+        asyncio.run(self.serve())
+
+    def stop(self):
+        """Stop accepting connections and close the listening socket, it can be called from any thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    async def serve(self):
+        """Accept connections until the channel is stopped"""
+        self.stopping = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        try:
+            server = await asyncio.start_server(self.initiate_connection, self.host or None, self.port,
+                                                backlog=self.backlog, reuse_address=True)
+        except OSError:
+            self.loop = None
+            raise qsocketerror("port {0} is occupied".format(self.port))
+        logger.info("initiated the channel on %s:%s, waiting for clients...", self.host, self.port)
+        async with server:
+            await self.stopping.wait()
+        self.loop = None
+
+    async def initiate_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Listen for frames and route them to the peers with the same pair ID"""
+        addr = writer.get_extra_info('peername')
+        logger.info("%s has connected.", addr)
+        joined = set()
+        try:
+            while True:
+                header = await reader.readexactly(frames.HEADER.size)
+                body = await reader.readexactly(frames.body_length(header))
+                self.frames_received += 1
+                self.bytes_received += len(header) + len(body)
+                frame = frames.unpack_frame(header, body)
+                peers = self.peers.setdefault(frame.ID, set())
+                if writer not in peers:
+                    peers.add(writer)
+                    joined.add(frame.ID)
+                if frame.label == 'join':
+                    continue
+                frame = apply_features(frame, self.models)
+                message = frames.pack_frame(frame.ID, frame.label, frame.kind, frame.payload, frame.seq)
+                logger.debug("%s: %s %s (%d bytes)", addr, frame.label, frame.kind, len(message))
+                for peer in list(peers):
+                    if peer is not writer:
+                        try:
+                            peer.write(message)
+                            self.bytes_sent += len(message)
+                            await peer.drain()
+                        except ConnectionError:
+                            logger.warning("Unknown connection, ignoring...")
+        except (asyncio.IncompleteReadError, ConnectionError, qsocketerror):
+            pass
+        finally:
+            for ID in joined:
+                peers = self.peers.get(ID)
+                peers.discard(writer)
+                if not peers:
+                    del self.peers[ID]
+            writer.close()
+            logger.info("%s has disconnected", addr)
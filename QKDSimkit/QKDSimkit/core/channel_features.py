@@ -5,61 +5,207 @@
 #
 # (C) Copyright 2021 CERN.
 
-"""This module contains methods to simulate some feature of a channel"""
+"""This module contains methods to simulate some feature of a channel
 
+Noise models work on whole arrays of polarization codes (basis * 2 + bit), every model owns a random generator so that
+the same seed always produces the same errors. Models can be chained with apply_models or built from a 'name:parameter'
+string with parse_noise_model.
+"""
+
+import abc
 import logging
-import random
-import sys
 
-from .models import Photon
+import numpy as np
+
+from .models import PhotonPulse
 from QKDSimkit.core.qexceptions import qnoiseerror
 
 logger = logging.getLogger("QKDSimkit_logger")
 
 
-def eavesdropper(photon_stream) -> str:
-    """Method to simulate an eavesdropper in a quantum channel
+class NoiseModel(abc.ABC):
+    """Base class of noise models
+
+    Args:
+        seed (int or numpy.random.SeedSequence): seed of the random generator, None for a random seed
+    """
+    name = None
+
+    def __init__(self, seed: int = None):
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, polarizations):
+        """Apply the model to an array of polarization codes
+
+        Args:
+            polarizations (array): polarization codes of the photons
+        Returns:
+            new polarization codes
+        """
+        try:
+            return self.apply(np.asarray(polarizations, dtype=np.uint8))
+        except Exception as e:
+            raise qnoiseerror('{0} error:\n{1}'.format(type(self).__name__, str(e)))
+
+    @abc.abstractmethod
+    def apply(self, polarizations):
+        """abstract method"""
+
+    def randomize(self, polarizations, mask):
+        """Replace the photons selected by mask with random polarization codes"""
+        logger.debug('Errors: %d', mask.sum())
+        return np.where(mask, self.rng.integers(0, 4, len(polarizations), dtype=np.uint8), polarizations)
+
+
+class Depolarizing(NoiseModel):
+    """Each photon is replaced by a completely mixed state with probability rate, its measurement gives a random result
+    in both bases
+
+    Args:
+        rate (float): decimal number from 0 to 1
+        seed (int): seed of the random generator
+    """
+    name = 'depolarizing'
+
+    def __init__(self, rate: float, seed: int = None):
+        super().__init__(seed)
+        self.rate = rate
+
+    def apply(self, polarizations):
+        return self.randomize(polarizations, self.rng.random(len(polarizations)) < self.rate)
+
+
+class BitFlip(NoiseModel):
+    """Each photon is flipped to the orthogonal polarization of the same basis with probability rate
+
+    Args:
+        rate (float): decimal number from 0 to 1
+        seed (int): seed of the random generator
+    """
+    name = 'bitflip'
+
+    def __init__(self, rate: float, seed: int = None):
+        super().__init__(seed)
+        self.rate = rate
+
+    def apply(self, polarizations):
+        flips = self.rng.random(len(polarizations)) < self.rate
+        logger.debug('Errors: %d', flips.sum())
+        return polarizations ^ flips.astype(np.uint8)
+
+
+class Loss(NoiseModel):
+    """Fiber attenuation, a photon survives with probability 10^(-attenuation * distance / 10)
+
+    The protocol has no detection announcement, so the slot of a lost photon is filled by a dark count with a random
+    result, loss shows up as errors at bob's side
+
+    Args:
+        distance (float): length of the fiber (km)
+        attenuation (float): attenuation of the fiber (dB/km)
+        seed (int): seed of the random generator
+    """
+    name = 'loss'
+
+    def __init__(self, distance: float, attenuation: float = 0.2, seed: int = None):
+        super().__init__(seed)
+        self.distance = distance
+        self.attenuation = attenuation
+
+    @property
+    def transmittance(self) -> float:
+        return 10 ** (-self.attenuation * self.distance / 10)
+
+    def apply(self, polarizations):
+        return self.randomize(polarizations, self.rng.random(len(polarizations)) >= self.transmittance)
+
+
+class InterceptResend(NoiseModel):
+    """An eavesdropper measures a fraction of the photons in random bases and resends what she measured
+
+    Args:
+        fraction (float): decimal number from 0 to 1, fraction of intercepted photons
+        seed (int): seed of the random generator
+    """
+    name = 'intercept_resend'
+
+    def __init__(self, fraction: float = 1.0, seed: int = None):
+        super().__init__(seed)
+        self.fraction = fraction
+
+    def apply(self, polarizations):
+        intercepted = self.rng.random(len(polarizations)) < self.fraction
+        result = polarizations.copy()
+        result[intercepted] = PhotonPulse.measure(polarizations[intercepted], self.rng).polarizations
+        return result
+
+
+NOISE_MODELS = {model.name: model for model in (Depolarizing, BitFlip, Loss, InterceptResend)}
+
+
+def parse_noise_model(spec: str, seed: int = None) -> NoiseModel:
+    """Build a noise model from a string
 
     Args:
-        photon_stream (str): message containing polarizations
+        spec (str): 'name:parameter', e.g. 'depolarizing:0.05', 'loss:25' or 'intercept_resend:0.5'
+        seed (int): seed of the random generator
     Returns:
-        message with new (eavesdropped) polarizations
+        noise model
     """
+    name, _, parameter = spec.partition(':')
+    try:
+        model = NOISE_MODELS[name]
+    except KeyError:
+        raise qnoiseerror('Unknown noise model {0}, choose from {1}'.format(name, ', '.join(NOISE_MODELS)))
     try:
-        photon_pulse = []
-        new_message = '' + photon_stream[0] + ':' + photon_stream[1] + ':'
-        polarization_vector = photon_stream[2].split("~")[:-1]
-        for p in range(len(polarization_vector)):
-            photon_pulse.append(Photon())
-            photon_pulse[p].polarization = photon_pulse[p].measure(int(polarization_vector[p]))
-            photon_pulse[p].bit = photon_pulse[p].set_bit_from_measurement()
-            new_message += str(photon_pulse[p].polarization) + '~'
-        return new_message + ':'
-    except Exception as e:
-        raise qnoiseerror('Eavesdropper error:\n' + str(e))
-
-
-def random_errors(photon_stream, rate: float) -> str:
+        return model(float(parameter), seed=seed) if parameter else model(seed=seed)
+    except (TypeError, ValueError):
+        raise qnoiseerror('Invalid parameter for noise model ' + spec)
+
+
+def build_models(noise: float = 0.0, eve: bool = False, specs=(), seed: int = None) -> list:
+    """Noise models of a channel: an eavesdropper on every photon, random errors and then the models given by specs
+
+    Args:
+        noise (float): ratio of noise in channel
+        eve (bool): simulate an eavesdropper in channel
+        specs (list): 'name:parameter' strings, see parse_noise_model
+        seed (int): seed of the whole chain, every model gets an independent stream
+    Returns:
+        list of noise models
+    """
+    names = (['intercept_resend:1'] if eve else []) + (['depolarizing:' + str(noise)] if noise > 0 else []) + list(specs)
+    seeds = np.random.SeedSequence(seed).spawn(len(names))
+    return [parse_noise_model(name, seed=child) for name, child in zip(names, seeds)]
+
+
+def apply_models(polarizations, models: list):
+    """Apply a chain of noise models in order"""
+    for model in models:
+        polarizations = model(polarizations)
+    return polarizations
+
+
+def eavesdropper(polarizations, seed: int = None):
+    """Method to simulate an eavesdropper in a quantum channel
+
+    Args:
+        polarizations (array): polarization codes of the photons
+        seed (int): seed of the random generator
+    Returns:
+        new (eavesdropped) polarization codes
+    """
+    return InterceptResend(1.0, seed=seed)(polarizations)
+
+
+def random_errors(polarizations, rate: float, seed: int = None):
     """Method to simulate random errors in a quantum channel
 
     Args:
-        photon_stream (str): message containing polarizations
+        polarizations (array): polarization codes of the photons
         rate (float): decimal number from 0 to 1, it sets the error rate
+        seed (int): seed of the random generator
     Returns:
-        message with errors
+        polarization codes with errors
     """
-    try:
-        polarization_vector = photon_stream[2].split("~")[:-1]
-        new_message = '' + photon_stream[0] + ':' + photon_stream[1] + ':'
-        count = 0
-        for p in polarization_vector:
-            if random.randint(1, 100) <= rate*100:
-                polarization = random.randint(0, 3) * 45
-                new_message += str(polarization) + '~'
-                count += 1
-            else:
-                new_message += str(p) + '~'
-        logger.info('Errors: ' + str(count))
-        return new_message + ':'
-    except Exception as e:
-        raise qnoiseerror("Failed to add errors in photon stream:\n" + str(e))
+    return Depolarizing(rate, seed=seed)(polarizations)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the binary frame format used on the channel
+
+A frame is made by a fixed size header, the ID of the alice-bob pair and the payload:
+
+    +-----------+-------+------+----------+----------------+-----------+---------+
+    | ID length | label | kind | sequence | payload length | ID        | payload |
+    | 1 byte    | 1 byte| 1 b. | 4 bytes  | 4 bytes        | ID length | length  |
+    +-----------+-------+------+----------+----------------+-----------+---------+
+
+Bits (bases, sifting mask, samples, parities, digests) are packed 8 per byte, polarization codes 4 per byte.
+A node sends a 'join' frame right after connecting so that the channel knows its pair ID, these frames are never
+forwarded.
+"""
+
+import select
+import struct
+import time
+
+from collections import deque, namedtuple
+
+import numpy as np
+
+from .qexceptions import qobjecterror, qsocketerror
+
+HEADER = struct.Struct('!BBBII')
+COUNT = struct.Struct('!I')
+DECISION = struct.Struct('!b')
+
+# largest payload accepted from a peer, a header announcing more is refused before its body is buffered
+MAX_PAYLOAD = 1 << 26
+
+# every round of Cascade has its own pair of labels, the label code must fit in one byte
+CASCADE_ROUNDS = 120
+
+LABELS = ('qpulse', 'bob-other_bases', 'alice-reconciled_key', 'alice-other_sub_key', 'bob-other_sub_key',
+          'alice-other_decision', 'bob-other_decision', 'join', 'alice-other_digest') + tuple(
+    '{0}-parities-{1}'.format(node, step) for step in range(CASCADE_ROUNDS) for node in ('alice', 'bob'))
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+
+DATA = 0
+ACK = 1
+REQUEST = 2
+
+Frame = namedtuple('Frame', ['ID', 'label', 'kind', 'seq', 'payload'])
+
+
+def pack_frame(ID: str, label: str, kind: int = DATA, payload: bytes = b'', seq: int = 0) -> bytes:
+    """Build a frame
+
+    Args:
+        ID (str): identifier of alice-bob pair
+        label (str): name of the message, one of LABELS
+        kind (int): DATA, ACK or REQUEST
+        payload (bytes): content of the message
+        seq (int): sequence number of the exchange
+    Returns:
+        frame (bytes)
+    """
+    try:
+        code = LABEL_CODES[label]
+    except KeyError:
+        raise qobjecterror("unknown label " + label)
+    if len(payload) > MAX_PAYLOAD:
+        raise qobjecterror("payload of {0} bytes exceeds MAX_PAYLOAD".format(len(payload)))
+    encoded_id = ID.encode()
+    return HEADER.pack(len(encoded_id), code, kind, seq, len(payload)) + encoded_id + payload
+
+
+def unpack_frame(header: bytes, body: bytes) -> Frame:
+    """Parse a frame given its header and the following ID and payload
+
+    Args:
+        header (bytes): HEADER.size bytes
+        body (bytes): ID and payload
+    Returns:
+        Frame
+    """
+    id_length, code, kind, seq, _ = HEADER.unpack(header)
+    if code >= len(LABELS):
+        raise qsocketerror("unknown label code {0}".format(code))
+    return Frame(bytes(body[:id_length]).decode(), LABELS[code], kind, seq, bytes(body[id_length:]))
+
+
+def body_length(header: bytes) -> int:
+    """Number of bytes following the header, qsocketerror if the payload is larger than MAX_PAYLOAD"""
+    id_length, _, _, _, length = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise qsocketerror("payload of {0} bytes exceeds MAX_PAYLOAD".format(length))
+    return id_length + length
+
+
+class FrameReader(object):
+    """Buffered reader that yields complete frames received from a socket
+
+    Received bytes are appended to a single buffer, every complete frame is parsed in place and removed, the bytes of a
+    partial frame are kept for the next read, so the cost is linear in the size of the data
+
+    Args:
+        sock: socket
+        buffer_size (int): maximum number of bytes for each recv call
+    """
+    def __init__(self, sock, buffer_size: int = 8192):
+        self.socket = sock
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.frames = deque()
+
+    def feed(self, data: bytes):
+        """Add data to the buffer and parse all the complete frames
+
+        Args:
+            data (bytes): received data
+        """
+        self.buffer += data
+        offset = 0
+        with memoryview(self.buffer) as view:
+            while len(view) - offset >= HEADER.size:
+                header = bytes(view[offset:offset + HEADER.size])
+                end = offset + HEADER.size + body_length(header)
+                if len(view) < end:
+                    break
+                self.frames.append(unpack_frame(header, bytes(view[offset + HEADER.size:end])))
+                offset = end
+        del self.buffer[:offset]
+
+    def read(self, timeout: float = None) -> Frame:
+        """Return the next complete frame
+
+        Args:
+            timeout (float): seconds to wait for a frame, None waits forever
+        Returns:
+            frame (Frame): next frame, None if no complete frame arrived in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.frames:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready = select.select([self.socket], [], [], remaining)
+            if not ready[0]:
+                return None
+            data = self.socket.recv(self.buffer_size)
+            if not data:
+                raise qsocketerror("connection closed")
+            self.feed(data)
+        return self.frames.popleft()
+
+
+def parities_label(node: str, step: int) -> str:
+    """Label of the parities sent by a node in a round of Cascade"""
+    return '{0}-parities-{1}'.format(node, step)
+
+
+def encode_bits(bits) -> bytes:
+    """Pack an array of bits 8 per byte"""
+    bits = np.asarray(bits, dtype=np.uint8)
+    return COUNT.pack(len(bits)) + np.packbits(bits).tobytes()
+
+
+def decode_bits(payload: bytes):
+    """Unpack an array of bits"""
+    count, = COUNT.unpack_from(payload)
+    return np.unpackbits(np.frombuffer(payload, dtype=np.uint8, offset=COUNT.size), count=count)
+
+
+def encode_polarizations(codes) -> bytes:
+    """Pack an array of polarization codes (0-3) 4 per byte"""
+    codes = np.asarray(codes, dtype=np.uint8)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    packed = (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+    return COUNT.pack(len(codes)) + packed.tobytes()
+
+
+def decode_polarizations(payload: bytes):
+    """Unpack an array of polarization codes"""
+    count, = COUNT.unpack_from(payload)
+    packed = np.frombuffer(payload, dtype=np.uint8, offset=COUNT.size)
+    quads = np.stack([packed >> 6, packed >> 4, packed >> 2, packed], axis=1) & 3
+    return quads.reshape(-1)[:count]
+
+
+def encode_decision(decision: int) -> bytes:
+    """Pack the result of a validation"""
+    return DECISION.pack(decision)
+
+
+def decode_decision(payload: bytes) -> int:
+    """Unpack the result of a validation"""
+    return DECISION.unpack(payload)[0]
+
+
+DECODERS = {
+    'qpulse': decode_polarizations,
+    'bob-other_bases': decode_bits,
+    'alice-reconciled_key': decode_bits,
+    'alice-other_sub_key': decode_bits,
+    'bob-other_sub_key': decode_bits,
+    'alice-other_decision': decode_decision,
+    'bob-other_decision': decode_decision,
+    'alice-other_digest': decode_bits,
+}
+DECODERS.update((label, decode_bits) for label in LABELS if '-parities-' in label)
+
+
+def decode_payload(label: str, payload: bytes):
+    """Decode the payload of a frame according to its label"""
+    return DECODERS[label](payload)
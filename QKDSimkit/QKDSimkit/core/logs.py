@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the logging of frames on the hot path of the exchanges
+
+A frame record is emitted at DEBUG level with the label, the length of the payload and, when known, the round trip
+time, these values are also attributes of the record (frame, event, size, elapsed). Nothing is formatted unless a
+handler accepts the record, payloads are dumped in hex only after dump_payloads(), FrameSampler lets through one frame
+record out of every rate.
+"""
+
+import itertools
+import logging
+
+DUMP_PAYLOADS = False
+
+
+def dump_payloads(enabled: bool = True):
+    """Add the hex dump of the payload to frame records"""
+    global DUMP_PAYLOADS
+    DUMP_PAYLOADS = enabled
+
+
+class Hex(object):
+    """Hex representation of a payload computed only when the record is formatted"""
+    __slots__ = ('payload',)
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+    def __str__(self):
+        return self.payload.hex()
+
+
+def log_frame(logger: logging.Logger, event: str, label: str, payload: bytes = b'', elapsed: float = None):
+    """Log a frame sent or received by a node
+
+    Args:
+        logger (Logger): logger of the node
+        event (str): e.g. 'sent', 'received', 'sent again'
+        label (str): label of the frame
+        payload (bytes): payload of the frame
+        elapsed (float): seconds between the frame and its answer
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    extra = {'frame': label, 'event': event, 'size': len(payload), 'elapsed': elapsed}
+    msg, args = '%s %s %d bytes', [event, label, len(payload)]
+    if elapsed is not None:
+        msg += ' in %.3f ms'
+        args.append(elapsed * 1e3)
+    if DUMP_PAYLOADS and payload:
+        msg += ': %s'
+        args.append(Hex(payload))
+    logger.debug(msg, *args, extra=extra, stacklevel=2)
+
+
+class FrameSampler(logging.Filter):
+    """Let through one frame record out of every rate, other records are not sampled
+
+    Args:
+        rate (int): sampling rate, 1 keeps every record
+    """
+    def __init__(self, rate: int = 1):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self.counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate == 1 or not hasattr(record, 'frame'):
+            return True
+        return next(self.counter) % self.rate == 0
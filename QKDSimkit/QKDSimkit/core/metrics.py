@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the in-process registry of metrics of the key exchanges
+
+Nodes and the alice/bob procedures record counters (bytes, retransmissions, exchanges, keys) and summaries (duration of
+every phase, QBER, attempts per batch) in the module registry, servers expose it in the Prometheus text format:
+
+    qkd_phase_seconds{node="alice",phase="sifting"}     summary, time spent in a phase of the exchange
+    qkd_qber{node="alice"}                              summary, error rate estimated on the sample of an exchange
+    qkd_attempts{node="alice"}                          summary, photon pulses needed for a batch of keys
+    qkd_exchanges_total{node="alice",result="success"}  counter, results: success, mismatch, short, abort
+    qkd_keys_total{node="alice"}                        counter
+    qkd_bytes_sent_total, qkd_bytes_received_total      counters, frames of the nodes
+    qkd_retransmissions_total{node="alice"}             counter, frames sent again
+
+A disabled registry returns before taking its lock, its stopwatch does nothing.
+"""
+
+import threading
+import time
+
+PREFIX = 'qkd_'
+
+
+def _labels(labels: tuple) -> str:
+    """Prometheus representation of sorted (name, value) pairs"""
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels) + '}'
+
+
+class Stopwatch(object):
+    """Measures consecutive phases of an exchange
+
+    Args:
+        registry (Registry): where durations are observed
+        labels (dict): labels of every phase, e.g. node='alice'
+    """
+    def __init__(self, registry, **labels):
+        self.registry = registry
+        self.labels = labels
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        """Record the time since the previous lap as a phase"""
+        now = time.perf_counter()
+        self.registry.observe('phase_seconds', now - self.last, phase=phase, **self.labels)
+        self.last = now
+
+
+class NullStopwatch(object):
+    """Stopwatch of a disabled registry"""
+    def lap(self, phase: str):
+        pass
+
+
+NULL_STOPWATCH = NullStopwatch()
+
+
+class Registry(object):
+    """Thread safe counters, gauges and summaries identified by a name and labels
+
+    Args:
+        enabled (bool): record metrics, a disabled registry ignores every call
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.summaries = {}  # (name, labels) -> [count, sum]
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add value to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set the value of a gauge"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Add an observation to a summary"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.setdefault(key, [0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+
+    def stopwatch(self, **labels):
+        """Stopwatch for the phases of an exchange, it starts now"""
+        if not self.enabled:
+            return NULL_STOPWATCH
+        return Stopwatch(self, **labels)
+
+    def value(self, name: str, **labels):
+        """Value of a counter or gauge, (count, sum) of a summary, None if never recorded"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key in self.summaries:
+                return tuple(self.summaries[key])
+            return self.counters.get(key, self.gauges.get(key))
+
+    def clear(self):
+        """Forget every metric"""
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.summaries.clear()
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            summaries = sorted(self.summaries.items())
+        lines = []
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            previous = None
+            for (name, labels), value in items:
+                if name != previous:
+                    lines.append('# TYPE {0}{1} {2}'.format(PREFIX, name, kind))
+                    previous = name
+                lines.append('{0}{1}{2} {3}'.format(PREFIX, name, _labels(labels), value))
+        previous = None
+        for (name, labels), (count, total) in summaries:
+            if name != previous:
+                lines.append('# TYPE {0}{1} summary'.format(PREFIX, name))
+                previous = name
+            lines.append('{0}{1}_sum{2} {3}'.format(PREFIX, name, _labels(labels), total))
+            lines.append('{0}{1}_count{2} {3}'.format(PREFIX, name, _labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def export_pool(pool, registry: Registry = registry):
+    """Set the gauges of an ExchangePool: exchanges running and queued, users with exchanges in flight"""
+    stats = pool.stats()
+    registry.set('exchanges_running', sum(user['running'] for user in stats.values()))
+    registry.set('exchanges_queued', sum(user['queued'] for user in stats.values()))
+    registry.set('exchange_users', len(stats))
+
+
+def export_token_cache(cache, registry: Registry = registry):
+    """Set the gauges of a TokenCache: size, PBKDF2 derivations run and saved"""
+    for name, value in cache.stats().items():
+        registry.set('token_cache_' + name, value)
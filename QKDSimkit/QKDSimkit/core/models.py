@@ -9,6 +9,12 @@
 
 import random
 
+import numpy as np
+
+BASES = ("RL", "DG")  # index in the tuple is the basis code used by PhotonPulse
+POLARIZATIONS = np.array([0, 90, 45, 135])  # polarization in degrees for each code (basis * 2 + bit)
+DEGREES_TO_CODE = np.array([0, 2, 1, 3])  # code for each polarization in degrees divided by 45
+
 
 class Photon(object):
     """Photon, it has bit, basis and polarization and some methods to manipulate them"""
@@ -74,3 +80,69 @@ class Photon(object):
 
         return self.bit
 
+
+class PhotonPulse(object):
+    """Array-backed photon pulse, vectorized counterpart of a list of Photon objects
+
+    Each photon is described by one uint8 element in three parallel arrays: bit (0 or 1), basis (0 = RL, 1 = DG) and
+    polarization code (basis * 2 + bit, see POLARIZATIONS to convert it to degrees)
+
+    Args:
+        bits (array): bit of every photon
+        bases (array): basis code of every photon
+    """
+    def __init__(self, bits, bases):
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.bases = np.asarray(bases, dtype=np.uint8)
+        self.polarizations = (self.bases << 1) | self.bits
+
+    def __len__(self):
+        return len(self.bits)
+
+    @classmethod
+    def create(cls, size: int, rng=None):
+        """Create a pulse of photons with random bits and bases
+
+        Args:
+            size (int): number of photons
+            rng (numpy.random.Generator): random generator, a new one is created if not given
+        Returns:
+            PhotonPulse
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        return cls(rng.integers(0, 2, size, dtype=np.uint8), rng.integers(0, 2, size, dtype=np.uint8))
+
+    @classmethod
+    def measure(cls, polarizations, rng=None):
+        """Measure incoming polarization codes with random bases
+
+        When the basis matches the one used to prepare the photon the bit is preserved, otherwise it is random, this is
+        the same behaviour of Photon.measure followed by Photon.set_bit_from_measurement
+
+        Args:
+            polarizations (array): polarization codes of the incoming photons
+            rng (numpy.random.Generator): random generator, a new one is created if not given
+        Returns:
+            PhotonPulse
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        polarizations = np.asarray(polarizations, dtype=np.uint8)
+        bases = rng.integers(0, 2, len(polarizations), dtype=np.uint8)
+        random_bits = rng.integers(0, 2, len(polarizations), dtype=np.uint8)
+        bits = np.where((polarizations >> 1) == bases, polarizations & 1, random_bits)
+        return cls(bits, bases)
+
+    def degrees(self):
+        """Polarization of every photon in degrees"""
+        return POLARIZATIONS[self.polarizations]
+
+
+def degrees_to_codes(degrees):
+    """Convert polarizations in degrees (0, 45, 90, 135) to polarization codes
+
+    Args:
+        degrees (array): polarizations in degrees
+    Returns:
+        array of polarization codes
+    """
+    return DEGREES_TO_CODE[np.asarray(degrees, dtype=np.int64) // 45].astype(np.uint8)
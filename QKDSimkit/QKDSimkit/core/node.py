@@ -6,21 +6,27 @@
 # (C) Copyright 2021 CERN.
 
 import abc
-import ast
+import hashlib
 import logging
-import re
-import select
 import socket
+import struct
+import time
 
+import numpy as np
+
+from . import frames, reconciliation
+from .metrics import registry
 from .qexceptions import qsocketerror
+from .timer import RetransmissionTimer
 from .utils import validate
 
 MIN_SHARED = 20
 BUFFER_SIZE = 8192
-TIMEOUT_IN_SECONDS = 1
-CONNECTION_ATTEMPTS = 60
+EXCHANGE_TIMEOUT = 60
 MAX_REPETITIONS = 1000
 MIN_SHARED_PERCENT = 0.89
+PULSE_FACTOR = 5
+MAX_PULSE_FACTOR = 80
 
 logger = logging.getLogger("QKDSimkit_logger")
 
@@ -33,53 +39,72 @@ class Node(object):
         size (int): size of key in bits
 
     Attributes:
-        min_shared (int): 
+        min_shared (int): minimum number of bits revealed to estimate the error rate
         buffer_size (int):
-        timeout_in_seconds (int):
-        connection_attempts (int):
+        exchange_timeout (float): seconds available for an exchange, waits and retransmissions stop at its deadline
+        timer (RetransmissionTimer): round trip time estimate of the channel, it is kept across exchanges
+        deadline (float): monotonic time at which the current exchange fails
         max_repetitions (int):
-        min_shared_percent (float):
+        min_shared_percent (float): minimum percentage of equal bits in the revealed sample, below it the exchange
+            is aborted
         socket: socket
+        reader (FrameReader): buffered reader of the socket
         ID (str): identifier of alice-bob pair
-        photon_pulse (list): list of photons
-        bases (list): list of bases
-        other_bases (list): list of bases of the other node
-        reconciled_key (list): key with only common values and ""
-        shared_key (list): key with only common values
-        sub_shared_key (list): first half of the key
-        other_sub_key (list): first half of the key of the other node
+        photon_pulse (PhotonPulse): array-backed pulse of photons
+        bases (array): basis codes of the photons (0 = RL, 1 = DG)
+        other_bases (array): basis codes of the other node
+        reconciled_key (array): sifting mask, 1 where the bases of the two nodes match
+        shared_key (array): bits of the photons with a common basis
+        sub_shared_key (array): random sample of the shared key revealed to estimate the error rate
+        other_sub_key (array): sample of the shared key of the other node
+        other_digest (array): digest of the reconciled key of the other node
         decision (int): result of comparison between shared part of the key
         other_decision (int): result of comparison between ke ys
-        not_shared_key (list):
-        key (list): non-revealed part of the key
-        fragments (list):
-        regex: utility regex
+        seeds (list): seeds of the post-processing (sample, Cascade, privacy amplification), derived from the public
+            sifting mask
+        qber (float): error rate estimated on the sample
+        leaked (int): bits disclosed during reconciliation
+        key (array): non-revealed part of the key, then reconciled and finally compressed
+        sequence (int): sequence number of the exchange, frames with a different one are discarded
         photon_pulse_size (int): number of photons exchanged photons
     """
+    corrects_errors = False  # the receiver flips its bits during reconciliation
+    role = None  # label of the metrics of this node
+
     def __init__(self, ID, size):
         self.min_shared = MIN_SHARED
         self.buffer_size = BUFFER_SIZE
-        self.timeout_in_seconds = TIMEOUT_IN_SECONDS
-        self.connection_attempts = CONNECTION_ATTEMPTS
+        self.exchange_timeout = EXCHANGE_TIMEOUT
+        self.timer = RetransmissionTimer()
         self.max_repetitions = MAX_REPETITIONS
         self.min_shared_percent = MIN_SHARED_PERCENT
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.reader = frames.FrameReader(self.socket, self.buffer_size)
         self.ID = ID
-        self.photon_pulse = []
-        self.bases = []
-        self.other_bases = []
-        self.reconciled_key = []
-        self.shared_key = []
-        self.sub_shared_key = []
-        self.other_sub_key = []
+        self.sequence = 0
+        self.photon_pulse_size = size * PULSE_FACTOR
+        self.reset()
+
+    def reset(self):
+        """Clear the state of the previous exchange and start its deadline, the connection to the channel is kept"""
+        self.deadline = time.monotonic() + self.exchange_timeout
+        self.photon_pulse = None
+        self.bases = np.empty(0, dtype=np.uint8)
+        self.other_bases = np.empty(0, dtype=np.uint8)
+        self.reconciled_key = np.empty(0, dtype=np.uint8)
+        self.shared_key = np.empty(0, dtype=np.uint8)
+        self.sub_shared_key = np.empty(0, dtype=np.uint8)
+        self.other_sub_key = np.empty(0, dtype=np.uint8)
+        self.other_digest = np.empty(0, dtype=np.uint8)
         self.decision = 0
         self.other_decision = 0
-        self.key = []
-        self.regex = r'\((.)*\):'
-        self.photon_pulse_size = size * 5
+        self.seeds = []
+        self.qber = 1.0
+        self.leaked = 0
+        self.key = np.empty(0, dtype=np.uint8)
 
     def connect_to_channel(self, address: str, port: int):
-        """It starts the connection with the channel
+        """It starts the connection with the channel and announces the ID of this node
 
         Args:
             address (str): address
@@ -88,6 +113,7 @@ class Node(object):
         """
         try:
             self.socket.connect((address, port))
+            self.send_frame('join')
         except socket.error:
             raise qsocketerror("unable to connect")
 
@@ -97,6 +123,7 @@ class Node(object):
         try:
             self.socket.close()
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.reader = frames.FrameReader(self.socket, self.buffer_size)
         except Exception as e:
             logger.info("Failed to reset socket:\n" + str(e))
             raise qsocketerror
@@ -119,18 +146,40 @@ class Node(object):
         self.create_sub_shared_key()
 
     def create_shared_key(self):
-        """Converts the whole photon pulse in a list of bit"""
-        for i in range(len(self.photon_pulse)):
-            if self.reconciled_key[i] != "":
-                self.shared_key.append(self.photon_pulse[i].bit)
+        """Keeps the bits of the photons selected by the sifting mask"""
+        self.shared_key = self.photon_pulse.bits[np.asarray(self.reconciled_key, dtype=bool)]
 
     def create_sub_shared_key(self):
-        """Create the part of the key that will be sent to the other node (first half)"""
-        self.sub_shared_key = self.shared_key[:(len(self.shared_key) // 2)]
+        """Create the part of the key that will be sent to the other node to estimate the error rate, a random sample
+        of the shared key, the other bits are kept as raw key
+
+        the positions are chosen with a seed derived from the public sifting mask, so both nodes pick the same ones
+        """
+        digest = hashlib.sha256(frames.encode_bits(self.reconciled_key)).digest()
+        self.seeds = reconciliation.seeds(int.from_bytes(digest[:8], 'big'), 3)
+        length = len(self.shared_key)
+        count = min(max(self.min_shared, int(length * reconciliation.SAMPLE_FRACTION)), length // 2)
+        indices = reconciliation.sample_indices(length, count, self.seeds[0])
+        self.sub_shared_key = self.shared_key[indices]
+        self.key = np.delete(self.shared_key, indices)
+
+    def reconcile(self):
+        """Correct the errors of the raw key with Cascade, the receiver flips its bits to match the key of the sender"""
+        cascade = reconciliation.Cascade(self.key, self.qber, self.seeds[1], self.corrects_errors)
+        for step in range(frames.CASCADE_ROUNDS):
+            if not cascade.next_queries():
+                break
+            parities = cascade.parities()
+            cascade.update(parities, self.exchange_parities(step, parities))
+        else:
+            logger.warning("Cascade did not converge in {0} rounds".format(frames.CASCADE_ROUNDS))
+        self.key = cascade.key
+        self.leaked += cascade.leaked
 
     def get_key(self):
-        """Create the part of the key that will not be sent and it will be used as symmetric key (second half)"""
-        self.key = self.shared_key[(len(self.shared_key) // 2):]
+        """Compress the reconciled key with privacy amplification, the result is used as symmetric key"""
+        length = reconciliation.secure_length(len(self.key), self.qber, self.leaked)
+        self.key = reconciliation.toeplitz_hash(self.key, length, self.seeds[2])
 
     def listen_for(self, sender: str, attr: str):
         """Receive a message and store it in the right place
@@ -140,16 +189,17 @@ class Node(object):
             attr (str): name of the attribute that will store the content of the received message
             """
         try:
-            logger.info("Listening to classical channel for " + attr)
+            logger.debug("Listening to classical channel for %s", attr)
+            label = sender + '-' + attr
             while True:
-                message = self.recv(sender + '-' + attr)
+                payload = self.recv(label)
                 try:
-                    literal = ast.literal_eval(message)
-                except ValueError as VE:
+                    value = frames.decode_payload(label, payload)
+                except (ValueError, struct.error) as VE:
                     logger.error("Value Error: " + str(VE))
                     pass
                 else:
-                    setattr(self, attr, literal)
+                    setattr(self, attr, value)
                     break
         except socket.error:
             raise qsocketerror("not connected to any channel")
@@ -158,42 +208,78 @@ class Node(object):
         """Wrapper of utils.validate it manages different outputs, it also gives info of eventual errors
 
         Returns:
-            int: 1: keys are equals, 0: error rate is below a given percent, -1: error rate too high
+            int: 1: error rate can be corrected, -1: error rate too high
         """
         percent = validate(self.sub_shared_key, self.other_sub_key)
-        logger.info('Correct bits percentage: ' + str(percent))
-        if percent == 1:
-            return 1
-        if self.min_shared_percent <= percent < 1:
-            return 0
+        logger.info('Correct bits percentage: %s', percent)
         if percent < self.min_shared_percent:
             return -1
+        self.qber = 1 - percent
+        registry.observe('qber', self.qber, node=self.role)
+        return 1
 
-    def recv_all(self) -> list:
+    def send_frame(self, label: str, kind: int = frames.DATA, payload: bytes = b'', seq: int = None):
+        """Send a single frame of this node
+
+        Args:
+            label (str): name of the message
+            kind (int): DATA, ACK or REQUEST
+            payload (bytes): content of the message
+            seq (int): sequence number, the one of the current exchange if not given
+        """
+        data = frames.pack_frame(self.ID, label, kind, payload, self.sequence if seq is None else seq)
+        self.socket.sendall(data)
+        registry.inc('bytes_sent_total', len(data), node=self.role)
+
+    def recv_all(self, timeout: float = None) -> frames.Frame:
         """receive a message
-        receive from socket, sum every part of the message, check if the message is commplete, check if the ID of the
-        sender corresponds to the ID of the receiver, return a list whit header and payload, please note that the ID
-        is not returned
+        read frames from the buffered reader, check if the ID and the sequence number of the sender correspond to the
+        ones of the receiver, frames belonging to other nodes are discarded
 
+        Args:
+            timeout (float): seconds to wait, None waits until the deadline of the exchange
         Returns:
-            fragments (list): list made by header and payload
+            frame (Frame): received frame, None if nothing arrived in time
         """
-        message = ''
-        ready = select.select([self.socket], [], [], self.timeout_in_seconds)
-        if ready[0]:
-            while True:
-                data_recv = self.socket.recv(self.buffer_size).decode()
-                message += re.sub(self.regex, '', data_recv)  # removing ('xxx.xxx.xxx.xxx', xxxxx):
-                if message.count(':') >= 3:  # checking if payload started and finished example: 'ID:head:payload:'
-                    fragments = message.split(':', 3)
-                    if fragments[0] != self.ID:  # this message doesn't belong to this node
-                        message = fragments[3]  # we can discard it
-                        continue
-                    else:
-                        return fragments[1:]  # we don't need to return ID because we already checked it is correct
+        now = time.monotonic()
+        if now >= self.deadline:
+            raise qsocketerror("deadline of the exchange exceeded")
+        limit = self.deadline if timeout is None else min(self.deadline, now + timeout)
+        while True:
+            frame = self.reader.read(max(0, limit - time.monotonic()))
+            if frame is None:
+                if time.monotonic() >= self.deadline:
+                    raise qsocketerror("deadline of the exchange exceeded")
+                return None
+            registry.inc('bytes_received_total', frames.HEADER.size + len(frame.ID.encode()) + len(frame.payload),
+                         node=self.role)
+            if frame.ID != self.ID:  # this message doesn't belong to this node
+                continue
+            if frame.seq != self.sequence:  # this message belongs to another exchange
+                self.stale(frame)
+                continue
+            return frame
+
+    def stale(self, frame: frames.Frame):
+        """Handle a frame of another exchange of this pair, it is discarded
+
+        Args:
+            frame (Frame): received frame
+        """
+        pass
+
+    @abc.abstractmethod
+    def exchange_parities(self, step: int, parities) -> np.ndarray:
+        """abstract method"""
+        print("exchange_parities(): Override me")
+
+    @abc.abstractmethod
+    def verify(self) -> int:
+        """abstract method"""
+        print("verify(): Override me")
 
     @abc.abstractmethod
-    def send(self, header: str, message: str):
+    def send(self, header: str, message: bytes):
         """abstract method"""
         print("send(): Override me")
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains a pool of keys generated ahead of time"""
+
+import logging
+import threading
+import time
+
+from collections import deque
+
+from .qexceptions import poolerror
+
+logger = logging.getLogger("QKDSimkit_logger")
+
+
+class KeyPool(object):
+    """Pool of keys refilled in background
+
+    When the number of keys drops below low_watermark a background thread asks the producer for new keys until the pool
+    holds high_watermark keys, keys are taken in the same order they were produced
+
+    Args:
+        producer (callable): function that takes a number of keys and returns a list of keys
+        low_watermark (int): refill starts when the pool holds fewer keys
+        high_watermark (int): the pool is refilled up to this number of keys
+        batch_size (int): maximum number of keys asked to the producer at once
+
+    Attributes:
+        hits (int): keys taken without waiting
+        misses (int): requests that found the pool empty
+        refills (int): calls to the producer
+        generated (int): keys received from the producer
+        generation_time (float): seconds spent in the producer
+        error (Exception): last error of the producer, it stops the refill
+        stopped (bool): the pool was stopped, no more keys are asked to the producer
+    """
+    def __init__(self, producer, low_watermark: int = 4, high_watermark: int = 16, batch_size: int = 16):
+        if not 0 <= low_watermark < high_watermark:
+            raise poolerror("low_watermark must be lower than high_watermark")
+        self.producer = producer
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.keys = deque()
+        self.condition = threading.Condition()
+        self.refilling = False
+        self.stopped = False
+        self.thread = None
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.generated = 0
+        self.generation_time = 0.0
+        self.error = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def start(self):
+        """Start filling the pool in background"""
+        with self.condition:
+            self._schedule_refill()
+
+    def stop(self, timeout: float = 0):
+        """Stop filling the pool, the call to the producer in progress is completed and waiting get calls fail
+
+        Args:
+            timeout (float): seconds to wait for the refill thread, None waits until it ends
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None and timeout != 0:
+            thread.join(timeout)
+
+    def get(self, timeout: float = None):
+        """Take the oldest key of the pool
+
+        Args:
+            timeout (float): seconds to wait for a key when the pool is empty, None waits forever
+        Returns:
+            key
+        """
+        with self.condition:
+            if self.keys:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._schedule_refill()
+            if not self.condition.wait_for(lambda: self.keys or self.error is not None or self.stopped, timeout):
+                raise poolerror("no keys available")
+            if not self.keys and self.stopped:
+                raise poolerror("the pool is stopped")
+            if not self.keys:
+                raise poolerror("failed to refill the pool: " + str(self.error))
+            key = self.keys.popleft()
+            self._schedule_refill()
+            return key
+
+    def stats(self) -> dict:
+        """Counters of the pool
+
+        Returns:
+            dict with depth, hits, misses, refills, generated keys and refill rate (keys per second)
+        """
+        with self.condition:
+            return {
+                'depth': len(self.keys),
+                'hits': self.hits,
+                'misses': self.misses,
+                'refills': self.refills,
+                'generated': self.generated,
+                'refill_rate': self.generated / self.generation_time if self.generation_time else 0.0,
+            }
+
+    def _schedule_refill(self):
+        """Start the refill thread if the pool is below the low watermark (condition must be held)"""
+        if self.stopped or self.refilling or (self.keys and len(self.keys) >= self.low_watermark):
+            return
+        self.refilling = True
+        self.error = None
+        self.thread = threading.Thread(target=self._refill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _refill(self):
+        """Ask the producer for keys until the high watermark is reached"""
+        try:
+            while True:
+                with self.condition:
+                    missing = 0 if self.stopped else self.high_watermark - len(self.keys)
+                if missing <= 0:
+                    break
+                start = time.monotonic()
+                keys = self.producer(min(missing, self.batch_size))
+                if not keys:
+                    raise poolerror("the producer returned no keys")
+                with self.condition:
+                    self.generation_time += time.monotonic() - start
+                    self.refills += 1
+                    self.generated += len(keys)
+                    self.keys.extend(keys)
+                    self.condition.notify_all()
+        except Exception as e:
+            logger.error("Failed to refill key pool: " + str(e))
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.refilling = False
@@ -22,4 +22,7 @@ class aliceerror(Exception):
     pass
 
 class boberror(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class poolerror(Exception):
+    pass
@@ -9,7 +9,12 @@ import logging
 import socket
 import sys
 
-from .models import Photon
+import numpy as np
+
+from . import frames, reconciliation
+from .logs import log_frame
+from .metrics import registry
+from .models import PhotonPulse
 from .node import Node
 from .qexceptions import qsocketerror
 
@@ -20,39 +25,70 @@ class Receiver(Node):
     """Receiver class, it expands node, it contains methods to communicate a sender node, it can't take action but it
     has to wait for the sender node for sending data, it can answer to a request with a message or to a message with an
     acknowledgement"""
+    corrects_errors = True
+    role = 'bob'
+
     def __init__(self, ID, size):
         super().__init__(ID, size)
+
+    def reset(self):
+        """Clear the state of the previous exchange, including sent acknowledgements and messages, the answers of the
+        previous exchange are kept because the sender may still retransmit its last request"""
+        super().reset()
+        self.previous_sequence = self.sequence
+        self.previous_acks = getattr(self, 'sent_acks', set())
+        self.previous_messages = getattr(self, 'sent_messages', {})
         self.polarization_vector = []
-        self.sent_acks = []
+        self.sent_acks = set()
         self.sent_messages = {}
 
     def measure_photon_pulse(self):
         """Measure photon pulse
 
-        given the vector that stores polarizations of received photons it creates a list of photons each polarization,
-        basis and bit will be determined byt the measure method according to physical properties, a list with the basis
-        of every photon will be stored
+        given the vector that stores polarizations of received photons it creates a pulse of photons, each polarization,
+        basis and bit will be determined by the measure method according to physical properties, the basis of every
+        photon will be stored
         """
-        for p in range(len(self.polarization_vector)):
-            self.photon_pulse.append(Photon())
-            self.photon_pulse[p].polarization = self.photon_pulse[p].measure(int(self.polarization_vector[p]))
-            self.photon_pulse[p].bit = self.photon_pulse[p].set_bit_from_measurement()
-        self.bases = [p.basis for p in self.photon_pulse]
+        self.photon_pulse = PhotonPulse.measure(self.polarization_vector)
+        self.bases = self.photon_pulse.bases
 
     def listen_quantum(self):
         """ Listen method to receive photon pulse
         it behaves like a wrapper for recv for photon pulses
         """
         try:
-            logger.info("listening to quantum channel for photon pulse...")
+            logger.debug("listening to quantum channel for photon pulse...")
             while True:
                 message = self.recv('qpulse')
-                self.polarization_vector = message.split("~")[:-1]
+                self.polarization_vector = frames.decode_polarizations(message)
                 break
         except socket.error:
             raise qsocketerror("not connected to any channel")
 
-    def recv(self, header: str) -> str:
+    def exchange_parities(self, step: int, parities) -> np.ndarray:
+        """Receive the parities of a round of Cascade and send the ones of this node
+
+        Args:
+            step (int): round of Cascade
+            parities (array): parities of this node
+        Returns:
+            parities of the other node
+        """
+        other_parities = frames.decode_bits(self.recv(frames.parities_label('alice', step)))
+        self.send(frames.parities_label('bob', step), frames.encode_bits(parities))
+        return other_parities
+
+    def verify(self) -> int:
+        """Compare the digest of the reconciled key with the one of the sender
+
+        Returns:
+            int: 1: keys are equal, 0: reconciliation failed
+        """
+        self.listen_for('alice', 'other_digest')
+        self.leaked += reconciliation.VERIFY_BITS
+        return int(np.array_equal(self.other_digest, reconciliation.digest(self.key)))
+
+    def recv(self, header: str) -> bytes:
         """Receive function for receiver node
         it listen for a message, in case the header of the received message doesn't match it checks if an acknowledgment
         for the received message has been already sent or if the received message is an acknowledgement itself for a
@@ -62,83 +98,91 @@ class Receiver(Node):
         Args:
             header (str): unique identifier of the message that has to be received
         Returns:
-            message (str): the payload of the received data, the header and some other infos are not returned
+            message (bytes): the payload of the received data, the header and some other infos are not returned
         """
         try:
-            for i in range(self.connection_attempts):  # loop for different messages
+            while True:  # loop for different messages, until the deadline of the exchange
                 received = self.recv_all()
-                if not received:
+                if received is None or self.answer_again(received, header):
                     continue
-                label = received[0]
-                if label != header and label in self.sent_acks:  # received an already received message
-                    to_be_sent = (self.ID + ':' + label + ":ack:").encode()
-                    self.socket.send(to_be_sent)
-                    logger.info("Sent: " + label + ':ack:')
-                    continue
-                elif label != header and label in self.sent_messages:  # received a request for an already sent message
-                    to_be_sent = (self.ID + ':' + label + ":" + self.sent_messages[label] + ':').encode()
-                    self.socket.send(to_be_sent)
-                    logger.info("Sent: " + label + ':' + self.sent_messages[label] + ':')
-                    continue
-                elif label == header:
-                    dec_message = received[1]
-                    to_be_sent = (self.ID + ':' + header + ":ack:").encode()
-                    self.socket.send(to_be_sent)
-                    self.sent_acks.append(label)
-                    logger.info("Received: " + label + ":" + dec_message)
+                if received.label == header:
+                    dec_message = received.payload
+                    self.send_frame(header, frames.ACK)
+                    self.sent_acks.add(header)
+                    log_frame(logger, 'received', header, dec_message)
                     return dec_message
-                else:
-                    raise Exception
-            raise ConnectionError
-
+                raise Exception("unexpected message " + received.label)
+        except qsocketerror:
+            raise
         except Exception as err:
             logger.error('Bob failed to receive {0}:\n{1}'.format(header, str(err)))
             sys.exit()
-        except ConnectionError:
-            logger.error("Bob failed to receive {0}".format(header))
-            sys.exit()
 
-    def send(self, header: str, message: str):
+    def send(self, header: str, message: bytes):
         """ Send method for receiver
         it listens for the request from the sender node, in case the header of the received message doesn't match it
         checks if an acknowledgment for the received header has been already sent or if the message for the requested
         header has been already sent, it sends a new acknowledgement in the first case and it sends again the message in
-        the other case, it sends the expected message if the header is correct, the sent message is saved in a list
+        the other case, it sends the expected message if the header is correct, the sent message is saved in a dict
 
         Args:
             header (str): unique identifier
-            message (str): message
+            message (bytes): message
         """
         try:
-            for i in range(self.connection_attempts):
+            while True:  # until the deadline of the exchange
                 received = self.recv_all()
-                if not received:
+                if received is None or self.answer_again(received, header):
                     continue
-                label = received[0]
-                if label != header and label in self.sent_acks:  # received an already received message
-                    to_be_sent = (self.ID + ':' + label + ":ack:").encode()
-                    self.socket.send(to_be_sent)
-                    logger.info("Sent: " + label + ':ack:')
-                    continue
-                elif label != header and label in self.sent_messages:  # received a request for an already sent message
-                    to_be_sent = (self.ID + ':' + label + ":" + self.sent_messages[label] + ':').encode()
-                    self.socket.send(to_be_sent)
-                    logger.info("Sent: " + label + ':' + self.sent_messages[label] + ':')
-                    continue
-                elif label == header and received[1] == 'request':
-                    data = header + ':' + message + ':'
-                    to_be_sent = (self.ID + ':' + data).encode()
-                    self.sent_messages[header] = data
-                    self.socket.send(to_be_sent)
-                    logger.info('Sent: ' + header + ':' + message)
+                if received.label == header and received.kind == frames.REQUEST:
+                    self.sent_messages[header] = message
+                    self.send_frame(header, frames.DATA, message)
+                    log_frame(logger, 'sent', header, message)
                     return
-                else:
-                    raise Exception
-            raise ConnectionError
-
-        except ConnectionError:
-            logger.error('Bob failed to send {0}'.format(header))
-            sys.exit()
+                raise Exception("unexpected message " + received.label)
+        except qsocketerror:
+            raise
         except Exception as err:
-            logger.error('Bob failed to receive {0}:\n{1}'.format(header, str(err)))
-            sys.exit()
\ No newline at end of file
+            logger.error('Bob failed to send {0}:\n{1}'.format(header, str(err)))
+            sys.exit()
+
+    def stale(self, frame: frames.Frame):
+        """Answer a retransmission of the previous exchange, other frames are discarded
+
+        Args:
+            frame (Frame): received frame
+        """
+        if frame.seq != self.previous_sequence:
+            return
+        if frame.kind == frames.REQUEST and frame.label in self.previous_messages:
+            self.send_frame(frame.label, frames.DATA, self.previous_messages[frame.label], frame.seq)
+            log_frame(logger, 'sent again', frame.label, self.previous_messages[frame.label])
+            registry.inc('retransmissions_total', node=self.role)
+        elif frame.kind == frames.DATA and frame.label in self.previous_acks:
+            self.send_frame(frame.label, frames.ACK, seq=frame.seq)
+            log_frame(logger, 'ack again', frame.label)
+            registry.inc('retransmissions_total', node=self.role)
+
+    def answer_again(self, received: frames.Frame, header: str) -> bool:
+        """Answer a retransmission of the sender, a lost ack or message is sent again
+
+        Args:
+            received (Frame): received frame
+            header (str): unique identifier of the message that is expected now
+        Returns:
+            True if the frame was a retransmission
+        """
+        label = received.label
+        if label == header:
+            return False
+        if label in self.sent_acks:  # received an already received message
+            self.send_frame(label, frames.ACK)
+            log_frame(logger, 'ack again', label)
+            registry.inc('retransmissions_total', node=self.role)
+            return True
+        if label in self.sent_messages:  # received a request for an already sent message
+            self.send_frame(label, frames.DATA, self.sent_messages[label])
+            log_frame(logger, 'sent again', label, self.sent_messages[label])
+            registry.inc('retransmissions_total', node=self.role)
+            return True
+        return False
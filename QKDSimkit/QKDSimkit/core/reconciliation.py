@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the post-processing of the sifted key
+
+    sifted key -> sample (QBER estimation) -> Cascade (error correction) -> digest (verification)
+               -> Toeplitz hashing (privacy amplification) -> key
+
+Every random choice (sampled positions, Cascade permutations, Toeplitz matrix) comes from a seed known to both nodes,
+so the two nodes run the same algorithm in lockstep and only parities have to be exchanged.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+
+PASSES = 4
+QBER_FLOOR = 0.01
+SAMPLE_FRACTION = 0.1
+VERIFY_BITS = 64
+SECURITY_MARGIN = 32
+
+
+def binary_entropy(p: float) -> float:
+    """Shannon entropy of a binary source with probability p"""
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -p * math.log2(p) - (1 - p) * math.log2(1 - p)
+
+
+def seeds(seed: int, number: int) -> list:
+    """Independent seeds for the random choices of the post-processing"""
+    return np.random.SeedSequence(seed).spawn(number)
+
+
+def sample_indices(length: int, count: int, seed) -> np.ndarray:
+    """Sorted positions of the bits revealed to estimate the QBER
+
+    Args:
+        length (int): number of sifted bits
+        count (int): number of positions
+        seed: seed of the random generator
+    Returns:
+        positions (array)
+    """
+    return np.sort(np.random.default_rng(seed).choice(length, min(count, length), replace=False))
+
+
+def digest(key) -> np.ndarray:
+    """First VERIFY_BITS bits of the SHA-256 of a key, used to check that reconciliation succeeded"""
+    data = np.packbits(np.asarray(key, dtype=np.uint8)).tobytes() + len(key).to_bytes(4, 'big')
+    return np.unpackbits(np.frombuffer(hashlib.sha256(data).digest()[:VERIFY_BITS // 8], dtype=np.uint8))
+
+
+def secure_length(length: int, qber: float, leaked: int) -> int:
+    """Number of bits left after privacy amplification
+
+    The information of an eavesdropper is bounded by length * h(qber) plus every bit disclosed during reconciliation
+
+    Args:
+        length (int): number of reconciled bits
+        qber (float): estimated quantum bit error rate
+        leaked (int): bits disclosed during reconciliation
+    Returns:
+        length of the final key
+    """
+    return max(0, int(length - math.ceil(length * binary_entropy(qber)) - leaked - SECURITY_MARGIN))
+
+
+def toeplitz_hash(key, length: int, seed) -> np.ndarray:
+    """Compress a key with a random Toeplitz matrix (a universal hash family)
+
+    The product of the (length x n) matrix with the key is a convolution, it is computed with FFTs in O(n log n)
+
+    Args:
+        key (array): bits
+        length (int): number of output bits
+        seed: seed of the random generator, the matrix is made by its first n + length - 1 bits
+    Returns:
+        compressed key (array)
+    """
+    key = np.asarray(key, dtype=np.uint8)
+    if length <= 0 or len(key) == 0:
+        return np.empty(0, dtype=np.uint8)
+    diagonal = np.random.default_rng(seed).integers(0, 2, len(key) + length - 1, dtype=np.uint8)
+    size = 1 << (len(key) + len(diagonal) - 2).bit_length()
+    product = np.fft.irfft(np.fft.rfft(diagonal, size) * np.fft.rfft(key, size), size)
+    counts = np.rint(product[len(key) - 1:len(key) - 1 + length]).astype(np.int64)
+    return (counts & 1).astype(np.uint8)
+
+
+class Cascade(object):
+    """Cascade error correction, one side keeps its key, the other one flips the wrong bits
+
+    Every round the nodes compare the parities of a list of ranges (queries): at the beginning of a pass the whole
+    blocks of a new permutation, then the first half of every block with an odd number of errors, until the error is
+    found and flipped. A flipped bit changes the parity of the blocks containing it in the previous passes, those blocks
+    are bisected again.
+
+    Args:
+        key (array): bits
+        qber (float): estimated quantum bit error rate, it sets the size of the blocks
+        seed: seed of the random permutations
+        correct (bool): True if this side flips its bits
+        passes (int): number of passes
+
+    Attributes:
+        key (array): the (corrected) key
+        leaked (int): parities disclosed
+    """
+    def __init__(self, key, qber: float, seed, correct: bool, passes: int = PASSES):
+        self.key = np.array(key, dtype=np.uint8)
+        self.correct = correct
+        self.passes = passes
+        self.leaked = 0
+        length = len(self.key)
+        first = max(2, int(0.73 / max(qber, QBER_FLOOR)))
+        # blocks of later passes are not larger than a quarter of the key, so that two errors rarely share all blocks
+        self.block_sizes = [max(2, min(first << p, length // 4)) for p in range(passes)]
+        rng = np.random.default_rng(seed)
+        self.permutations = [np.arange(length)] + [rng.permutation(length) for _ in range(passes - 1)]
+        self.positions = [np.argsort(permutation) for permutation in self.permutations]
+        self.errors = []  # for every started pass, 1 where a block has an odd number of errors
+        self.active = {}  # (pass, block) -> (start, end) range with an odd number of errors
+        self.queries = []
+
+    def block(self, p: int, b: int) -> tuple:
+        """Range of a block in the permuted order of a pass"""
+        return b * self.block_sizes[p], min((b + 1) * self.block_sizes[p], len(self.key))
+
+    def next_queries(self) -> list:
+        """Ranges (pass, start, end) whose parities have to be compared next, empty when the key is corrected"""
+        if self.active:
+            self.queries = [(p, start, (start + end) // 2) for (p, _), (start, end) in sorted(self.active.items())]
+        elif len(self.errors) < self.passes and len(self.key):
+            p = len(self.errors)
+            blocks = -(-len(self.key) // self.block_sizes[p])
+            self.queries = [(p,) + self.block(p, b) for b in range(blocks)]
+        else:
+            self.queries = []
+        return self.queries
+
+    def parities(self) -> np.ndarray:
+        """Parities of the current queries for this side"""
+        answer = np.zeros(len(self.queries), dtype=np.uint8)
+        queries = np.array(self.queries, dtype=np.int64).reshape(-1, 3)
+        for p in np.unique(queries[:, 0]):
+            selected = queries[:, 0] == p
+            cumulative = np.concatenate(([0], np.cumsum(self.key[self.permutations[p]], dtype=np.int64)))
+            answer[selected] = (cumulative[queries[selected, 2]] - cumulative[queries[selected, 1]]) & 1
+        return answer
+
+    def update(self, own, other):
+        """Compare the parities of the current queries and move to the next ranges
+
+        Args:
+            own (array): parities of this side
+            other (array): parities of the other side
+        """
+        differ = np.asarray(own, dtype=np.uint8) != np.asarray(other, dtype=np.uint8)
+        self.leaked += len(self.queries)
+        found = []
+        if not self.active:
+            p = self.queries[0][0] if self.queries else len(self.errors)
+            self.errors.append(differ.astype(np.uint8))
+            for b in np.flatnonzero(differ):
+                self.narrow(p, b, *self.block(p, b), found)
+        else:
+            for (p, start, middle), odd in zip(self.queries, differ):
+                b = start // self.block_sizes[p]
+                end = self.active[(p, b)][1]
+                if odd:
+                    self.narrow(p, b, start, middle, found)
+                else:
+                    self.narrow(p, b, middle, end, found)
+        while found:
+            toggled = set()
+            for index in np.unique(found):  # two passes may locate the same error in a round
+                if self.correct:
+                    self.key[index] ^= 1
+                for q, errors in enumerate(self.errors):
+                    b = self.positions[q][index] // self.block_sizes[q]
+                    errors[b] ^= 1
+                    toggled.add((q, b))
+            found = []
+            for q, b in sorted(toggled):
+                self.active.pop((q, b), None)
+                if self.errors[q][b]:
+                    self.narrow(q, b, *self.block(q, b), found)
+
+    def narrow(self, p: int, b: int, start: int, end: int, found: list):
+        """Keep a range with an odd number of errors, a single bit is an error"""
+        if end - start == 1:
+            self.active.pop((p, b), None)
+            found.append(self.permutations[p][start])
+        else:
+            self.active[(p, b)] = (start, end)
@@ -8,8 +8,14 @@
 import logging
 import socket
 import sys
+import time
 
-from .models import Photon
+import numpy as np
+
+from . import frames, reconciliation
+from .logs import log_frame
+from .metrics import registry
+from .models import PhotonPulse
 from .node import Node
 from .qexceptions import qsocketerror, qobjecterror
 
@@ -18,99 +24,125 @@ logger = logging.getLogger("QKDSimkit_logger")
 class Sender(Node):
     """Sender class, it expands Node, it contains methods to communicate a receiver node, the general idea is that this
     node dictate the communication and the receiver can just answer"""
+    role = 'alice'
 
     def __init__(self, ID, size: int):
         super().__init__(ID, size)
 
-    def create_photon_pulse(self) -> list:
-        """Create a list of photons given a size
+    def create_photon_pulse(self) -> PhotonPulse:
+        """Create a pulse of photons given a size
         Returns:
-             list of photons"""
-        for i in range(self.photon_pulse_size):
-            self.photon_pulse.append(Photon())
-        self.bases = [p.basis for p in self.photon_pulse]
+             pulse of photons"""
+        self.photon_pulse = PhotonPulse.create(self.photon_pulse_size)
+        self.bases = self.photon_pulse.bases
         return self.photon_pulse
 
-    def send_photon_pulse(self, pulse: list):
+    def send_photon_pulse(self, pulse: PhotonPulse):
         """Send an already created photon pulse
         it takes the polarization from each photon
 
         Args:
-            pulse (list): photon pulse to be sent
+            pulse (PhotonPulse): photon pulse to be sent
         """
-        if not isinstance(pulse, list):
-            raise qobjecterror("argument must be list")
+        if not isinstance(pulse, PhotonPulse):
+            raise qobjecterror("argument must be PhotonPulse")
         try:
-            message = ''
-            for p in range(len(pulse)):
-                message += str(pulse[p].polarization) + "~"
-            self.send("qpulse", message)
+            self.send("qpulse", frames.encode_polarizations(pulse.polarizations))
         except socket.error:
             raise qsocketerror("not connected to any channel")
 
     def generate_reconciled_key(self):
         """Generate a common key between the two parties
 
-        it checks for every photon if the chosen basis is common, if it is not common the basis is discarded
+        it checks for every photon if the chosen basis is common, the result is a mask with 1 for common bases
         """
-        if len(self.bases) != len(self.other_bases):
+        other_bases = np.asarray(self.other_bases, dtype=np.uint8)
+        if len(self.bases) != len(other_bases):
             raise qobjecterror("both pulses must contain the same amount of photons")
         else:
-            for i in range(len(self.bases)):
-                if self.bases[i] == self.other_bases[i]:
-                    self.reconciled_key.append(self.bases[i])
-                else:
-                    self.reconciled_key.append("")
+            self.reconciled_key = (self.bases == other_bases).astype(np.uint8)
+
+    def exchange_parities(self, step: int, parities) -> np.ndarray:
+        """Send the parities of a round of Cascade and receive the ones of the receiver
+
+        Args:
+            step (int): round of Cascade
+            parities (array): parities of this node
+        Returns:
+            parities of the other node
+        """
+        self.send(frames.parities_label('alice', step), frames.encode_bits(parities))
+        return frames.decode_bits(self.recv(frames.parities_label('bob', step)))
+
+    def verify(self) -> int:
+        """Send the digest of the reconciled key, the receiver compares it with its own one
+
+        Returns:
+            1, the result of the comparison is known by the receiver
+        """
+        self.send('alice-other_digest', frames.encode_bits(reconciliation.digest(self.key)))
+        self.leaked += reconciliation.VERIFY_BITS
+        return 1
 
-    def send(self, header: str, message: str):
+    def send(self, header: str, message: bytes):
         """Sender method for sender node
-        it sends a message and wait for an acknowledgment if it doesn't receive the ack in the given time
-        timeout_in_seconds it may try multiple times depending on the variable connection_attempts
+        it sends a message and wait for an acknowledgment, if it doesn't receive the ack before the retransmission
+        timeout it sends the message again with a longer timeout, until the deadline of the exchange
 
         Args:
             header (str): unique identifier
-            message (str): string to be sent
+            message (bytes): payload to be sent
         """
         try:
-            data = header + ':' + message + ':'
-            to_be_sent = (self.ID + ':' + data).encode()
-            for i in range(self.connection_attempts):
-                self.socket.send(to_be_sent)
-                logger.info('Sent: ' + header + ':' + message)
-                received = self.recv_all()
-                if not received:
-                    continue
-                if received[0] == header and received[1] == 'ack':
-                    return
-            raise ConnectionError
+            self.transmit(header, frames.DATA, message, frames.ACK)
+        except qsocketerror:
+            raise
         except Exception as err:
             logger.error('Alice failed to send {0}:\n{1}'.format(header, str(err)))
             sys.exit()
-        except ConnectionError as e:
-            logger.error('Alice tried to receive too many times \n' + str(e))
-            sys.exit()
 
     def recv(self, header: str):
         """Receiver method for sender node
-        It will send a request message with the given header and it will wait for the response for a time
-        timeout_in_seconds it may try multiple times depending on the variable connection_attempts, every received
-        message with a different header will be discarded
+        It will send a request message with the given header and it will wait for the response, the request is sent
+        again at every retransmission timeout until the deadline of the exchange, every received message with a
+        different header will be discarded
 
         Args:
             header (str): unique identifier
         """
-        try:
-            for i in range(self.connection_attempts):
-                to_be_sent = (self.ID + ':' + header + ':request:').encode()
-                self.socket.send(to_be_sent)
-                received = self.recv_all()
-                if not received:
-                    continue
-                if received[0] == header:
-                    dec_message = received[1]
-                    logger.info("Received: " + header + ":" + dec_message)
-                    return dec_message
-            raise ConnectionError
-        except ConnectionError:
-            raise qsocketerror("Alice tried to receive too many times ")
+        return self.transmit(header, frames.REQUEST, b'', frames.DATA).payload
+
+    def transmit(self, header: str, kind: int, payload: bytes, answer: int) -> frames.Frame:
+        """Send a frame until the receiver answers
+
+        the round trip time of frames answered at the first attempt updates the retransmission timer, other frames
+        received in the meanwhile don't trigger a retransmission
 
+        Args:
+            header (str): unique identifier
+            kind (int): DATA or REQUEST
+            payload (bytes): payload to be sent
+            answer (int): kind of the expected answer, ACK or DATA
+        Returns:
+            answer (Frame)
+        """
+        sent = time.monotonic()
+        retransmitted = False
+        self.send_frame(header, kind, payload)
+        log_frame(logger, 'sent', header, payload)
+        retry_at = sent + self.timer.timeout()
+        while True:
+            received = self.recv_all(retry_at - time.monotonic())
+            if received is None:
+                self.timer.expired()
+                registry.inc('retransmissions_total', node=self.role)
+                retransmitted = True
+                self.send_frame(header, kind, payload)
+                log_frame(logger, 'sent again', header, payload)
+                retry_at = time.monotonic() + self.timer.timeout()
+            elif received.label == header and received.kind == answer:
+                elapsed = time.monotonic() - sent
+                if not retransmitted:
+                    self.timer.sample(elapsed)
+                log_frame(logger, 'answered', header, received.payload, elapsed)
+                return received
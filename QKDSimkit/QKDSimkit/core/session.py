@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module keeps a node connected to the channel across many key exchanges"""
+
+import time
+
+from .node import Node
+
+
+class Session(object):
+    """Persistent connection to the channel, every exchange run over it has its own sequence number so that late
+    frames of a previous exchange are discarded
+
+    Args:
+        node (Node): sender or receiver
+        channel_address (str): channel address [host:port]
+        timeout (float): seconds available for the whole session, None to bound only every exchange
+
+    Attributes:
+        node (Node): sender or receiver
+        exchanges (int): number of exchanges started in this session
+        deadline (float): monotonic time at which the session fails, None if not bounded
+    """
+    def __init__(self, node: Node, channel_address: str, timeout: float = None):
+        self.node = node
+        self.channel_address = channel_address
+        self.exchanges = 0
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def connect(self):
+        """Connect the node to the channel"""
+        channelIP, channelPort = self.channel_address.split(':')
+        self.node.connect_to_channel(channelIP, int(channelPort))
+
+    def next_exchange(self) -> Node:
+        """Prepare the node for a new exchange
+
+        Returns:
+            node with a clean state, a new sequence number and a deadline that does not exceed the one of the session
+        """
+        self.node.reset()
+        if self.deadline is not None:
+            self.node.deadline = min(self.node.deadline, self.deadline)
+        self.node.sequence = self.exchanges
+        self.exchanges += 1
+        return self.node
+
+    def close(self):
+        """Close the connection to the channel"""
+        self.node.socket.close()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the storage of users, proofs, keys and pool counters used by the server
+
+Every operation is a single atomic command on a per-user structure, so no distributed lock is needed:
+
+    <namespace>:users          hash  hash of token -> token
+    <namespace>:proof          hash  hash of token -> hash of proof
+    <namespace>:keys:<ID>      list  keys of a user in the order they were generated
+    <namespace>:stats:<ID>     hash  pool counters of a user
+    <namespace>:value:<name>   string
+"""
+
+import asyncio
+
+from collections import deque
+
+import aioredis
+
+# pops number keys only if the list holds enough of them, all or nothing
+POP_KEYS_SCRIPT = """
+local number = tonumber(ARGV[1])
+if number < 1 or redis.call('LLEN', KEYS[1]) < number then
+    return false
+end
+local keys = redis.call('LRANGE', KEYS[1], 0, number - 1)
+redis.call('LTRIM', KEYS[1], number, -1)
+return keys
+"""
+
+STATS = ('hits', 'misses', 'generated', 'generation_time')
+
+
+class LocalStore(object):
+    """In-process store, it stands in for Redis in tests and single process deployments"""
+    def __init__(self):
+        self.users = {}
+        self.proofs = {}
+        self.keys = {}
+        self.stats = {}
+        self.values = {}
+
+    async def add_user(self, hashed: str, token: str):
+        """Save the token of a user"""
+        self.users[hashed] = token
+
+    async def get_user(self, hashed: str):
+        """Token of a user, None if unknown"""
+        return self.users.get(hashed)
+
+    async def set_proof(self, hashed: str, hash_proof: str):
+        """Save the hash of the proof sent to a user"""
+        self.proofs[hashed] = hash_proof
+
+    async def get_proof(self, hashed: str):
+        """Hash of the proof sent to a user"""
+        return self.proofs.get(hashed)
+
+    async def push_keys(self, ID: str, keys: list):
+        """Append keys to the pool of a user"""
+        self.keys.setdefault(ID, deque()).extend(keys)
+
+    async def pop_keys(self, ID: str, number: int):
+        """Take the oldest number keys of a user, None if there are not enough keys or number is not positive"""
+        pool = self.keys.get(ID)
+        if pool is None or number < 1 or len(pool) < number:
+            return None
+        return [pool.popleft() for _ in range(number)]
+
+    async def all_keys(self) -> dict:
+        """Keys of every user"""
+        return {ID: list(pool) for ID, pool in self.keys.items()}
+
+    async def depth(self, ID: str) -> int:
+        """Number of keys in the pool of a user"""
+        return len(self.keys.get(ID, ()))
+
+    async def incr_stats(self, ID: str, **counters):
+        """Add values to the pool counters of a user"""
+        stats = self.stats.setdefault(ID, dict.fromkeys(STATS, 0))
+        for name, value in counters.items():
+            stats[name] += value
+
+    async def all_stats(self) -> dict:
+        """Pool counters of every user"""
+        return {ID: dict(stats) for ID, stats in self.stats.items()}
+
+    async def set(self, name: str, value: str):
+        """Save a value"""
+        self.values[name] = value
+
+    async def get(self, name: str):
+        """Retrieve a value"""
+        return self.values.get(name)
+
+    async def close(self):
+        """Nothing to release"""
+
+
+class RedisStore(object):
+    """Redis store, the connection pool is created on first use in every event loop, code that runs its own event loop
+    closes the pool with close before the loop ends
+
+    Args:
+        address (str): redis address (redis://host:port)
+        namespace (str): prefix of every key
+    """
+    def __init__(self, address: str = 'redis://localhost:6379', namespace: str = 'QKDSimkit_server'):
+        self.address = address
+        self.namespace = namespace
+        self.redis = None
+        self.loop = None
+
+    async def connection(self):
+        """Redis connection pool of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.redis is None or self.loop is not loop:
+            if self.redis is not None and not self.loop.is_closed():
+                self.redis.close()
+            self.redis = await aioredis.create_redis_pool(self.address, encoding='utf-8')
+            self.loop = loop
+        return self.redis
+
+    async def close(self):
+        """Close the connection pool of the running event loop"""
+        if self.redis is not None and self.loop is asyncio.get_running_loop():
+            self.redis.close()
+            await self.redis.wait_closed()
+        self.redis = None
+        self.loop = None
+
+    def key(self, *parts) -> str:
+        """Name of a redis key in the namespace"""
+        return ':'.join((self.namespace,) + parts)
+
+    async def add_user(self, hashed: str, token: str):
+        """Save the token of a user"""
+        await (await self.connection()).hset(self.key('users'), hashed, token)
+
+    async def get_user(self, hashed: str):
+        """Token of a user, None if unknown"""
+        return await (await self.connection()).hget(self.key('users'), hashed)
+
+    async def set_proof(self, hashed: str, hash_proof: str):
+        """Save the hash of the proof sent to a user"""
+        await (await self.connection()).hset(self.key('proof'), hashed, hash_proof)
+
+    async def get_proof(self, hashed: str):
+        """Hash of the proof sent to a user"""
+        return await (await self.connection()).hget(self.key('proof'), hashed)
+
+    async def push_keys(self, ID: str, keys: list):
+        """Append keys to the pool of a user"""
+        if keys:
+            await (await self.connection()).rpush(self.key('keys', ID), *keys)
+
+    async def pop_keys(self, ID: str, number: int):
+        """Take the oldest number keys of a user, None if there are not enough keys or number is not positive"""
+        if number < 1:
+            return None
+        keys = await (await self.connection()).eval(POP_KEYS_SCRIPT, keys=[self.key('keys', ID)], args=[number])
+        return keys or None
+
+    async def all_keys(self) -> dict:
+        """Keys of every user"""
+        redis = await self.connection()
+        prefix = self.key('keys', '')
+        answer = {}
+        async for name in redis.iscan(match=prefix + '*'):
+            answer[name[len(prefix):]] = await redis.lrange(name, 0, -1)
+        return answer
+
+    async def depth(self, ID: str) -> int:
+        """Number of keys in the pool of a user"""
+        return await (await self.connection()).llen(self.key('keys', ID))
+
+    async def incr_stats(self, ID: str, **counters):
+        """Add values to the pool counters of a user"""
+        transaction = (await self.connection()).multi_exec()
+        for name, value in counters.items():
+            if isinstance(value, float):
+                transaction.hincrbyfloat(self.key('stats', ID), name, value)
+            else:
+                transaction.hincrby(self.key('stats', ID), name, value)
+        await transaction.execute()
+
+    async def all_stats(self) -> dict:
+        """Pool counters of every user"""
+        redis = await self.connection()
+        prefix = self.key('stats', '')
+        answer = {}
+        async for name in redis.iscan(match=prefix + '*'):
+            stats = dict.fromkeys(STATS, 0)
+            for field, value in (await redis.hgetall(name)).items():
+                stats[field] = float(value) if field == 'generation_time' else int(value)
+            answer[name[len(prefix):]] = stats
+        return answer
+
+    async def set(self, name: str, value: str):
+        """Save a value"""
+        await (await self.connection()).set(self.key('value', name), value)
+
+    async def get(self, name: str):
+        """Retrieve a value"""
+        return await (await self.connection()).get(self.key('value', name))
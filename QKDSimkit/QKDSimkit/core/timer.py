@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains the retransmission timer of the nodes
+
+The timeout follows the round trip time measured on the channel (RFC 6298): RTO = SRTT + 4 * RTTVAR, it doubles at every
+retransmission of a message and a random jitter is added so that many pairs do not retransmit at the same time. The
+round trip of a retransmitted message is ambiguous and it is not sampled (Karn's algorithm).
+"""
+
+import random
+
+INITIAL_RTO = 0.2
+MIN_RTO = 0.01
+MAX_RTO = 2.0
+JITTER = 0.25
+ALPHA = 1 / 8
+BETA = 1 / 4
+
+
+class RetransmissionTimer(object):
+    """Round trip time estimator with exponential backoff
+
+    Args:
+        initial (float): timeout before the first sample (seconds)
+        minimum (float): lower bound of the timeout (seconds)
+        maximum (float): upper bound of the timeout, also after backoff (seconds)
+        jitter (float): maximum random increase of a timeout, as a fraction of it
+
+    Attributes:
+        srtt (float): smoothed round trip time, None before the first sample
+        rttvar (float): round trip time variation
+        rto (float): current timeout without backoff
+        retransmissions (int): number of timeouts
+    """
+    def __init__(self, initial: float = INITIAL_RTO, minimum: float = MIN_RTO, maximum: float = MAX_RTO,
+                 jitter: float = JITTER):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.jitter = jitter
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = initial
+        self.backoff = 1
+        self.retransmissions = 0
+
+    def sample(self, rtt: float):
+        """Update the estimate with the round trip time of a message that was sent once"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.rto = min(self.maximum, max(self.minimum, self.srtt + 4 * self.rttvar))
+        self.backoff = 1
+
+    def timeout(self) -> float:
+        """Time to wait for an answer before retransmitting"""
+        return min(self.maximum, self.rto * self.backoff) * (1 + self.jitter * random.random())
+
+    def expired(self):
+        """A message was not answered in time, the next timeout is doubled"""
+        self.retransmissions += 1
+        self.backoff = min(self.backoff * 2, 1 << 10)
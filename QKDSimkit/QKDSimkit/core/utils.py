@@ -7,8 +7,15 @@
 
 import base64
 import hashlib
+import hmac
 import logging
 import os
+import threading
+import time
+
+from collections import OrderedDict
+
+import numpy as np
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
@@ -21,19 +28,13 @@ def validate(shared_key: list, other_shared_key: list) -> float:
     """It compares two keys to find differences
 
     Args:
-        shared_key (str): first key
-        other_shared_key (str): second key
+        shared_key (list): first key
+        other_shared_key (list): second key
     Returns:
         percent of equal elements in the two keys
     """
     if len(shared_key) > 0 and len(shared_key) == len(other_shared_key):
-        i = 0
-        count = 0
-        while i < len(shared_key):
-            if shared_key[i] == other_shared_key[i]:
-                count += 1
-            i += 1
-        return count / len(shared_key)
+        return float(np.mean(np.asarray(shared_key) == np.asarray(other_shared_key)))
     else:
         logging.error("Error")
         return -1
@@ -79,8 +80,68 @@ def hash_token(token: str):
     return h.hexdigest()
 
 
-def generate_token(password):
-    """Generates a common token"""
+class TokenCache(object):
+    """Bounded memo of derived tokens, entries expire after ttl seconds and the least recently used entry is evicted
+    when the cache is full, passwords are never stored: entries are indexed by a keyed hash of the password
+
+    Args:
+        maxsize (int): maximum number of entries
+        ttl (float): lifetime of an entry in seconds
+
+    Attributes:
+        hits (int): derivations saved
+        misses (int): derivations computed
+    """
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.secret = os.urandom(32)
+        self.hits = 0
+        self.misses = 0
+
+    def index(self, password: str) -> str:
+        """Keyed hash of a password"""
+        return hmac.new(self.secret, password.encode(), hashlib.sha256).hexdigest()
+
+    def get(self, password: str):
+        """Cached token of a password, None if missing or expired"""
+        index = self.index(password)
+        with self.lock:
+            entry = self.entries.get(index)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(index, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(index)
+            self.hits += 1
+            return entry[0]
+
+    def stats(self) -> dict:
+        """Counters of the cache
+
+        Returns:
+            dict with cached entries, derivations computed and derivations saved
+        """
+        with self.lock:
+            return {'size': len(self.entries), 'derivations': self.misses, 'derivations_saved': self.hits}
+
+    def put(self, password: str, token: str):
+        """Save the token of a password"""
+        index = self.index(password)
+        with self.lock:
+            self.entries[index] = (token, time.monotonic() + self.ttl)
+            self.entries.move_to_end(index)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+def derive_token(password: str) -> str:
+    """Derives a common token with PBKDF2, it is slow on purpose, use generate_token"""
     salt = b'1234567890123456'
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
@@ -89,3 +150,12 @@ def generate_token(password):
         iterations=390000,
     )
     return base64.urlsafe_b64encode(kdf.derive(password.encode())).decode()
+
+
+def generate_token(password):
+    """Generates a common token, derived tokens are cached in token_cache"""
+    token = token_cache.get(password)
+    if token is None:
+        token = derive_token(password)
+        token_cache.put(password, token)
+    return token
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""This module contains a bounded pool of workers for key exchanges
+
+The socket code of alice and bob is blocking, exchanges are run in worker threads so that the event loop of the servers
+stays free. The number of exchanges in flight is limited globally (threads of the pool) and for every user (exchanges
+of a user above the limit wait in a queue without holding a thread).
+"""
+
+import asyncio
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger("QKDSimkit_logger")
+
+MAX_EXCHANGES = 64
+MAX_USER_EXCHANGES = 8
+
+
+def exchange_ids(ID: str, number: int, parallel: int = 1) -> list:
+    """Split a request of keys in exchanges that can run at the same time
+
+    every exchange needs its own pair ID, otherwise the channel would mix the frames of two exchanges, both nodes must
+    call this function with the same arguments
+
+    Args:
+        ID (str): identifier of alice-bob pair
+        number (int): number of keys
+        parallel (int): number of exchanges
+    Returns:
+        list of (pair ID, number of keys)
+    """
+    parallel = max(1, min(parallel, number))
+    if parallel == 1:
+        return [(ID, number)]
+    return [('{0}-{1}'.format(ID, i), number // parallel + (i < number % parallel)) for i in range(parallel)]
+
+
+class ExchangePool(object):
+    """Thread pool with a global and a per user limit of exchanges in flight
+
+    Args:
+        max_workers (int): maximum number of exchanges running at the same time
+        max_user_workers (int): maximum number of exchanges of a single user running at the same time
+    """
+    def __init__(self, max_workers: int = MAX_EXCHANGES, max_user_workers: int = MAX_USER_EXCHANGES):
+        self.max_workers = max_workers
+        self.max_user_workers = max_user_workers
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='exchange')
+        self.lock = threading.Lock()
+        self.pending = {}  # user -> queue of (future, function, args, kwargs)
+        self.running = {}  # user -> number of exchanges in flight
+
+    def submit(self, user: str, function, *args, **kwargs) -> Future:
+        """Schedule an exchange of a user, it never blocks
+
+        Args:
+            user (str): identifier of the user, it is used for the per user limit
+            function (callable): blocking function, e.g. alice.import_keys
+        Returns:
+            future of the result of function
+        """
+        future = Future()
+        with self.lock:
+            self.pending.setdefault(user, deque()).append((future, function, args, kwargs))
+            self._dispatch(user)
+        return future
+
+    async def run(self, user: str, function, *args, **kwargs):
+        """Run an exchange of a user without blocking the event loop
+
+        Returns:
+            result of function
+        """
+        return await asyncio.wrap_future(self.submit(user, function, *args, **kwargs))
+
+    def map(self, user: str, function, calls: list) -> list:
+        """Run many exchanges of a user and wait for all of them
+
+        Args:
+            user (str): identifier of the user
+            function (callable): blocking function
+            calls (list): keyword arguments of every call
+        Returns:
+            results in the same order of calls
+        """
+        return [future.result() for future in [self.submit(user, function, **kwargs) for kwargs in calls]]
+
+    def stats(self) -> dict:
+        """Exchanges running and waiting for every user"""
+        with self.lock:
+            users = set(self.running) | set(self.pending)
+            return {user: {'running': self.running.get(user, 0), 'queued': len(self.pending.get(user, ()))}
+                    for user in users}
+
+    def shutdown(self):
+        """Stop the workers after the running exchanges"""
+        self.executor.shutdown(wait=False)
+
+    def _dispatch(self, user: str):
+        """Start the queued exchanges of a user up to the limit (lock must be held)"""
+        queue = self.pending.get(user)
+        while queue and self.running.get(user, 0) < self.max_user_workers:
+            future, function, args, kwargs = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.running[user] = self.running.get(user, 0) + 1
+            self.executor.submit(self._run, user, future, function, args, kwargs)
+        if queue is not None and not queue:
+            del self.pending[user]
+
+    def _run(self, user: str, future: Future, function, args: tuple, kwargs: dict):
+        """Run an exchange in a worker thread"""
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:  # alice and bob may call sys.exit, it must not stop the caller
+            logger.error("Exchange of {0} failed: {1}".format(user, repr(e)))
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("exchange aborted: " + repr(e)))
+        else:
+            future.set_result(result)
+        finally:
+            with self.lock:
+                self.running[user] -= 1
+                if not self.running[user]:
+                    del self.running[user]
+                self._dispatch(user)
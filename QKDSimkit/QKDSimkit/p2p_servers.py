@@ -21,13 +21,18 @@ from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 import QKDSimkit.core as core
+from QKDSimkit.core.metrics import registry, export_pool
 from QKDSimkit.core.qexceptions import aliceerror, cacheerror
+from QKDSimkit.core.workers import ExchangePool
 
 logger = logging.getLogger("QKDSimkit")
 
 
 cache = Cache(Cache.REDIS, endpoint="localhost", port=6379, namespace="p2p_server")
 
+# key exchanges run in worker threads, the event loop only waits for their results
+exchanges = ExchangePool()
+
 
 alice_app = FastAPI()
 bob_app = FastAPI()
@@ -37,7 +42,7 @@ async def answer_get(number: int, size: int, ID: str, type: str):
     """Starts a node
 
     Args:
-        number (int): number of keys
+        number (int): number of keys, they are all obtained from a single photon pulse
         size (int): size of keys (bits)
         ID (str): identifier of a pair of nodes
         type (str): alice or bob (sender or receiver)
@@ -45,21 +50,16 @@ async def answer_get(number: int, size: int, ID: str, type: str):
         keys
     """
     answer = {}
-    keys = []
     try:
         address = await cache.get("channel_address")
     except Exception:
         logger.error("Failed to retrieve address from cache")
         sys.exit()
     try:
-        for i in range(number):
-            if type == 'Alice':
-                key = core.alice.import_key(channel_address=address, ID=ID, size=size)
-            if type == 'Bob':
-                key = core.bob.import_key(channel_address=address, ID=ID, size=size)
-            if key != -1:
-                keys.append({"key_ID": i, "key": key})
-        answer["keys"] = keys
+        procedure = core.alice.import_keys if type == 'Alice' else core.bob.import_keys
+        keys = await exchanges.run(ID, procedure, channel_address=address, ID=ID, size=size, number=number,
+                                   batch_size=number)
+        answer["keys"] = [{"key_ID": i, "key": key} for i, key in enumerate(keys)]
         return answer
     except aliceerror as e:
         logger.error(type + " failed to exchange key: " + e)
@@ -71,7 +71,7 @@ async def root(number: int = 1, size: int = 256, ID: str = 'id'):
     """http request handler for alice
 
         Args:
-            number (int): number of keys
+            number (int): number of keys, they are all obtained from a single photon pulse
             size (int): size of keys (bits)
             ID (str): identifier of a pair of nodes
         Returns:
@@ -88,7 +88,7 @@ async def root(number: int = 1, size: int = 256, ID: str = 'id'):
     """http request handler for bob
 
         Args:
-            number (int): number of keys
+            number (int): number of keys, they are all obtained from a single photon pulse
             size (int): size of keys (bits)
             ID (str): identifier of a pair of nodes
         Returns:
@@ -99,6 +99,17 @@ async def root(number: int = 1, size: int = 256, ID: str = 'id'):
     except Exception:
         return Response(status_code=500, content='Internal server error')
 
+@alice_app.get("/metrics")
+@bob_app.get("/metrics")
+async def metrics():
+    """Metrics of the key exchanges and of the exchange pool
+
+        Returns:
+            metrics in the Prometheus text format
+    """
+    export_pool(exchanges)
+    return Response(content=registry.render(), media_type='text/plain; version=0.0.4')
+
 origins = [
     "*"
 ]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Compares the in-process and the Redis store on the server key path (push a batch, pop keys one by one)
+
+Usage: python benchmarks/store_benchmark.py [-r redis://localhost:6379] [-u users] [-k keys]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from QKDSimkit.core.store import LocalStore, RedisStore
+
+
+async def run(store, users: int, keys: int) -> dict:
+    """Push keys for every user and pop all of them
+
+    Args:
+        store: LocalStore or RedisStore
+        users (int): number of users
+        keys (int): keys per user
+    Returns:
+        operations per second for push and pop
+    """
+    start = time.perf_counter()
+    await asyncio.gather(*[store.push_keys('bench-{0}'.format(u), ['key-{0}'.format(k) for k in range(keys)])
+                           for u in range(users)])
+    push_time = time.perf_counter() - start
+
+    async def consume(ID):
+        for _ in range(keys):
+            await store.pop_keys(ID, 1)
+            await store.incr_stats(ID, hits=1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[consume('bench-{0}'.format(u)) for u in range(users)])
+    pop_time = time.perf_counter() - start
+    return {'push_batches_per_s': users / push_time, 'pops_per_s': users * keys / pop_time}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of QKDSimkit stores')
+    parser.add_argument('-r', '--redis', default='redis://localhost:6379', help='Redis address (default: %(default)s)')
+    parser.add_argument('-u', '--users', default=100, type=int, help='Number of users (default: %(default)s)')
+    parser.add_argument('-k', '--keys', default=100, type=int, help='Keys per user (default: %(default)s)')
+    args = parser.parse_args()
+
+    results = {'local': asyncio.run(run(LocalStore(), args.users, args.keys))}
+    try:
+        results['redis'] = asyncio.run(run(RedisStore(args.redis, namespace='QKDSimkit_benchmark'), args.users,
+                                           args.keys))
+    except OSError as e:
+        results['redis'] = 'unavailable: ' + str(e)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the benchmark of key exchanges"""
+
+from QKDSimkit.Benchmark import run_benchmark
+
+
+def test_benchmark_report():
+    """Test that every configuration is run and measured"""
+    report = run_benchmark(pairs=2, sizes=(64,), batches=(1, 2), eves=(False, True), exchanges=2, seed=3)
+    results = report['results']
+    assert [(r['batch'], r['eve']) for r in results] == [(1, False), (1, True), (2, False), (2, True)]
+    for result in results:
+        if result['eve']:
+            assert result['keys'] == 0 and result['aborted'] == 2
+            assert result['bytes_per_key'] is None
+        else:
+            assert result['keys'] == 2 * 2 * result['batch'] and result['aborted'] == 0
+            assert result['latency_ms']['p50'] <= result['latency_ms']['p95'] <= result['latency_ms']['p99']
+            assert result['bits_per_second'] > 0
+            assert result['bytes_received'] > 0 and result['bytes_sent'] > 0
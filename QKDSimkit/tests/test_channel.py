@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the channel implementations"""
+
+import base64
+import socket
+import time
+
+from threading import Thread
+
+import pytest
+
+from QKDSimkit.core import alice, bob, channel
+from QKDSimkit.core.workers import ExchangePool, exchange_ids
+
+
+def free_port() -> int:
+    """Ask the OS for an unused port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.parametrize('engine', [channel.public_channel, channel.async_channel])
+def test_pairs_share_channel(engine):
+    """Test that two alice-bob pairs exchange the same keys on a single channel"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=engine(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    keys = {}
+
+    def run(name, procedure, ID):
+        keys[name] = procedure(address, ID, 64)
+
+    threads = []
+    for ID in ['id1', 'id2']:
+        threads.append(Thread(target=run, args=(('a', ID), alice.import_key, ID)))
+        threads.append(Thread(target=run, args=(('b', ID), bob.import_key, ID)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert keys[('a', 'id1')] == keys[('b', 'id1')]
+    assert keys[('a', 'id2')] == keys[('b', 'id2')]
+
+
+def test_session_many_keys():
+    """Test that many keys are exchanged over a single connection per node"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=channel.async_channel(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    keys = {}
+
+    def run(name, procedure):
+        keys[name] = procedure(address, 'id', 64, 10)
+
+    threads = [Thread(target=run, args=('a', alice.import_keys)), Thread(target=run, args=('b', bob.import_keys))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert keys['a'] == keys['b']
+    assert len(set(keys['a'])) == 10
+
+
+def test_batch_keys():
+    """Test that a batch of keys is obtained from a single photon pulse"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=channel.async_channel(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    keys = {}
+
+    def run(name, procedure):
+        keys[name] = procedure(address, 'id', 64, 7, batch_size=4)
+
+    threads = [Thread(target=run, args=('a', alice.import_keys)), Thread(target=run, args=('b', bob.import_keys))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert keys['a'] == keys['b']
+    assert len(set(keys['a'])) == 7
+    assert all(len(base64.urlsafe_b64decode(key)) == 8 for key in keys['a'])
+
+
+def test_noisy_channel():
+    """Test that errors of a noisy channel are corrected instead of discarding the exchange"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=channel.async_channel(address, 0.0, False, ['depolarizing:0.04'], 1).initiate_channel,
+           daemon=True).start()
+    time.sleep(0.2)
+    keys = {}
+
+    def run(name, procedure):
+        keys[name] = procedure(address, 'id', 256, 4, batch_size=4)
+
+    threads = [Thread(target=run, args=('a', alice.import_keys)), Thread(target=run, args=('b', bob.import_keys))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert keys['a'] == keys['b']
+    assert len(set(keys['a'])) == 4
+
+
+def test_parallel_exchanges():
+    """Test that parallel exchanges of a single user use different pair IDs on the channel"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=channel.async_channel(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    calls = [{'channel_address': address, 'ID': pair_ID, 'size': 64, 'number': count, 'batch_size': count}
+             for pair_ID, count in exchange_ids('id', 10, 4)]
+    alice_keys = ExchangePool(4, 4).submit('id', ExchangePool(4, 4).map, 'id', alice.import_keys, calls)
+    bob_keys = ExchangePool(4, 4).map('id', bob.import_keys, calls)
+
+    assert alice_keys.result(30) == bob_keys
+    assert sum(len(keys) for keys in bob_keys) == 10
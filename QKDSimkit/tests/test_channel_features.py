@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+import numpy as np
+import pytest
+
+from QKDSimkit.core import channel_features
+from QKDSimkit.core.models import PhotonPulse
+from QKDSimkit.core.qexceptions import qnoiseerror
+
+SIZE = 200000
+
+
+def qber(sent, received):
+    """Error rate of bob's bits when he measures in the right basis"""
+    measured = PhotonPulse.measure(received, np.random.default_rng(0))
+    sifted = measured.bases == (sent >> 1)
+    return np.mean(measured.bits[sifted] != (sent & 1)[sifted])
+
+
+@pytest.mark.parametrize('spec', ['depolarizing:0.1', 'bitflip:0.1', 'loss:10', 'intercept_resend:0.5'])
+def test_models_are_deterministic(spec):
+    pulse = PhotonPulse.create(1000, np.random.default_rng(1)).polarizations
+    first = channel_features.parse_noise_model(spec, seed=7)(pulse)
+    second = channel_features.parse_noise_model(spec, seed=7)(pulse)
+    assert np.array_equal(first, second)
+
+
+@pytest.mark.parametrize('model, expected', [
+    (channel_features.Depolarizing(0.2, seed=1), 0.1),
+    (channel_features.BitFlip(0.1, seed=1), 0.1),
+    (channel_features.Loss(10, attenuation=0.2, seed=1), (1 - 10 ** -0.2) / 2),
+    (channel_features.InterceptResend(0.4, seed=1), 0.1),
+])
+def test_models_error_rate(model, expected):
+    sent = PhotonPulse.create(SIZE, np.random.default_rng(2)).polarizations
+    assert qber(sent, model(sent)) == pytest.approx(expected, abs=0.01)
+
+
+def test_build_models():
+    models = channel_features.build_models(0.05, True, ['loss:5'], seed=3)
+    assert [type(model) for model in models] == [channel_features.InterceptResend, channel_features.Depolarizing,
+                                                 channel_features.Loss]
+    assert channel_features.build_models() == []
+
+
+def test_parse_noise_model_errors():
+    with pytest.raises(qnoiseerror):
+        channel_features.parse_noise_model('unknown:1')
+    with pytest.raises(qnoiseerror):
+        channel_features.parse_noise_model('loss:far')
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the binary frame format"""
+
+import socket
+
+import numpy as np
+import pytest
+
+from QKDSimkit.core import frames
+from QKDSimkit.core.models import PhotonPulse
+from QKDSimkit.core.qexceptions import qobjecterror, qsocketerror
+
+
+def test_frame_round_trip():
+    """Test that a frame is parsed back with the same fields"""
+    left, right = socket.socketpair()
+    left.sendall(frames.pack_frame('id', 'bob-other_bases', frames.REQUEST, b'payload', 7))
+    frame = frames.FrameReader(right).read(1)
+    left.close()
+    right.close()
+
+    assert frame == frames.Frame('id', 'bob-other_bases', frames.REQUEST, 7, b'payload')
+
+
+def test_reader_split_and_leftover():
+    """Test that frames split across reads are reassembled and the bytes of the next frame are kept"""
+    first = frames.pack_frame('id', 'qpulse', frames.DATA, bytes(5000))
+    second = frames.pack_frame('id', 'qpulse', frames.ACK)
+    data = first + second[:4]
+    reader = frames.FrameReader(None)
+    for i in range(0, len(data), 1000):
+        reader.feed(data[i:i + 1000])
+
+    assert len(reader.frames) == 1
+    assert bytes(reader.buffer) == second[:4]
+
+    reader.feed(second[4:])
+
+    assert [frame.kind for frame in reader.frames] == [frames.DATA, frames.ACK]
+    assert reader.frames[0].payload == bytes(5000)
+    assert len(reader.buffer) == 0
+
+
+def test_reader_timeout():
+    """Test that read returns None when no complete frame arrives in time"""
+    left, right = socket.socketpair()
+    left.sendall(frames.pack_frame('id', 'qpulse')[:3])
+    frame = frames.FrameReader(right).read(0.01)
+    left.close()
+    right.close()
+
+    assert frame is None
+
+
+def test_unknown_label():
+    """Test that labels outside LABELS are refused"""
+    with pytest.raises(qobjecterror):
+        frames.pack_frame('id', 'unknown')
+
+
+def test_unknown_label_code():
+    """Test that a received frame with an unknown label code is refused"""
+    message = bytearray(frames.pack_frame('id', 'join'))
+    message[1] = len(frames.LABELS)
+    header, body = bytes(message[:frames.HEADER.size]), bytes(message[frames.HEADER.size:])
+    with pytest.raises(qsocketerror):
+        frames.unpack_frame(header, body)
+
+
+def test_payload_too_large():
+    """Test that a header announcing more than MAX_PAYLOAD bytes is refused before the payload is read"""
+    header = frames.HEADER.pack(2, frames.LABEL_CODES['join'], frames.DATA, 0, frames.MAX_PAYLOAD + 1)
+    reader = frames.FrameReader(None)
+    with pytest.raises(qsocketerror):
+        reader.feed(header + b'id')
+    with pytest.raises(qobjecterror):
+        frames.pack_frame('id', 'join', payload=bytes(frames.MAX_PAYLOAD + 1))
+
+
+@pytest.mark.parametrize('size', [0, 1, 5, 1280])
+def test_polarizations_round_trip(size):
+    """Test that polarization codes are packed 4 per byte"""
+    pulse = PhotonPulse.create(size)
+    payload = frames.encode_polarizations(pulse.polarizations)
+
+    assert len(payload) == frames.COUNT.size + -(-size // 4)
+    assert np.array_equal(frames.decode_polarizations(payload), pulse.polarizations)
+
+
+@pytest.mark.parametrize('size', [0, 3, 1280])
+def test_bits_round_trip(size):
+    """Test that bits are packed 8 per byte"""
+    bits = np.random.default_rng().integers(0, 2, size, dtype=np.uint8)
+
+    assert np.array_equal(frames.decode_bits(frames.encode_bits(bits)), bits)
+
+
+def test_decision_round_trip():
+    """Test that negative decisions are preserved"""
+    assert frames.decode_decision(frames.encode_decision(-1)) == -1
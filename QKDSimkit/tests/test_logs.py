@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the logging of frames"""
+
+import logging
+
+from QKDSimkit.core import logs
+
+
+class Payload(bytes):
+    """Payload that counts its hex conversions"""
+    conversions = 0
+
+    def hex(self, *args):
+        Payload.conversions += 1
+        return super().hex(*args)
+
+
+def test_log_frame(caplog):
+    """Test that frame records carry header, length and timing, payloads are dumped only on demand"""
+    logger = logging.getLogger('QKDSimkit_test')
+    payload = Payload(b'\x01\x02')
+    with caplog.at_level(logging.DEBUG, logger='QKDSimkit_test'):
+        logs.log_frame(logger, 'answered', 'qpulse', payload, 0.002)
+        try:
+            logs.dump_payloads()
+            logs.log_frame(logger, 'sent', 'qpulse', payload)
+        finally:
+            logs.dump_payloads(False)
+    first, second = caplog.records
+    assert first.getMessage() == 'answered qpulse 2 bytes in 2.000 ms'
+    assert (first.frame, first.size, first.elapsed) == ('qpulse', 2, 0.002)
+    assert second.getMessage() == 'sent qpulse 2 bytes: 0102'
+
+
+def test_lazy_payload():
+    """Test that nothing is formatted when DEBUG is disabled"""
+    logger = logging.getLogger('QKDSimkit_test_lazy')
+    logger.setLevel(logging.INFO)
+    Payload.conversions = 0
+    logs.dump_payloads()
+    try:
+        logs.log_frame(logger, 'sent', 'qpulse', Payload(b'\x01'))
+    finally:
+        logs.dump_payloads(False)
+    assert Payload.conversions == 0
+
+
+def test_frame_sampler():
+    """Test that one frame record out of rate is kept and other records are not sampled"""
+    sampler = logs.FrameSampler(3)
+    frame = logging.LogRecord('QKDSimkit', logging.DEBUG, __file__, 1, 'sent', (), None)
+    frame.frame = 'qpulse'
+    other = logging.LogRecord('QKDSimkit', logging.INFO, __file__, 1, 'connected', (), None)
+    assert [sampler.filter(frame) for _ in range(6)] == [True, False, False, True, False, False]
+    assert sampler.filter(other)
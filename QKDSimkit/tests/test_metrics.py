@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the metrics registry"""
+
+import socket
+import time
+
+from threading import Thread
+
+from QKDSimkit.core import alice, bob, channel
+from QKDSimkit.core.metrics import Registry, NULL_STOPWATCH, registry
+
+
+def free_port() -> int:
+    """Ask the OS for an unused port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_render():
+    """Test the Prometheus text format of counters, gauges and summaries"""
+    metrics = Registry()
+    metrics.inc('keys_total', 2, node='alice')
+    metrics.inc('keys_total', node='alice')
+    metrics.set('exchanges_running', 4)
+    metrics.observe('qber', 0.02, node='bob')
+    metrics.observe('qber', 0.04, node='bob')
+    assert metrics.value('keys_total', node='alice') == 3
+    assert metrics.value('qber', node='bob') == (2, 0.06)
+    text = metrics.render()
+    assert '# TYPE qkd_keys_total counter\nqkd_keys_total{node="alice"} 3\n' in text
+    assert 'qkd_exchanges_running 4\n' in text
+    assert 'qkd_qber_count{node="bob"} 2\n' in text
+
+
+def test_disabled():
+    """Test that a disabled registry records nothing"""
+    metrics = Registry(enabled=False)
+    metrics.inc('keys_total')
+    metrics.observe('qber', 0.1)
+    assert metrics.stopwatch(node='alice') is NULL_STOPWATCH
+    assert metrics.render() == '\n'
+
+
+def test_exchange_metrics():
+    """Test that an exchange records its phases, bytes and keys"""
+    address = '127.0.0.1:{0}'.format(free_port())
+    Thread(target=channel.async_channel(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    registry.clear()
+    threads = [Thread(target=alice.import_keys, args=(address, 'metrics', 64, 4, 2)),
+               Thread(target=bob.import_keys, args=(address, 'metrics', 64, 4, 2))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    for node in ('alice', 'bob'):
+        assert registry.value('keys_total', node=node) == 4
+        assert registry.value('exchanges_total', node=node, result='success') == 2
+        assert registry.value('phase_seconds', node=node, phase='sifting')[0] >= 2
+        assert registry.value('qber', node=node)[0] >= 2
+        assert registry.value('bytes_sent_total', node=node) > 0
+    assert registry.value('phase_seconds', node='alice', phase='pulse_creation')[0] >= 2
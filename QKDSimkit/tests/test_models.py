@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Equivalence tests between the scalar Photon and the array-backed PhotonPulse"""
+
+import numpy as np
+import pytest
+
+from QKDSimkit.core.models import BASES, Photon, PhotonPulse, degrees_to_codes
+from QKDSimkit.core.receiver import Receiver
+from QKDSimkit.core.sender import Sender
+
+
+@pytest.fixture
+def photons():
+    """Scalar reference pulse"""
+    return [Photon() for _ in range(1000)]
+
+
+def to_pulse(photons):
+    """Build a PhotonPulse with the same bits and bases of a list of photons"""
+    return PhotonPulse([p.bit for p in photons], [BASES.index(p.basis) for p in photons])
+
+
+def test_polarization(photons):
+    """Test that both engines prepare the same polarizations"""
+    pulse = to_pulse(photons)
+
+    assert pulse.degrees().tolist() == [p.polarization for p in photons]
+    assert np.array_equal(degrees_to_codes(pulse.degrees()), pulse.polarizations)
+
+
+def test_measure_same_basis(photons):
+    """Test that measuring in the preparation basis preserves bits in both engines"""
+    pulse = to_pulse(photons)
+    measured = PhotonPulse.measure(pulse.polarizations)
+    for photon, basis, bit in zip(photons, measured.bases, measured.bits):
+        reference = Photon()
+        reference.basis = BASES[basis]
+        reference.polarization = reference.measure(photon.polarization)
+        if reference.basis == photon.basis:
+            assert reference.set_bit_from_measurement() == bit == photon.bit
+
+
+def test_measure_other_basis_is_random():
+    """Test that measuring in the other basis gives random bits like Photon.measure"""
+    rng = np.random.default_rng(0)
+    measured = PhotonPulse.measure(np.zeros(20000, dtype=np.uint8), rng)
+    other = measured.bits[measured.bases == 1]
+
+    assert np.all(measured.bits[measured.bases == 0] == 0)
+    assert 0.45 < other.mean() < 0.55
+
+
+def test_sifting(photons):
+    """Test that sifting and shared key match the scalar algorithm"""
+    alice = Sender('id', 200)
+    alice.photon_pulse = to_pulse(photons)
+    alice.bases = alice.photon_pulse.bases
+    other = [Photon() for _ in photons]
+    alice.other_bases = [BASES.index(p.basis) for p in other]
+
+    alice.generate_reconciled_key()
+    alice.create_shared_key()
+
+    expected = [p.bit for p, o in zip(photons, other) if p.basis == o.basis]
+    assert alice.shared_key.tolist() == expected
+
+
+def test_receiver_agrees_with_sender():
+    """Test that a noiseless exchange gives the same shared key to both nodes"""
+    alice = Sender('id', 256)
+    bob = Receiver('id', 256)
+    pulse = alice.create_photon_pulse()
+    bob.polarization_vector = pulse.polarizations
+    bob.measure_photon_pulse()
+
+    alice.other_bases = bob.bases.tolist()
+    alice.generate_reconciled_key()
+    bob.reconciled_key = alice.reconciled_key.tolist()
+    alice.create_keys()
+    bob.create_keys()
+
+    assert np.array_equal(alice.shared_key, bob.shared_key)
+    assert np.array_equal(alice.sub_shared_key, bob.sub_shared_key)
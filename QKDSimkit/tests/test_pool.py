@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the key pool"""
+
+import itertools
+import time
+
+import pytest
+
+from QKDSimkit.core.pool import KeyPool
+from QKDSimkit.core.qexceptions import poolerror
+
+
+class Producer(object):
+    """Producer of numbered keys that records the requested batch sizes"""
+    def __init__(self):
+        self.counter = itertools.count()
+        self.requests = []
+
+    def __call__(self, number):
+        self.requests.append(number)
+        return [next(self.counter) for _ in range(number)]
+
+
+def test_refill_up_to_high_watermark():
+    """Test that the pool is filled in background in batches"""
+    producer = Producer()
+    pool = KeyPool(producer, low_watermark=2, high_watermark=5, batch_size=2)
+    pool.start()
+    time.sleep(0.1)
+
+    assert len(pool) == 5
+    assert producer.requests == [2, 2, 1]
+
+
+def test_keys_in_order_and_counters():
+    """Test that keys are taken in order and refill starts below the low watermark"""
+    producer = Producer()
+    pool = KeyPool(producer, low_watermark=2, high_watermark=4, batch_size=4)
+
+    assert pool.get(1) == 0
+    time.sleep(0.1)
+    assert [pool.get(1) for _ in range(3)] == [1, 2, 3]
+    time.sleep(0.1)
+    stats = pool.stats()
+
+    assert stats['misses'] == 1
+    assert stats['hits'] == 3
+    assert stats['depth'] == 4
+    assert stats['generated'] == stats['depth'] + 4
+
+
+def test_producer_error():
+    """Test that errors of the producer are raised to the consumer"""
+    def producer(number):
+        raise ValueError("broken")
+
+    pool = KeyPool(producer)
+    with pytest.raises(poolerror):
+        pool.get(1)
+
+
+def test_stop():
+    """Test that a stopped pool asks no more keys to the producer and fails when it is empty"""
+    producer = Producer()
+    pool = KeyPool(producer, low_watermark=2, high_watermark=4, batch_size=4)
+    pool.start()
+    pool.stop(timeout=None)
+    keys = [pool.get(1) for _ in range(len(pool))]
+
+    with pytest.raises(poolerror):
+        pool.get(1)
+    assert keys == list(range(sum(producer.requests)))
+    assert producer.requests in ([], [4])
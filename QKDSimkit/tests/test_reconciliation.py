@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+import numpy as np
+import pytest
+
+from QKDSimkit.core import reconciliation
+
+
+def run_cascade(key, other_key, qber, seed):
+    """Run both sides of Cascade in lockstep"""
+    sender = reconciliation.Cascade(key, qber, seed, correct=False)
+    receiver = reconciliation.Cascade(other_key, qber, seed, correct=True)
+    while sender.next_queries():
+        assert receiver.next_queries() == sender.queries
+        own, other = sender.parities(), receiver.parities()
+        sender.update(own, other)
+        receiver.update(other, own)
+    assert not receiver.next_queries()
+    return sender, receiver
+
+
+@pytest.mark.parametrize('length, qber', [(5000, 0.0), (5000, 0.02), (20000, 0.05)])
+def test_cascade_corrects_errors(length, qber):
+    rng = np.random.default_rng(0)
+    key = rng.integers(0, 2, length, dtype=np.uint8)
+    other_key = key ^ (rng.random(length) < qber).astype(np.uint8)
+    sender, receiver = run_cascade(key, other_key, qber, 1)
+    assert np.array_equal(sender.key, key)
+    assert np.array_equal(receiver.key, key)
+    assert sender.leaked == receiver.leaked < length
+
+
+def test_toeplitz_hash():
+    rng = np.random.default_rng(0)
+    key = rng.integers(0, 2, 300, dtype=np.uint8)
+    diagonal = np.random.default_rng(5).integers(0, 2, 300 + 40 - 1, dtype=np.uint8)
+    matrix = np.array([[diagonal[i - j + 299] for j in range(300)] for i in range(40)])
+    assert np.array_equal(reconciliation.toeplitz_hash(key, 40, 5), matrix.dot(key) % 2)
+
+
+def test_secure_length():
+    assert reconciliation.secure_length(1000, 0.0, 100) == 1000 - 100 - reconciliation.SECURITY_MARGIN
+    assert reconciliation.secure_length(1000, 0.05, 100) < reconciliation.secure_length(1000, 0.01, 100)
+    assert reconciliation.secure_length(100, 0.11, 100) == 0
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the server with the in-process store"""
+
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+import pytest
+import uvicorn
+
+from QKDSimkit import Server
+from QKDSimkit.Benchmark import free_port, start_local_channel
+from QKDSimkit.Client import start_pool
+
+
+@pytest.fixture
+def server():
+    """Server on a free local port that keeps users and keys in a LocalStore"""
+    Server.configure_store('local')
+    port = free_port('127.0.0.1')
+    instance = uvicorn.Server(uvicorn.Config(Server.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=instance.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not instance.started:
+        assert time.monotonic() < deadline, "the server did not start"
+        time.sleep(0.01)
+    yield '127.0.0.1:{0}'.format(port)
+    instance.should_exit = True
+    thread.join()
+    Server.configure_store()
+
+
+def get(address: str, path: str, **params):
+    """Status and JSON body of a GET request, the body is None if the request failed"""
+    conn = http.client.HTTPConnection(address, timeout=5)
+    try:
+        conn.request("GET", "{0}?{1}".format(path, urllib.parse.urlencode(params)))
+        response = conn.getresponse()
+        body = response.read().decode()
+        return response.status, json.loads(body) if response.status == 200 else None
+    finally:
+        conn.close()
+
+
+def test_get_key_from_local_store(server):
+    """Test that keys of a user are taken from the LocalStore in order and only once"""
+    Server.run_sync(Server.add_user('token'))
+    hashed = Server.core.utils.hash_token(Server.generate_token('token'))
+    Server.run_sync(Server.store.push_keys(hashed, ['k1', 'k2', 'k3']))
+
+    first = get(server, '/get_key', password='token')
+    rest = get(server, '/get_key', hashed=hashed, number=2)
+    empty = get(server, '/get_key', password='token')
+    invalid = get(server, '/get_key', password='token', number=0)
+
+    assert first == (200, ['k1'])
+    assert rest == (200, ['k2', 'k3'])
+    assert empty[0] == 404
+    assert invalid[0] == 400
+
+
+def test_key_used_right_after_refill(server):
+    """Test that a key taken from the client pool is already in the pool of the user on the server"""
+    channel = start_local_channel(0.0, False, seed=1)
+    try:
+        Server.run_sync(Server.add_user('token'))
+        Server.run_sync(Server.cache_set('address', '127.0.0.1:{0}'.format(channel.port)))
+        pool = start_pool(server, '127.0.0.1:{0}'.format(channel.port), 'token', 64,
+                          low_watermark=1, high_watermark=2, batch_size=2)
+        try:
+            keys = [pool.get(30), pool.get(30)]
+            server_keys = get(server, '/get_key', password='token', number=2)
+        finally:
+            pool.stop(timeout=None)
+    finally:
+        channel.stop()
+
+    assert server_keys == (200, keys)
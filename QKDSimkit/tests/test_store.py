@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+"""Tests of the in-process store"""
+
+import asyncio
+
+from QKDSimkit.core.store import LocalStore
+
+
+def test_pop_keys_in_order():
+    """Test that keys are popped in the order they were pushed and only if there are enough of them"""
+    async def scenario():
+        store = LocalStore()
+        await store.push_keys('id', ['k1', 'k2'])
+        await store.push_keys('id', ['k3'])
+        first = await store.pop_keys('id', 2)
+        too_many = await store.pop_keys('id', 2)
+        return first, too_many, await store.all_keys()
+
+    first, too_many, keys = asyncio.run(scenario())
+
+    assert first == ['k1', 'k2']
+    assert too_many is None
+    assert keys == {'id': ['k3']}
+
+
+def test_stats():
+    """Test that counters are accumulated per user"""
+    async def scenario():
+        store = LocalStore()
+        await store.incr_stats('id', generated=4, generation_time=0.5)
+        await store.incr_stats('id', hits=1)
+        await store.incr_stats('other', misses=1)
+        return await store.all_stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats['id'] == {'hits': 1, 'misses': 0, 'generated': 4, 'generation_time': 0.5}
+    assert stats['other']['misses'] == 1
+
+
+def test_pop_no_keys():
+    """Test that asking for less than one key takes nothing from the pool"""
+    async def scenario():
+        store = LocalStore()
+        await store.push_keys('id', ['k1', 'k2'])
+        return await store.pop_keys('id', 0), await store.pop_keys('id', -1), await store.all_keys()
+
+    zero, negative, keys = asyncio.run(scenario())
+
+    assert zero is None
+    assert negative is None
+    assert keys == {'id': ['k1', 'k2']}
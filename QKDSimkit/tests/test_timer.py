@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+import socket
+import time
+
+from threading import Thread
+
+import pytest
+
+from QKDSimkit.core import channel
+from QKDSimkit.core.qexceptions import qsocketerror
+from QKDSimkit.core.sender import Sender
+from QKDSimkit.core.session import Session
+from QKDSimkit.core.timer import RetransmissionTimer
+
+
+def test_timeout_tracks_rtt():
+    timer = RetransmissionTimer(initial=1.0, minimum=0.001, jitter=0)
+    for _ in range(50):
+        timer.sample(0.01)
+    assert timer.timeout() == pytest.approx(0.01, rel=0.5)
+    timer.expired()
+    timer.expired()
+    assert timer.timeout() == pytest.approx(4 * timer.rto)
+    timer.sample(0.01)
+    assert timer.timeout() == timer.rto
+
+
+def test_timeout_bounds():
+    timer = RetransmissionTimer(minimum=0.05, maximum=0.5, jitter=0)
+    timer.sample(0.0001)
+    assert timer.timeout() == 0.05
+    for _ in range(20):
+        timer.expired()
+    assert timer.timeout() == 0.5
+
+
+def test_deadline():
+    """Test that a sender without receiver gives up at the deadline of the exchange"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    address = '127.0.0.1:{0}'.format(port)
+    Thread(target=channel.async_channel(address, 0.0, False).initiate_channel, daemon=True).start()
+    time.sleep(0.2)
+    session = Session(Sender('id', 64), address, timeout=0.5)
+    session.connect()
+    try:
+        node = session.next_exchange()
+        start = time.monotonic()
+        with pytest.raises(qsocketerror):
+            node.send('qpulse', b'')
+        assert time.monotonic() - start < 1
+        assert node.timer.retransmissions >= 1
+    finally:
+        session.close()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+import time
+
+from QKDSimkit.core import utils
+
+
+def test_generate_token_is_cached():
+    cache = utils.token_cache
+    before = cache.stats()
+    token = utils.generate_token('cached password')
+    assert token == utils.derive_token('cached password')
+    assert utils.generate_token('cached password') == token
+    after = cache.stats()
+    assert after['derivations'] == before['derivations'] + 1
+    assert after['derivations_saved'] == before['derivations_saved'] + 1
+
+
+def test_token_cache_eviction():
+    cache = utils.TokenCache(maxsize=2, ttl=0.05)
+    cache.put('a', 'token a')
+    cache.put('b', 'token b')
+    assert cache.get('a') == 'token a'
+    cache.put('c', 'token c')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'token a'
+    assert 'a' not in cache.entries
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 1
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# This code is part of QKDSimkit.
+#
+# SPDX-License-Identifier: MIT
+#
+# (C) Copyright 2021 CERN.
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from QKDSimkit.core.workers import ExchangePool, exchange_ids
+
+
+def test_exchange_ids():
+    assert exchange_ids('id', 5) == [('id', 5)]
+    assert exchange_ids('id', 5, 2) == [('id-0', 3), ('id-1', 2)]
+    assert exchange_ids('id', 2, 4) == [('id-0', 1), ('id-1', 1)]
+
+
+def test_limits():
+    pool = ExchangePool(max_workers=4, max_user_workers=2)
+    lock = threading.Lock()
+    running = {}
+    peak = {}
+
+    def exchange(user):
+        with lock:
+            running[user] = running.get(user, 0) + 1
+            peak[user] = max(peak.get(user, 0), running[user])
+        time.sleep(0.02)
+        with lock:
+            running[user] -= 1
+        return user
+
+    futures = [pool.submit(user, exchange, user) for user in ['a', 'b', 'c'] * 4]
+    assert [future.result(5) for future in futures] == ['a', 'b', 'c'] * 4
+    assert max(peak.values()) == 2
+    assert pool.stats() == {}
+
+
+def test_run_does_not_block_loop():
+    pool = ExchangePool(max_workers=2, max_user_workers=1)
+
+    async def main():
+        ticks = 0
+        task = asyncio.ensure_future(asyncio.gather(*(pool.run('a', time.sleep, 0.05) for _ in range(3))))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+
+
+def test_errors_are_returned():
+    pool = ExchangePool()
+
+    def fail():
+        raise SystemExit
+
+    with pytest.raises(RuntimeError):
+        pool.submit('a', fail).result(5)
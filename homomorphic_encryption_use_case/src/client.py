@@ -61,7 +61,7 @@ def http_encrypt(image_name):
     
 
 
-    http_send(STORAGE_MACHINE, STORAGE_PORT, enc_dest, sto_dest, LINK_1_TOKEN + file_id)
+    http_send(STORAGE_MACHINE, STORAGE_PORT, enc_dest, sto_dest, LINK_1_TOKEN, file_id)
 
     dic = {
         'file_id': file_id
@@ -70,12 +70,55 @@ def http_encrypt(image_name):
     return Response(json.dumps(dic), status=200)
 
 
+@app.route("/encrypt-batch", methods=["GET"])
+def http_encrypt_batch():
+    # /encrypt-batch?image=a.png&image=b.png
+    imgs = [image_name.replace("./"," ") for image_name in request.args.getlist('image')] # forces an error if malicious
+    if not imgs or any(not img in ImageList for img in imgs):
+        return Response("Invalid Image", status=403)
+
+    file_id = random_string()
+    img_srcs = [DOCKER_DIR + 'data/dataset/%s' %(img) for img in imgs]
+    enc_dest = DOCKER_DIR + 'data/preprocessing/batch_%s.enc' %(file_id)
+    sto_dest = DOCKER_DIR + 'data/storage/batch_%s.enc' %(file_id)
+
+    register_user_client(STORAGE_MACHINE, STORAGE_PORT, file_id)
+
+    encrypt_batch(plaintexts=img_srcs, ciphertext=enc_dest)
+
+    http_send(STORAGE_MACHINE, STORAGE_PORT, enc_dest, sto_dest, LINK_1_TOKEN, file_id)
+
+    dic = {
+        'file_id': file_id,
+        'images': imgs
+    }
+
+    return Response(json.dumps(dic), status=200)
+
+
+@app.route("/decrypt-batch/<id>", methods=["GET"])
+def http_decrypt_batch(id):
+    file_id = id.replace("./"," ")
+    result_src = DOCKER_DIR + 'data/storage/result_batch_%s.enc' %(file_id)
+    result_dest = DOCKER_DIR + 'data/storage/result_batch_%s.enc' %(file_id)
+    http_file_request(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_1_TOKEN, file_id, last=True)
+
+    ret = decrypt_batch(ciphertext=result_dest)
+
+    dic = {
+        'file_id': file_id,
+        'predictions': ret
+    }
+
+    return Response(json.dumps(dic), status=200)
+
+
 @app.route("/decrypt/<id>", methods=["GET"])
 def http_decrypt(id):
     file_id = id.replace("./"," ")
     result_src = DOCKER_DIR + 'data/storage/result_%s.enc' %(file_id)
     result_dest = DOCKER_DIR + 'data/storage/result_%s.enc' %(file_id)
-    http_file_request(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_1_TOKEN + file_id)
+    http_file_request(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_1_TOKEN, file_id, last=True)
 
     ret = decrypt(ciphertext=result_dest)
 
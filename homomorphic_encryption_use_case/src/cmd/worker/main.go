@@ -0,0 +1,323 @@
+//----------------------------------------------------------------------------
+// Created By  : José Cabrero-Holgueras
+// Created Date: 01/2022
+// Copyright: CERN
+// License: MIT
+// version ='1.0'
+// ---------------------------------------------------------------------------
+
+package main
+
+import (
+	"bufio"
+	"encoding/json"
+	"flag"
+	"fmt"
+	"image"
+	"log"
+	"net"
+	"os"
+	"strconv"
+	"strings"
+	"sync"
+	"time"
+
+	"github.com/ldsec/lattigo/v2/ckks"
+	"pifs/qkd/internal/he"
+)
+
+// Long-lived HE worker: parameters, keys and the encoded model are read from their files once and kept in memory,
+// jobs (keygen, encrypt, runtime, decrypt) arrive as JSON lines over a Unix socket and run on a pool of goroutines.
+//
+//	request:  {"op": "runtime", "args": {"ic": "img.enc", "oc": "result.enc"}}
+//	response: {"ok": true, "result": 0, "value": 0.0, "seconds": 0.8}
+//
+// The batch operations (encrypt_batch, runtime_batch, decrypt_batch) pack many images in the slots of each ciphertext,
+// the images are given as "files" and the predictions are returned in "results" and "values".
+//
+// Arguments have the same names and defaults as the flags of the one-shot commands. The he package panics on I/O
+// and input errors, the panic is recovered and returned as the error of the job, the other jobs go on. The Python
+// client starts the worker again when it is gone.
+
+type Request struct {
+	Op    string            `json:"op"`
+	Args  map[string]string `json:"args"`
+	Files []string          `json:"files"`
+}
+
+type Response struct {
+	Ok      bool      `json:"ok"`
+	Error   string    `json:"error,omitempty"`
+	Result  int       `json:"result"`
+	Value   float64   `json:"value"`
+	Seconds float64   `json:"seconds"`
+	Results []int     `json:"results,omitempty"`
+	Values  []float64 `json:"values,omitempty"`
+}
+
+type Job struct {
+	request Request
+	done    chan Response
+}
+
+var defaults = map[string]string{
+	"p":   "data/he/parameters.params",
+	"pk":  "data/he/key.pk",
+	"sk":  "data/he/key.sk",
+	"rlk": "data/he/key.rlk",
+	"gks": "data/he/key.gks",
+	"i":   "data/img/frontal.png",
+	"c":   "data/he/img.enc",
+	"ic":  "data/he/img.enc",
+	"oc":  "data/he/result.enc",
+}
+
+func arg(request Request, name string) string {
+	if value, ok := request.Args[name]; ok && value != "" {
+		return value
+	}
+	return defaults[name]
+}
+
+// Store keeps what was loaded from a file, identified by kind and path
+type Store struct {
+	sync.Mutex
+	loaded map[string]interface{}
+}
+
+func (s *Store) Get(kind, path string, load func(string) interface{}) interface{} {
+	id := kind + ":" + path
+	s.Lock()
+	value, ok := s.loaded[id]
+	s.Unlock()
+	if ok {
+		return value
+	}
+	// loaded without the lock, loading the model needs the parameters
+	value = load(path)
+	s.Lock()
+	defer s.Unlock()
+	if loaded, ok := s.loaded[id]; ok {
+		return loaded
+	}
+	s.loaded[id] = value
+	return value
+}
+
+func (s *Store) Put(kind, path string, value interface{}) {
+	s.Lock()
+	defer s.Unlock()
+	s.loaded[kind+":"+path] = value
+}
+
+func (s *Store) Forget(paths ...string) {
+	s.Lock()
+	defer s.Unlock()
+	for id := range s.loaded {
+		for _, path := range paths {
+			if strings.HasSuffix(id, ":"+path) {
+				delete(s.loaded, id)
+			}
+		}
+	}
+}
+
+var store = &Store{loaded: map[string]interface{}{}}
+
+func params(path string) *ckks.Parameters {
+	return store.Get("params", path, func(p string) interface{} { return he.ParamsFromFile(p) }).(*ckks.Parameters)
+}
+
+func publicKey(path string) *ckks.PublicKey {
+	return store.Get("pk", path, func(p string) interface{} { return he.PublicKeyFromFile(p) }).(*ckks.PublicKey)
+}
+
+func secretKey(path string) *ckks.SecretKey {
+	return store.Get("sk", path, func(p string) interface{} { return he.SecretKeyFromFile(p) }).(*ckks.SecretKey)
+}
+
+func evaluationKey(path string) *ckks.EvaluationKey {
+	return store.Get("rlk", path, func(p string) interface{} { return he.EvaluationKeyFromFile(p) }).(*ckks.EvaluationKey)
+}
+
+func rotationKeys(path string) *ckks.RotationKeys {
+	return store.Get("gks", path, func(p string) interface{} { return he.RotationKeyFromFile(p) }).(*ckks.RotationKeys)
+}
+
+type Model struct {
+	weights *ckks.Plaintext
+	bias    float32
+}
+
+func model(params_file string) Model {
+	return store.Get("model", params_file, func(p string) interface{} {
+		weights, bias := he.OpenModel()
+		return Model{he.EncodeVector(weights, params(p)), bias}
+	}).(Model)
+}
+
+// weights repeated in every block of slots of a batch
+func blockModel(params_file string, block int) Model {
+	return store.Get("model-"+strconv.Itoa(block), params_file, func(p string) interface{} {
+		weights, bias := he.OpenModel()
+		return Model{he.EncodeBlocks(weights, block, params(p)), bias}
+	}).(Model)
+}
+
+func keygen(request Request, response *Response) {
+	params_file, sk_file, pk_file := arg(request, "p"), arg(request, "sk"), arg(request, "pk")
+	rlk_file, gks_file := arg(request, "rlk"), arg(request, "gks")
+	p := he.GenRLWEParameters()
+	sk, pk, rlk, gks := he.GenKeys(p)
+	he.ParamsToFile(params_file, p)
+	he.SecretKeyToFile(sk_file, sk)
+	he.PublicKeyToFile(pk_file, pk)
+	he.EvaluationKeyToFile(rlk_file, rlk)
+	he.RotationKeyToFile(gks_file, gks)
+	store.Forget(params_file, sk_file, pk_file, rlk_file, gks_file)
+	store.Put("params", params_file, p)
+	store.Put("sk", sk_file, sk)
+	store.Put("pk", pk_file, pk)
+	store.Put("rlk", rlk_file, rlk)
+	store.Put("gks", gks_file, gks)
+}
+
+func encrypt(request Request, response *Response) {
+	img := he.GetImageFromFilePath(arg(request, "i"))
+	ct := he.EncryptImage(img, params(arg(request, "p")), publicKey(arg(request, "pk")))
+	he.CiphertextToFile(arg(request, "c"), ct)
+}
+
+func runtime(request Request, response *Response) {
+	params_file := arg(request, "p")
+	m := model(params_file)
+	ct := he.CiphertextFromFile(arg(request, "ic"))
+	result := he.LR(ct, m.weights, m.bias, params(params_file), evaluationKey(arg(request, "rlk")),
+		rotationKeys(arg(request, "gks")))
+	he.CiphertextToFile(arg(request, "oc"), result)
+}
+
+func encryptBatch(request Request, response *Response) {
+	if len(request.Files) == 0 {
+		panic("no images in the batch")
+	}
+	imgs := make([]image.Image, len(request.Files))
+	for i, file := range request.Files {
+		imgs[i] = he.GetImageFromFilePath(file)
+	}
+	batch := he.EncryptImages(imgs, params(arg(request, "p")), publicKey(arg(request, "pk")))
+	he.BatchToFile(arg(request, "c"), batch)
+}
+
+func runtimeBatch(request Request, response *Response) {
+	params_file := arg(request, "p")
+	batch := he.BatchFromFile(arg(request, "ic"))
+	m := blockModel(params_file, batch.Block)
+	result := he.LRBatch(batch, m.weights, m.bias, params(params_file), evaluationKey(arg(request, "rlk")),
+		rotationKeys(arg(request, "gks")))
+	he.BatchToFile(arg(request, "oc"), result)
+}
+
+func decryptBatch(request Request, response *Response) {
+	batch := he.BatchFromFile(arg(request, "oc"))
+	response.Values = he.DecryptResults(batch, secretKey(arg(request, "sk")), params(arg(request, "p")))
+	response.Results = make([]int, len(response.Values))
+	for i, value := range response.Values {
+		if value >= 0.5 {
+			response.Results[i] = 1
+		}
+	}
+}
+
+func decrypt(request Request, response *Response) {
+	result := he.CiphertextFromFile(arg(request, "oc"))
+	response.Value = he.DecryptResult(result, secretKey(arg(request, "sk")), params(arg(request, "p")))
+	if response.Value >= 0.5 {
+		response.Result = 1
+	}
+}
+
+var operations = map[string]func(Request, *Response){
+	"keygen":  keygen,
+	"encrypt": encrypt,
+	"runtime": runtime,
+	"decrypt": decrypt,
+	"ping":    func(Request, *Response) {},
+
+	"encrypt_batch": encryptBatch,
+	"runtime_batch": runtimeBatch,
+	"decrypt_batch": decryptBatch,
+}
+
+func run(request Request) (response Response) {
+	start := time.Now()
+	defer func() {
+		if err := recover(); err != nil {
+			response = Response{Error: fmt.Sprint(err)}
+		}
+		response.Seconds = time.Since(start).Seconds()
+	}()
+	operation, ok := operations[request.Op]
+	if !ok {
+		return Response{Error: "unknown operation " + request.Op}
+	}
+	operation(request, &response)
+	response.Ok = true
+	return
+}
+
+func serve(conn net.Conn, jobs chan Job) {
+	defer conn.Close()
+	reader := bufio.NewReader(conn)
+	encoder := json.NewEncoder(conn)
+	for {
+		line, err := reader.ReadBytes('\n')
+		if err != nil {
+			return
+		}
+		var request Request
+		var response Response
+		if err := json.Unmarshal(line, &request); err != nil {
+			response = Response{Error: "invalid request: " + err.Error()}
+		} else {
+			job := Job{request, make(chan Response, 1)}
+			jobs <- job // waits while the queue is full
+			response = <-job.done
+		}
+		if err := encoder.Encode(response); err != nil {
+			return
+		}
+	}
+}
+
+func main() {
+	var socket_file = flag.String("socket", "/tmp/he_worker.sock", "Unix Socket of the Worker")
+	var workers = flag.Int("workers", 4, "Jobs Running at the Same Time")
+	var queue = flag.Int("queue", 64, "Jobs Waiting for a Worker")
+	flag.Parse()
+
+	os.Remove(*socket_file)
+	listener, err := net.Listen("unix", *socket_file)
+	if err != nil {
+		log.Fatal(err)
+	}
+	defer listener.Close()
+	os.Chmod(*socket_file, 0600)
+
+	jobs := make(chan Job, *queue)
+	for i := 0; i < *workers; i++ {
+		go func() {
+			for job := range jobs {
+				job.done <- run(job.request)
+			}
+		}()
+	}
+	fmt.Println("HE worker listening on", *socket_file)
+	for {
+		conn, err := listener.Accept()
+		if err != nil {
+			log.Fatal(err)
+		}
+		go serve(conn, jobs)
+	}
+}
@@ -0,0 +1,218 @@
+//----------------------------------------------------------------------------
+// Created By  : José Cabrero-Holgueras
+// Created Date: 01/2022
+// Copyright: CERN
+// License: MIT
+// version ='1.0'
+// ---------------------------------------------------------------------------
+
+package he
+
+import (
+	"encoding/binary"
+	"image"
+	"image/color"
+	"log"
+	"math"
+	"os"
+	"sync"
+
+	"github.com/ldsec/lattigo/v2/ckks"
+)
+
+// A batch packs several images in the slots of each ciphertext: image k of a ciphertext takes the block of slots
+// [k * block, (k + 1) * block), where block is the number of pixels rounded up to a power of two. The weights are
+// repeated in every block, the rotations of the evaluation stay inside a block, so slot k * block of the result holds
+// the prediction of image k.
+
+type Batch struct {
+	Images      int // images in the batch
+	Block       int // slots of an image
+	Ciphertexts []*ckks.Ciphertext
+}
+
+func BlockSize(pixels int) int {
+	block := 1
+	for block < pixels {
+		block <<= 1
+	}
+	return block
+}
+
+func ImagesPerCiphertext(params *ckks.Parameters, block int) int {
+	slots := 1 << params.LogSlots()
+	if block > slots {
+		log.Panic("Image does not fit in the slots of a ciphertext")
+	}
+	return slots / block
+}
+
+func imageValues(img image.Image, values []complex128) {
+	bounds := img.Bounds()
+	w, h := bounds.Max.X, bounds.Max.Y
+	for i := 0; i < h; i++ {
+		for j := 0; j < w; j++ {
+			color, _ := img.At(j, i).(color.Gray)
+			values[i*w+j] = complex128(complex(float32(color.Y)/255.0, 0))
+		}
+	}
+}
+
+func EncryptImages(imgs []image.Image, params *ckks.Parameters, pk *ckks.PublicKey) *Batch {
+	log.Println("Encrypting Batch of", len(imgs), "Images")
+	bounds := imgs[0].Bounds()
+	block := BlockSize(bounds.Max.X * bounds.Max.Y)
+	per_ciphertext := ImagesPerCiphertext(params, block)
+	var encoder ckks.Encoder = ckks.NewEncoder(params)
+	var encryptor ckks.Encryptor = ckks.NewEncryptorFromPk(params, pk)
+
+	batch := &Batch{Images: len(imgs), Block: block}
+	for first := 0; first < len(imgs); first += per_ciphertext {
+		values := make([]complex128, 1<<params.LogSlots())
+		for k := 0; k < per_ciphertext && first+k < len(imgs); k++ {
+			if imgs[first+k].Bounds() != bounds {
+				log.Panic("Images of a batch must have the same size")
+			}
+			imageValues(imgs[first+k], values[k*block:(k+1)*block])
+		}
+		plaintext := encoder.EncodeNew(values, params.LogSlots())
+		batch.Ciphertexts = append(batch.Ciphertexts, encryptor.EncryptNew(plaintext))
+	}
+	return batch
+}
+
+func EncodeBlocks(v []float32, block int, params *ckks.Parameters) *ckks.Plaintext {
+	slots := 1 << params.LogSlots()
+	repeated := make([]float32, slots)
+	for first := 0; first+block <= slots; first += block {
+		copy(repeated[first:first+block], v)
+	}
+	return EncodeVector(repeated, params)
+}
+
+func LRBlocks(ct *ckks.Ciphertext,
+	weights *ckks.Plaintext,
+	bias float32,
+	block int,
+	params *ckks.Parameters,
+	rlk *ckks.EvaluationKey,
+	gks *ckks.RotationKeys) *ckks.Ciphertext {
+
+	var evaluator ckks.Evaluator = ckks.NewEvaluator(params)
+
+	r1 := evaluator.MulRelinNew(ct, weights, rlk)
+
+	if err := evaluator.Rescale(r1, params.Scale(), r1); err != nil {
+		log.Panic(err)
+	}
+
+	var t *ckks.Ciphertext
+	for step := 1; step < block; step <<= 1 {
+		t = evaluator.RotateNew(r1, uint64(step), gks)
+		evaluator.Add(r1, t, r1)
+	}
+	// LR also rotates by the number of slots, that maps every slot onto itself and doubles the sum
+	evaluator.Add(r1, r1, r1)
+	res := evaluator.AddConstNew(r1, bias)
+	return res
+}
+
+func LRBatch(batch *Batch,
+	weights *ckks.Plaintext,
+	bias float32,
+	params *ckks.Parameters,
+	rlk *ckks.EvaluationKey,
+	gks *ckks.RotationKeys) *Batch {
+
+	result := &Batch{Images: batch.Images, Block: batch.Block, Ciphertexts: make([]*ckks.Ciphertext, len(batch.Ciphertexts))}
+	// a panic in a goroutine would stop the process, it is sent back and raised again in the caller
+	failures := make(chan interface{}, len(batch.Ciphertexts))
+	var wg sync.WaitGroup
+	for i, ct := range batch.Ciphertexts {
+		wg.Add(1)
+		go func(i int, ct *ckks.Ciphertext) {
+			defer wg.Done()
+			defer func() {
+				if err := recover(); err != nil {
+					failures <- err
+				}
+			}()
+			result.Ciphertexts[i] = LRBlocks(ct, weights, bias, batch.Block, params, rlk, gks)
+		}(i, ct)
+	}
+	wg.Wait()
+	close(failures)
+	if err, failed := <-failures; failed {
+		panic(err)
+	}
+	return result
+}
+
+func DecryptResults(batch *Batch, sk *ckks.SecretKey, params *ckks.Parameters) []float64 {
+	var encoder ckks.Encoder = ckks.NewEncoder(params)
+	var decryptor ckks.Decryptor = ckks.NewDecryptor(params, sk)
+	per_ciphertext := ImagesPerCiphertext(params, batch.Block)
+	results := make([]float64, 0, batch.Images)
+	for _, ct := range batch.Ciphertexts {
+		pt := encoder.Decode(decryptor.DecryptNew(ct), params.LogSlots())
+		for k := 0; k < per_ciphertext && len(results) < batch.Images; k++ {
+			results = append(results, 1.0/(1.0+math.Exp(real(pt[k*batch.Block]))))
+		}
+	}
+	return results
+}
+
+// File of a batch: images, block and number of ciphertexts (uint32), then every ciphertext as length (uint64) and
+// bytes, little endian as the ciphertexts
+
+func BatchToFile(filename string, batch *Batch) {
+	file, err := os.Create(filename)
+	if err != nil {
+		log.Panic(err)
+	}
+	defer file.Close()
+	header := []uint32{uint32(batch.Images), uint32(batch.Block), uint32(len(batch.Ciphertexts))}
+	if err := binary.Write(file, binary.LittleEndian, header); err != nil {
+		log.Panic(err)
+	}
+	for _, ct := range batch.Ciphertexts {
+		bin_buf, err := ct.MarshalBinary()
+		if err != nil {
+			log.Panic(err)
+		}
+		if err := binary.Write(file, binary.LittleEndian, uint64(len(bin_buf))); err != nil {
+			log.Panic(err)
+		}
+		if _, err := file.Write(bin_buf); err != nil {
+			log.Panic(err)
+		}
+	}
+}
+
+func BatchFromFile(filename string) *Batch {
+	bytes := BytesFromFile(filename)
+	if len(bytes) < 12 {
+		log.Panic("Invalid batch file ", filename)
+	}
+	batch := &Batch{
+		Images: int(binary.LittleEndian.Uint32(bytes[0:4])),
+		Block:  int(binary.LittleEndian.Uint32(bytes[4:8])),
+	}
+	count := int(binary.LittleEndian.Uint32(bytes[8:12]))
+	offset := 12
+	for i := 0; i < count; i++ {
+		if offset+8 > len(bytes) {
+			log.Panic("Invalid batch file ", filename)
+		}
+		length := int(binary.LittleEndian.Uint64(bytes[offset : offset+8]))
+		offset += 8
+		if offset+length > len(bytes) {
+			log.Panic("Invalid batch file ", filename)
+		}
+		var ciphertext *ckks.Ciphertext = &ckks.Ciphertext{}
+		ciphertext.UnmarshalBinary(bytes[offset : offset+length])
+		batch.Ciphertexts = append(batch.Ciphertexts, ciphertext)
+		offset += length
+	}
+	return batch
+}
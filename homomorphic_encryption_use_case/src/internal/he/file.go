@@ -18,27 +18,27 @@ func BytesToFile(filename string, bytes []byte){
 	file, err := os.Create(filename)
 	defer file.Close()
 	if err != nil {
-		log.Fatal(err)
+		log.Panic(err)
 	} 
 
 	_, err2 := file.Write(bytes)
 
 	if err2 != nil {
-		log.Fatal(err2)
+		log.Panic(err2)
 	}
 }
 
 func BytesFromFile(filename string) (bytes []byte){
 	bytes, err := os.ReadFile(filename)
 	if err != nil {
-		log.Fatal(err)
+		log.Panic(err)
 	}
 	return bytes
 }
 func CiphertextToFile(filename string, ciphertext *ckks.Ciphertext) {
 	bin_buf, err1 := ciphertext.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
@@ -57,7 +57,7 @@ func CiphertextFromFile(filename string) (*ckks.Ciphertext) {
 func ParamsToFile(filename string, params *ckks.Parameters){
 	bin_buf, err1 := params.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
@@ -77,7 +77,7 @@ func ParamsFromFile(filename string) (*ckks.Parameters){
 func PublicKeyToFile(filename string, pk *ckks.PublicKey) {
 	bin_buf, err1 := pk.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
@@ -95,7 +95,7 @@ func PublicKeyFromFile(filename string) (*ckks.PublicKey) {
 func SecretKeyToFile(filename string, sk *ckks.SecretKey) {
 	bin_buf, err1 := sk.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
@@ -113,7 +113,7 @@ func SecretKeyFromFile(filename string) (*ckks.SecretKey) {
 func EvaluationKeyToFile(filename string, rlk *ckks.EvaluationKey) {
 	bin_buf, err1 := rlk.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
@@ -131,7 +131,7 @@ func EvaluationKeyFromFile(filename string) (*ckks.EvaluationKey) {
 func RotationKeyToFile(filename string, gks *ckks.RotationKeys) {
 	bin_buf, err1 := gks.MarshalBinary() // Little Endian
 	if err1 != nil {
-		log.Fatal(err1)
+		log.Panic(err1)
 	}
 
 	BytesToFile(filename, bin_buf)
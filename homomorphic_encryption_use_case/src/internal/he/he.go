@@ -25,7 +25,7 @@ func GenRLWEParameters() (p *ckks.Parameters) {
 	
 	p, err = ckks.NewParametersFromLogModuli(logN, logModuli)
 	if err != nil{
-		log.Fatal("Couldn't create the parameters")
+		log.Panic("Couldn't create the parameters")
 	}
 	var scale float64 = 1 << 30
 	p.SetLogSlots(logN - 1)
@@ -55,7 +55,7 @@ func LR(ct *ckks.Ciphertext,
 	r1 := evaluator.MulRelinNew(ct, weights , rlk)
 
 	if err := evaluator.Rescale(r1, params.Scale(), r1); err != nil {
-		log.Fatal(err)
+		log.Panic(err)
 	}
 
 	var t *ckks.Ciphertext
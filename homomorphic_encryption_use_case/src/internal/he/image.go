@@ -20,12 +20,12 @@ func GetImageFromFilePath(filePath string) (image.Image) {
 	// Since nobody is going to read the comments, I just put this.
     f, err := os.Open(filePath)
     if err != nil {
-        log.Fatal(err)
+        log.Panic(err)
     }
     defer f.Close()
     image, _, err := image.Decode(f)
 	if err != nil {
-		log.Fatal(err)
+		log.Panic(err)
 	}
     return image
 }
\ No newline at end of file
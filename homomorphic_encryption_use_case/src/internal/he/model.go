@@ -19,12 +19,12 @@ func OpenModel()([]float32, float32){
 	var bias float32 = -0.05991028
 	f, err := os.Open("data/model/w.npy")
 	if err != nil{
-		log.Fatal(err)
+		log.Panic(err)
 	}
 	var weights []float32
 	err = npy.Read(f, &weights)
 	if err != nil {
-		log.Fatal(err)
+		log.Panic(err)
 	}
 	
 	return  weights, bias
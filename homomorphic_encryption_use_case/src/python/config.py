@@ -17,3 +17,8 @@ PREPROCESSING_PORT = 7000
 STORAGE_PORT = 7001
 PROCESSING_PORT = 7002
 
+
+# Long-lived HE worker (bin/worker), parameters and keys are loaded once
+HE_WORKER_SOCKET = '/tmp/he_worker.sock'
+HE_WORKER_THREADS = 4
+HE_WORKER_QUEUE = 64
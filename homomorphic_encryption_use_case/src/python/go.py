@@ -8,74 +8,119 @@
 # version ='1.0'
 # ---------------------------------------------------------------------------
 
-import os
+import atexit, json, os, socket, subprocess, threading, time
+
+from python.config import HE_WORKER_SOCKET, HE_WORKER_THREADS, HE_WORKER_QUEUE
+
+
+class HEWorkerError(Exception):
+    pass
+
+
+class HEWorker:
+    """Client of bin/worker, a long-lived process that keeps parameters, keys and the encoded model in memory
+
+    Every call uses its own connection to the Unix socket, so calls from several Flask threads are in flight at the
+    same time, the worker runs up to `threads` jobs at once and queues the others. The process is started on first use
+    (unless a worker already listens on the socket) and again if it is gone.
+    """
+    def __init__(self, socket_path=HE_WORKER_SOCKET, threads=HE_WORKER_THREADS, queue=HE_WORKER_QUEUE,
+                 binary="./bin/worker", start_timeout=30):
+        self.socket_path = socket_path
+        self.command = [binary, "--socket={}".format(socket_path), "--workers={}".format(threads),
+                        "--queue={}".format(queue)]
+        self.start_timeout = start_timeout
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            if self.process is None:
+                try:
+                    # a worker started by another process or by hand
+                    self.connect().close()
+                    return
+                except OSError:
+                    pass
+            print("[WORKER]: " + " ".join(self.command))
+            self.process = subprocess.Popen(self.command)
+            deadline = time.monotonic() + self.start_timeout
+            while True:
+                try:
+                    self.connect().close()
+                    return
+                except OSError:
+                    if self.process.poll() is not None or time.monotonic() > deadline:
+                        raise HEWorkerError("HE worker did not start")
+                    time.sleep(0.05)
+
+    def connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+
+    def call(self, op, files=None, **args):
+        self.start()
+        request = {"op": op, "args": {name: value for name, value in args.items() if value is not None}}
+        if files is not None:
+            request["files"] = list(files)
+        with self.connect() as conn, conn.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            line = stream.readline()
+        if not line:
+            raise HEWorkerError("HE worker exited during " + op)
+        response = json.loads(line)
+        if not response["ok"]:
+            raise HEWorkerError(response["error"])
+        print("[DONE][WORKER]: {} in {:.3f}s".format(op, response["seconds"]))
+        return response
+
+    def stop(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+                self.process.wait()
+            self.process = None
+
+
+worker = HEWorker()
+atexit.register(worker.stop)
+
 
 def keygen(params = None, sk = None, pk = None, rlk = None, gks = None):
-    command = "./bin/keygen"
-    if not params is None:
-        command += " --p={}".format(params)
-    if not sk is None:
-        command += " --sk={}".format(sk)  
-    if not pk is None:
-        command += " --pk={}".format(pk)  
-    if not rlk is None:
-        command += " --rlk={}".format(rlk)  
-    if not gks is None:
-        command += " --gks={}".format(gks)  
-    print("[COMMAND]: " + command)
-    try:
-        os.system(command)
-    except os.error as E:
-        print(E)
-    print("[DONE][COMMAND]: " + command)
-    
+    worker.call("keygen", p=params, sk=sk, pk=pk, rlk=rlk, gks=gks)
+
 
 def encrypt(plaintext=None, ciphertext=None, pk=None, params=None):
+    worker.call("encrypt", i=plaintext, c=ciphertext, pk=pk, p=params)
 
-    command = "./bin/encryptor"
-    if not params is None:
-        command += " --p={}".format(params)
-    if not pk is None:
-        command += " --pk={}".format(pk)  
-    if not plaintext is None:
-        command += " --i={}".format(plaintext)  
-    if not ciphertext is None:
-        command += " --c={}".format(ciphertext)
-    print("[COMMAND]: " + command)
-    try:
-        os.system(command)
-    except os.error as E:
-        print(E)
-    print("[DONE][COMMAND]: " + command)
 
 def decrypt(ciphertext=None, sk=None, params=None):
-
-    command = "./bin/decryptor"
-    if not params is None:
-        command += " --p={}".format(params)
-    if not sk is None:
-        command += " --sk={}".format(sk)  
-    if not ciphertext is None:
-        command += " --oc={}".format(ciphertext)  
-    print("[COMMAND]: " + command)
-    status = os.system(command)
-    print("[DONE][COMMAND]: " + command)
-    return os.WEXITSTATUS(status)
+    # the prediction, as the exit status of bin/decryptor
+    return worker.call("decrypt", oc=ciphertext, sk=sk, p=params)["result"]
 
 
 def runtime(input_ciphertext=None, output_ciphertext=None, rlk=None, gks=None, params=None):
+    worker.call("runtime", ic=input_ciphertext, oc=output_ciphertext, rlk=rlk, gks=gks, p=params)
+
+
+# Batches pack many images in the slots of each ciphertext, the runtime is run once for the whole batch
+
+def encrypt_batch(plaintexts, ciphertext=None, pk=None, params=None):
+    worker.call("encrypt_batch", files=plaintexts, c=ciphertext, pk=pk, p=params)
+
+
+def runtime_batch(input_ciphertext=None, output_ciphertext=None, rlk=None, gks=None, params=None):
+    worker.call("runtime_batch", ic=input_ciphertext, oc=output_ciphertext, rlk=rlk, gks=gks, p=params)
+
 
-    command = "./bin/runtime"
-    if not params is None:
-        command += " --p={}".format(params)
-    if not rlk is None:
-        command += " --rlk={}".format(rlk)  
-    if not gks is None:
-        command += " --gks={}".format(gks)
-    if not input_ciphertext is None:
-        command += " --ic={}".format(input_ciphertext)  
-    if not output_ciphertext is None:
-        command += " --oc={}".format(output_ciphertext)  
-    print("[COMMAND]: " + command)
-    os.system(command)
-    print("[DONE][COMMAND]: " + command)
\ No newline at end of file
+def decrypt_batch(ciphertext=None, sk=None, params=None):
+    # the predictions of the images, in the order they were encrypted
+    return worker.call("decrypt_batch", oc=ciphertext, sk=sk, p=params)["results"]
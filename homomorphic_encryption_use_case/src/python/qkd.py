@@ -8,16 +8,18 @@
 # version ='1.0'
 # ---------------------------------------------------------------------------
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
-import os, random, string, base64, requests, json
+import atexit, os, random, string, base64, requests, json, struct, threading, time
 from python.qkd_config import ALICE_ADDRESS, CHANNEL_ADDRESS, QKD_ENABLE, ROLE, CLIENT_ROLE, SERVER_ROLE, LINK_1_TOKEN, LINK_2_TOKEN
+from python.qkd_config import KEY_MAX_BYTES, KEY_MAX_AGE, KEY_SIZE, POOL_LOW_WATERMARK, POOL_HIGH_WATERMARK, POOL_BATCH_SIZE
 
 import asyncio
 from QKDSimkit.Server import add_user, get_key_cli, start_server_and_channel
-from QKDSimkit.Client import start_client
+from QKDSimkit.Client import get_key, start_pool
+from QKDSimkit.core.utils import generate_token
 
 # if ROLE is SERVER_ROLE:
 #     #this part only once to add user in the dict in memory
@@ -48,30 +50,151 @@ def get_key_as_server(token):
     return key[0]
 
 
-def get_key_as_client(token): 
-    
-    key = start_client(ALICE_ADDRESS, CHANNEL_ADDRESS, 1, 1 << 8, token, False)
-    return key[0]
+# keys of a link token are exchanged ahead of time, the server keeps the same keys in the pool of the user
+client_pools = {}
 
-def qkd_encrypt(data, token):
-    print("ENCRYPT USING TOKEN:", token)
+def get_key_as_client(token, pooled=True):
+
+    if not pooled:
+        # a per-file identity takes one or two keys, a pool would exchange keys that are never used
+        keys = get_key(ALICE_ADDRESS, CHANNEL_ADDRESS, token, 1, KEY_SIZE)
+        if not isinstance(keys, list):
+            raise Exception("QKD server answered with status {}".format(keys))
+        return keys[0]
+    if token not in client_pools:
+        client_pools[token] = start_pool(ALICE_ADDRESS, CHANNEL_ADDRESS, token, KEY_SIZE,
+                                         POOL_LOW_WATERMARK, POOL_HIGH_WATERMARK, POOL_BATCH_SIZE)
+    return client_pools[token].get()
+
+def stop_pool(token):
+    pool = client_pools.pop(token, None)
+    if pool is not None:
+        pool.stop()
 
-    key = None
+def stop_pools():
+    # the refill threads must not start new exchanges once the app exits
+    while client_pools:
+        client_pools.popitem()[1].stop()
+
+atexit.register(stop_pools)
+
+def qkd_key(token, pooled=True):
+    # both ends of a link must ask for a key in the same order, the client pool and the server pool hold the same keys
     if not QKD_ENABLE or token is None:
-        password = b"password"
-        salt = b'1234567890123456'
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=390000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password))
+        # same derivation as before, cached after the first call
+        return generate_token("password")
     elif ROLE is SERVER_ROLE:
-        key = get_key_as_server(token)
-    
+        return get_key_as_server(token)
     else:
-        key = get_key_as_client(token)
+        return get_key_as_client(token, pooled)
+
+# Keys of the links: the key of a (link token, file_id) is reused by the transfers of the file, without a new
+# exchange, until it protected max_bytes or it is older than max_age seconds. Then the sender takes the next key
+# (a rotation) and writes the generation of the key in the stream header, the receiver takes keys until it reaches the
+# same generation, so both ends consume the keys of the link in the same order.
+
+def link_identity(token, file_id):
+    # QKD users are registered as the link token followed by the file id
+    if token is None or file_id is None:
+        return token
+    return token + file_id
+
+class LinkKeyCache:
+
+    def __init__(self, max_bytes=KEY_MAX_BYTES, max_age=KEY_MAX_AGE):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.link_locks = {}
+        self.links = {}  # (token, file_id) -> {'generation', 'key', 'created', 'bytes'}
+        self.hits = 0
+        self.misses = 0
+        self.rotations = 0
+
+    def link_lock(self, link):
+        # a key exchange of a link does not block the other links
+        with self.lock:
+            return self.link_locks.setdefault(link, threading.Lock())
+
+    def take(self, link, generation):
+        # next key of the link from QKD (or the Fernet fallback)
+        # only the link tokens use a pool, the identity of a file link is used by a single file
+        token, file_id = link
+        self.links[link] = {'generation': generation, 'key': qkd_key(link_identity(token, file_id), file_id is None),
+                            'created': time.monotonic(), 'bytes': 0}
+        return self.links[link]
+
+    def expired(self, entry):
+        return entry['bytes'] >= self.max_bytes or time.monotonic() - entry['created'] >= self.max_age
+
+    def prepare(self, token, file_id=None):
+        # take the first key of a link, in requests to server the client does it before the storage answers
+        link = (token, file_id)
+        with self.link_lock(link):
+            if link not in self.links:
+                self.misses += 1
+                self.take(link, 0)
+
+    def sending_key(self, token, file_id=None):
+        # (generation, key) to encrypt a transfer, the sender decides the rotations
+        link = (token, file_id)
+        with self.link_lock(link):
+            entry = self.links.get(link)
+            if entry is None:
+                self.misses += 1
+                entry = self.take(link, 0)
+            elif self.expired(entry):
+                self.rotations += 1
+                entry = self.take(link, entry['generation'] + 1)
+            else:
+                self.hits += 1
+            return entry['generation'], entry['key']
+
+    def receiving_key(self, token, file_id=None, generation=0):
+        # key of the generation written by the sender, the keys in between were rotated by the sender
+        link = (token, file_id)
+        with self.link_lock(link):
+            entry = self.links.get(link)
+            if entry is None:
+                self.misses += 1
+                entry = self.take(link, 0)
+            elif entry['generation'] == generation:
+                self.hits += 1
+            while entry['generation'] < generation:
+                self.rotations += 1
+                entry = self.take(link, entry['generation'] + 1)
+            if entry['generation'] != generation:
+                raise StreamError("key generation {} of the link was already rotated".format(generation))
+            return entry['key']
+
+    def used(self, token, file_id, generation, size):
+        # bytes protected by a key
+        link = (token, file_id)
+        with self.link_lock(link):
+            entry = self.links.get(link)
+            if entry is not None and entry['generation'] == generation:
+                entry['bytes'] += size
+
+    def drop(self, token, file_id=None):
+        # forget a link once its transfers are done, the pool of a link token is stopped
+        link = (token, file_id)
+        with self.link_lock(link):
+            self.links.pop(link, None)
+        with self.lock:
+            self.link_locks.pop(link, None)
+        if file_id is None and token is not None:
+            stop_pool(token)
+
+    def stats(self):
+        with self.lock:
+            return {'links': len(self.links), 'hits': self.hits, 'misses': self.misses, 'rotations': self.rotations}
+
+link_keys = LinkKeyCache()
+
+def qkd_encrypt(data, token):
+    print("ENCRYPT USING TOKEN:", token)
+
+    key = qkd_key(token)
     
     print("ENCRYPT USING KEY: ", key)
     # using the generated key
@@ -85,24 +208,9 @@ def qkd_decrypt(data, token, key=None):
 
     print("DECRYPT USING TOKEN:", token)
 
-    if not key is None:
+    if key is None:
         # If key is given by user, we do nothing
-        pass
-    elif not QKD_ENABLE or token is None:
-        password = b"password"
-        salt = b'1234567890123456'
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=390000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password))
-    elif ROLE is SERVER_ROLE:
-        key = get_key_as_server(token)
-    
-    else: 
-        key = get_key_as_client(token)
+        key = qkd_key(token)
     print("DECRYPT USING KEY: ", key)
     # using the generated key
     fernet = Fernet(key)
@@ -111,6 +219,91 @@ def qkd_decrypt(data, token, key=None):
     decrypted = fernet.decrypt(data)
     return decrypted
 
+# Streaming transfer: the file is sent as a raw body of AES-GCM records, only one chunk is held in memory
+#
+#     header  MAGIC | nonce prefix (8 bytes) | chunk size (4 bytes) | key generation (4 bytes)
+#     record  final flag (1 byte) | length (4 bytes) | ciphertext of a chunk + tag (16 bytes)
+#
+# the nonce of a record is the prefix followed by its counter, the header, the counter and the final flag are
+# authenticated as associated data, so records cannot be reordered, dropped or truncated without failing decryption
+
+STREAM_MAGIC = b'QKD1'
+STREAM_HEADER = struct.Struct('!4s8sII')
+STREAM_RECORD = struct.Struct('!BI')
+STREAM_TAG = 16
+CHUNK_SIZE = 1 << 20
+
+class StreamError(Exception):
+    pass
+
+def stream_cipher(key):
+    # the QKD (or Fernet) key is a urlsafe base64 string of 32 bytes
+    return AESGCM(base64.urlsafe_b64decode(key))
+
+def record_data(header, counter, final):
+    return header + struct.pack('!QB', counter, final)
+
+def encrypt_file(src, key, chunk_size=CHUNK_SIZE, generation=0):
+    # generator of the encrypted stream of a file, generation identifies the key of the link
+    aesgcm = stream_cipher(key)
+    prefix = os.urandom(8)
+    header = STREAM_HEADER.pack(STREAM_MAGIC, prefix, chunk_size, generation)
+    yield header
+    with open(src, 'rb') as file:
+        counter = 0
+        chunk = file.read(chunk_size)
+        while True:
+            following = file.read(chunk_size)
+            final = int(not following)
+            nonce = prefix + counter.to_bytes(4, 'big')
+            encrypted = aesgcm.encrypt(nonce, chunk, record_data(header, counter, final))
+            yield STREAM_RECORD.pack(final, len(encrypted)) + encrypted
+            if final:
+                return
+            chunk = following
+            counter += 1
+
+def read_exact(stream, size):
+    # request and response streams may return less bytes than asked
+    data = b''
+    while len(data) < size:
+        part = stream.read(size - len(data))
+        if not part:
+            raise StreamError("truncated stream")
+        data += part
+    return data
+
+def decrypt_to_file(stream, key, dest):
+    # decrypt a stream chunk by chunk, dest is replaced only if the whole stream is authentic
+    # key may be a function of the key generation in the header, the generation is returned
+    header = read_exact(stream, STREAM_HEADER.size)
+    magic, prefix, chunk_size, generation = STREAM_HEADER.unpack(header)
+    if magic != STREAM_MAGIC:
+        raise StreamError("not an encrypted stream")
+    aesgcm = stream_cipher(key(generation) if callable(key) else key)
+    partial = dest + '.part'
+    try:
+        with open(partial, 'wb') as file:
+            counter = 0
+            while True:
+                final, length = STREAM_RECORD.unpack(read_exact(stream, STREAM_RECORD.size))
+                if length > chunk_size + STREAM_TAG:
+                    raise StreamError("record longer than the chunk size")
+                nonce = prefix + counter.to_bytes(4, 'big')
+                try:
+                    file.write(aesgcm.decrypt(nonce, read_exact(stream, length), record_data(header, counter, final)))
+                except InvalidTag:
+                    raise StreamError("record {} is not authentic".format(counter))
+                if final:
+                    break
+                counter += 1
+        os.replace(partial, dest)
+        return generation
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
 def random_string(l=10):
     return ''.join((random.choice(string.ascii_lowercase) for x in range(l)))
     
@@ -118,30 +311,37 @@ def scp_move(src, dest):
     os.system("scp {} {}".format(src, dest))
 
 
-def http_send(machine, port, src, dest, token=None):
-    with open(src, 'rb') as file:
-        data = file.read()
-    
-    enc_data = qkd_encrypt(data, token)
-    dic = {
-        'dst': dest,
-        'data': enc_data.decode('utf-8'),
-        'token': token
-    }
+# The last transfer of a file link is flagged with last, both ends drop the link after it so the key cache does not grow
+# with the files
+
+def send_file(src, token=None, file_id=None, chunk_size=CHUNK_SIZE, last=False):
+    # encrypted stream of a file with the key of the link, the stream keeps the key after the link is dropped
+    generation, key = link_keys.sending_key(token, file_id)
+    link_keys.used(token, file_id, generation, os.path.getsize(src))
+    if last:
+        link_keys.drop(token, file_id)
+    return encrypt_file(src, key, chunk_size, generation)
+
+def receive_file(stream, dest, token=None, file_id=None, last=False):
+    # decrypt a stream with the key of the link of the generation in its header
+    generation = decrypt_to_file(stream, lambda generation: link_keys.receiving_key(token, file_id, generation), dest)
+    link_keys.used(token, file_id, generation, os.path.getsize(dest))
+    if last:
+        link_keys.drop(token, file_id)
+
+def http_send(machine, port, src, dest, token=None, file_id=None, last=False):
+    # the body is streamed with chunked transfer encoding while the file is read and encrypted
     url = "http://{}:{}/store".format(machine, port)
-    
-    response = requests.post(url, json=json.dumps(dic))
+    response = requests.post(url, params={'dst': dest, 'token': token, 'file_id': file_id, 'last': int(last)},
+                             data=send_file(src, token, file_id, last=last),
+                             headers={'Content-Type': 'application/octet-stream'})
     return response
 
-def http_file_request(machine, port, src, dest, token=None):
-    key = None
-    if  QKD_ENABLE and ROLE is CLIENT_ROLE:
-        # In requests to server, it is needed to be done first by the client
-        key = get_key_as_client(token) 
-    url = "http://{}:{}/request?src={}&token={}".format(machine, port, src, token)
-    response = requests.get(url)
-    dic = json.loads(response.content)
-    enc_data = dic['data'].encode('utf-8')
-    data = qkd_decrypt(enc_data, token, key=key)
-    with open(dest, 'wb+') as file:
-        file.write(data)
+def http_file_request(machine, port, src, dest, token=None, file_id=None, last=False):
+    # In requests to server, the first key of the link is taken before the request, as the storage does before answering
+    link_keys.prepare(token, file_id)
+    url = "http://{}:{}/request".format(machine, port)
+    params = {'src': src, 'token': token, 'file_id': file_id, 'last': int(last)}
+    with requests.get(url, params=params, stream=True) as response:
+        response.raise_for_status()
+        receive_file(response.raw, dest, token, file_id, last)
@@ -29,4 +29,14 @@ ROLE = None
 
 # ROLE = SERVER_ROLE # COMMENT THIS LINE IF IT IS THE CLIENT
 # ROLE = CLIENT_ROLE # COMMENT THIS LINE IF IT IS THE SERVER
-QKD_ENABLE = False
\ No newline at end of file
+QKD_ENABLE = False
+# a key of a link is reused for the transfers of a file until it protected KEY_MAX_BYTES or it is older than
+# KEY_MAX_AGE seconds, then the next key is taken
+KEY_MAX_BYTES = 1 << 30
+KEY_MAX_AGE = 3600
+# keys of a link are exchanged ahead of time by the client: its pool is refilled up to POOL_HIGH_WATERMARK keys of
+# KEY_SIZE bits, in exchanges of at most POOL_BATCH_SIZE keys, when it holds fewer than POOL_LOW_WATERMARK keys
+KEY_SIZE = 1 << 8
+POOL_LOW_WATERMARK = 2
+POOL_HIGH_WATERMARK = 4
+POOL_BATCH_SIZE = 4
@@ -30,11 +30,11 @@ def http_runtime(id):
     ct_dest = DOCKER_DIR + 'data/processing/img_%s.enc' %(file_id)
     result_src = DOCKER_DIR + 'data/processing/result_%s.enc' %(file_id)
     result_dest = DOCKER_DIR + 'data/storage/result_%s.enc' %(file_id)
-    http_file_request(STORAGE_MACHINE, STORAGE_PORT, ct_src, ct_dest, LINK_2_TOKEN + file_id)
+    http_file_request(STORAGE_MACHINE, STORAGE_PORT, ct_src, ct_dest, LINK_2_TOKEN, file_id)
 
     runtime(input_ciphertext=ct_dest, output_ciphertext=result_src)
 
-    http_send(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_2_TOKEN + file_id)
+    http_send(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_2_TOKEN, file_id, last=True)
 
     dic = {
         'file_id': file_id
@@ -44,6 +44,26 @@ def http_runtime(id):
 
 
 
+@app.route("/runtime-batch/<id>", methods=["GET"])
+def http_runtime_batch(id):
+    file_id = id.replace("./"," ")
+    ct_src = DOCKER_DIR + 'data/storage/batch_%s.enc' %(file_id)
+    ct_dest = DOCKER_DIR + 'data/processing/batch_%s.enc' %(file_id)
+    result_src = DOCKER_DIR + 'data/processing/result_batch_%s.enc' %(file_id)
+    result_dest = DOCKER_DIR + 'data/storage/result_batch_%s.enc' %(file_id)
+    http_file_request(STORAGE_MACHINE, STORAGE_PORT, ct_src, ct_dest, LINK_2_TOKEN, file_id)
+
+    runtime_batch(input_ciphertext=ct_dest, output_ciphertext=result_src)
+
+    http_send(STORAGE_MACHINE, STORAGE_PORT, result_src, result_dest, LINK_2_TOKEN, file_id, last=True)
+
+    dic = {
+        'file_id': file_id
+    }
+
+    return Response(json.dumps(dic), status=200)
+
+
 #By default the server is running at port 5000
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PROCESSING_PORT)
@@ -16,6 +16,7 @@ import os, json
 
 from python.go import *
 from python.qkd import qkd_encrypt, qkd_decrypt, random_string, http_send, http_file_request, register_user
+from python.qkd import link_keys, send_file, receive_file, StreamError
 from python.config import * 
 
 #setting the flask instance
@@ -33,25 +34,31 @@ def register():
 def http_request():
     path = request.args.get('src').replace("./", " ") # forces an error if malicious
     token = request.args.get('token')
-    with open(path, 'rb') as file:
-        data = file.read()
-    enc_data = qkd_encrypt(data, token)
-    dic = {
-        'data': enc_data.decode('utf-8')
-    }
-    return Response(json.dumps(dic), status=200)
+    file_id = request.args.get('file_id')
+    last = request.args.get('last') == '1'
+    if not os.path.isfile(path):
+        return Response("Not Found", status=404)
+    # the file is read and encrypted chunk by chunk while the response is sent
+    return Response(send_file(path, token, file_id, last=last), status=200, mimetype='application/octet-stream')
 
 @app.route("/store", methods=["POST"])
 def http_recv():
-    dic = json.loads(request.get_json())
-    token = dic['token']
-    dst = dic['dst'].replace("./"," ") # forces an error if malicious
-    enc_data = dic['data'].encode('utf-8')
-    data = qkd_decrypt(enc_data, token)
-    with open(dst, 'wb+') as file:
-        file.write(data)
+    token = request.args.get('token')
+    file_id = request.args.get('file_id')
+    dst = request.args.get('dst').replace("./"," ") # forces an error if malicious
+    last = request.args.get('last') == '1'
+    try:
+        # the body is decrypted chunk by chunk while it is received
+        receive_file(request.stream, dst, token, file_id, last)
+    except StreamError as e:
+        return Response(str(e), status=400)
     return Response("OK", status=200)
 
+@app.route("/key-cache", methods=["GET"])
+def http_key_cache():
+    # hits, misses and rotations of the keys of the links
+    return Response(json.dumps(link_keys.stats()), status=200)
+
 
 #By default the server is running at port 5000
 if __name__ == '__main__':
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*- 
+# ----------------------------------------------------------------------------
+# Created By  : José Cabrero-Holgueras
+# Created Date: 01/2022
+# Copyright: CERN
+# License: MIT
+# version ='1.0'
+# ---------------------------------------------------------------------------
+
+import io, os
+
+from python import qkd
+
+
+def test_link_dropped_after_round_trip(tmp_path):
+    # the sender and the receiver of the last transfer of a file both drop the link
+    src = tmp_path / 'img.enc'
+    dest = tmp_path / 'copy.enc'
+    src.write_bytes(os.urandom(3 * qkd.CHUNK_SIZE + 1))
+
+    stream = io.BytesIO(b''.join(qkd.send_file(str(src), 'token', 'file', last=True)))
+    assert qkd.link_keys.stats()['links'] == 0
+    qkd.receive_file(stream, str(dest), 'token', 'file', last=True)
+
+    assert dest.read_bytes() == src.read_bytes()
+    assert qkd.link_keys.stats()['links'] == 0
+    assert qkd.link_keys.link_locks == {}
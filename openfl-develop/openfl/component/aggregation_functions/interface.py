@@ -14,7 +14,15 @@ from openfl.utilities import SingletonABCMeta
 
 
 class AggregationFunctionInterface(metaclass=SingletonABCMeta):
-    """Interface for specifying aggregation function."""
+    """Interface for specifying aggregation function.
+
+    Attributes:
+        streaming (bool): The result is the weighted average of the local
+            tensors, so the aggregator may compute it incrementally as the
+            collaborators send their results, without keeping their tensors.
+    """
+
+    streaming = False
 
     @abstractmethod
     def call(self,
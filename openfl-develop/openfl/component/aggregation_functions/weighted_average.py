@@ -16,6 +16,8 @@ def weighted_average(tensors, weights):
 class WeightedAverage(AggregationFunctionInterface):
     """Weighted average aggregation."""
 
+    streaming = True
+
     def call(self, local_tensors, *_):
         """Aggregate tensors.
 
@@ -3,6 +3,7 @@
 
 """Aggregator module."""
 import queue
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 
 from openfl.databases import TensorDB
@@ -26,6 +27,12 @@ class Aggregator:
         last_state_path* (str): The file location to store the latest weight.
         best_state_path* (str): The file location to store the weight of the best model.
         db_store_rounds* (int): Rounds to store in TensorDB.
+        aggregation_workers* (int): Threads aggregating, creating deltas and
+            compressing the layers at the end of a round. 1 works sequentially.
+        streaming_aggregation* (bool): Average the tensors of the tasks with a
+            streaming aggregation function (WeightedAverage) as they arrive,
+            instead of keeping the tensors of every collaborator until the
+            end of the round.
 
     Note:
         \* - plan setting.
@@ -48,6 +55,8 @@ class Aggregator:
                  single_col_cert_common_name=None,
                  compression_pipeline=None,
                  db_store_rounds=1,
+                 aggregation_workers=1,
+                 streaming_aggregation=False,
 
                  **kwargs):
         """Initialize."""
@@ -78,6 +87,14 @@ class Aggregator:
         self.tensor_codec = TensorCodec(self.compression_pipeline)
         self.logger = getLogger(__name__)
 
+        # NumPy releases the GIL on large arrays, so layers are processed
+        # in threads, which share the TensorDB and the aggregation functions
+        self.aggregation_executor = None
+        if aggregation_workers > 1:
+            self.aggregation_executor = ThreadPoolExecutor(
+                max_workers=aggregation_workers, thread_name_prefix='aggregation')
+        self.streaming_aggregation = streaming_aggregation
+
         self.init_state_path = init_state_path
         self.best_state_path = best_state_path
         self.last_state_path = last_state_path
@@ -336,9 +353,8 @@ class Aggregator:
         else:
             compress_lossless = False
 
-        # TODO the TensorDB doesn't support compressed data yet.
-        #  The returned tensor will
-        # be recompressed anyway.
+        # Compressed forms are kept in the TensorDB under the key of the
+        # uncompressed tensor
         if 'compressed' in tags:
             tags.remove('compressed')
         if 'lossy_compressed' in tags:
@@ -362,8 +378,7 @@ class Aggregator:
             raise ValueError(f'Aggregator does not have an aggregated tensor for {tensor_key}')
 
         # quite a bit happens in here, including compression, delta handling,
-        # etc...
-        # we might want to cache these as well
+        # etc... unless the compressed tensor is already in the TensorDB
         named_tensor = self._nparray_to_named_tensor(
             agg_tensor_key,
             nparray,
@@ -379,33 +394,42 @@ class Aggregator:
         Construct the NamedTensor Protobuf.
 
         Also includes logic to create delta, compress tensors with the TensorCodec, etc.
+        The compressed tensor is cached in the TensorDB, so it is compressed
+        only once for all of the collaborators.
         """
         tensor_name, origin, round_number, report, tags = tensor_key
         # if we have an aggregated tensor, we can make a delta
         if 'aggregated' in tags and send_model_deltas:
-            # Should get the pretrained model to create the delta. If training
-            # has happened, Model should already be stored in the TensorDB
-            model_tk = TensorKey(tensor_name,
-                                 origin,
-                                 round_number - 1,
-                                 report,
-                                 ('model',))
-
-            model_nparray = self.tensor_db.get_tensor_from_cache(model_tk)
-
-            assert (model_nparray is not None), (
-                'The original model layer should be present if the latest '
-                'aggregated model is present')
-            delta_tensor_key, delta_nparray = self.tensor_codec.generate_delta(
-                tensor_key,
-                nparray,
-                model_nparray
-            )
-            delta_comp_tensor_key, delta_comp_nparray, metadata = self.tensor_codec.compress(
-                delta_tensor_key,
-                delta_nparray,
-                lossless=compress_lossless
+            delta_tensor_key = TensorKey(
+                tensor_name, origin, round_number, report, tuple(tags) + ('delta',)
             )
+            compressed = self.tensor_db.get_compressed_tensor_from_cache(delta_tensor_key)
+            if compressed is None:
+                # Should get the pretrained model to create the delta. If training
+                # has happened, Model should already be stored in the TensorDB
+                model_tk = TensorKey(tensor_name,
+                                     origin,
+                                     round_number - 1,
+                                     report,
+                                     ('model',))
+
+                model_nparray = self.tensor_db.get_tensor_from_cache(model_tk)
+
+                assert (model_nparray is not None), (
+                    'The original model layer should be present if the latest '
+                    'aggregated model is present')
+                delta_tensor_key, delta_nparray = self.tensor_codec.generate_delta(
+                    tensor_key,
+                    nparray,
+                    model_nparray
+                )
+                compressed = self.tensor_codec.compress(
+                    delta_tensor_key,
+                    delta_nparray,
+                    lossless=compress_lossless
+                )
+                self.tensor_db.cache_compressed_tensor(delta_tensor_key, *compressed)
+            delta_comp_tensor_key, delta_comp_nparray, metadata = compressed
             named_tensor = utils.construct_named_tensor(
                 delta_comp_tensor_key,
                 delta_comp_nparray,
@@ -415,11 +439,15 @@ class Aggregator:
 
         else:
             # Assume every other tensor requires lossless compression
-            compressed_tensor_key, compressed_nparray, metadata = self.tensor_codec.compress(
-                tensor_key,
-                nparray,
-                require_lossless=True
-            )
+            compressed = self.tensor_db.get_compressed_tensor_from_cache(tensor_key)
+            if compressed is None or 'compressed' not in compressed[0].tags:
+                compressed = self.tensor_codec.compress(
+                    tensor_key,
+                    nparray,
+                    require_lossless=True
+                )
+                self.tensor_db.cache_compressed_tensor(tensor_key, *compressed)
+            compressed_tensor_key, compressed_nparray, metadata = compressed
             named_tensor = utils.construct_named_tensor(
                 compressed_tensor_key,
                 compressed_nparray,
@@ -486,6 +514,9 @@ class Aggregator:
         # initialize the list of tensors that go with this task
         # Setting these incrementally is leading to missing values
         task_results = []
+        # processed tensors are inserted into TensorDB in one batch
+        tensor_key_dict = {}
+        agg_function = self.assigner.get_aggregation_type_for_task(task_name)
 
         # go through the tensors and add them to the tensor dictionary and the
         # task dictionary
@@ -502,6 +533,14 @@ class Aggregator:
             tensor_key, nparray = self._process_named_tensor(
                 named_tensor, collaborator_name
             )
+            if self._streams(tensor_key, agg_function):
+                # Only the running weighted sum is kept, metrics are
+                # always averaged
+                agg_tensor_key = tensor_key._replace(tags=tensor_key.tags[:-1])
+                self.tensor_db.accumulate_tensor(
+                    agg_tensor_key, collaborator_name, nparray, data_size)
+            else:
+                tensor_key_dict.setdefault(tensor_key, nparray)
             if 'metric' in tensor_key.tags:
                 metric_dict = {
                     'metric_origin': tensor_key.tags[-1],
@@ -522,15 +561,23 @@ class Aggregator:
             # (if more data is added)
             self.collaborator_task_weight[task_key] = data_size
 
+        self.tensor_db.cache_tensors(tensor_key_dict)
         self.collaborator_tasks_results[task_key] = task_results
 
         self._end_of_task_check(task_name)
 
+    def _streams(self, tensor_key, agg_function):
+        """Check whether the tensor is aggregated as it arrives."""
+        if not self.streaming_aggregation:
+            return False
+        return 'metric' in tensor_key.tags or getattr(agg_function, 'streaming', False)
+
     def _process_named_tensor(self, named_tensor, collaborator_name):
         """
         Extract the named tensor fields.
 
-        Performs decompression, delta computation, and inserts results into TensorDB.
+        Performs decompression and delta computation. The caller inserts
+        the results into TensorDB.
 
         Args:
             named_tensor:       NamedTensor (protobuf)
@@ -615,7 +662,6 @@ class Aggregator:
             final_nparray = decompressed_nparray
 
         assert (final_nparray is not None), f'Could not create tensorkey {final_tensor_key}'
-        self.tensor_db.cache_tensor({final_tensor_key: final_nparray})
         self.logger.debug(f'Created TensorKey: {final_tensor_key}')
 
         return final_tensor_key, final_nparray
@@ -646,6 +692,9 @@ class Aggregator:
            round_number: int
            report: bool
            agg_results: np.array
+
+        Returns:
+            list of (TensorKey, np.array) to insert into TensorDB
         """
         # The aggregated tensorkey tags should have the form of
         # 'trained' or 'trained.lossy_decompressed'
@@ -662,7 +711,7 @@ class Aggregator:
             report,
             ('aggregated',)
         )
-        self.tensor_db.cache_tensor({agg_tag_tk: agg_results})
+        tensor_items = [(agg_tag_tk, agg_results)]
 
         # Create delta and save it in TensorDB
         base_model_tk = TensorKey(
@@ -691,19 +740,21 @@ class Aggregator:
             delta_tk, delta_nparray
         )
 
-        # TODO extend the TensorDB so that compressed data is
-        #  supported. Once that is in place
-        # the compressed delta can just be stored here instead
-        # of recreating it for every request
+        # The compressed delta is what collaborators will receive, it is
+        # stored so that get_aggregated_tensor does not compress it again
+        self.tensor_db.cache_compressed_tensor(
+            delta_tk, compressed_delta_tk, compressed_delta_nparray, metadata
+        )
 
-        # Decompress lossless/lossy
+        # Decompress lossless/lossy, the new model is built from the same
+        # (possibly lossy) delta that the collaborators apply
         decompressed_delta_tk, decompressed_delta_nparray = self.tensor_codec.decompress(
             compressed_delta_tk,
             compressed_delta_nparray,
             metadata
         )
 
-        self.tensor_db.cache_tensor({decompressed_delta_tk: decompressed_delta_nparray})
+        tensor_items.append((decompressed_delta_tk, decompressed_delta_nparray))
 
         # Apply delta (unless delta couldn't be created)
         if base_model_nparray is not None:
@@ -729,8 +780,10 @@ class Aggregator:
             ('model',)
         )
 
-        # Finally, cache the updated model tensor
-        self.tensor_db.cache_tensor({final_model_tk: new_model_nparray})
+        # Finally, the aggregated layer, the delta and the updated model
+        # tensor are returned to be cached with the other layers
+        tensor_items.append((final_model_tk, new_model_nparray))
+        return tensor_items
 
     def _compute_validation_related_task_metrics(self, task_name):
         """
@@ -764,18 +817,39 @@ class Aggregator:
         # tensor for that round
         agg_function = self.assigner.get_aggregation_type_for_task(task_name)
         task_key = TaskResultKey(task_name, collaborators_for_task[0], self.round_number)
-        for tensor_key in self.collaborator_tasks_results[task_key]:
-            tensor_name, origin, round_number, report, tags = tensor_key
-            assert (tags[-1] == collaborators_for_task[0]), (
+        tensor_keys = self.collaborator_tasks_results[task_key]
+        for tensor_key in tensor_keys:
+            assert (tensor_key.tags[-1] == collaborators_for_task[0]), (
                 f'Tensor {tensor_key} in task {task_name} has not been processed correctly'
             )
 
+        def aggregate(tensor_key):
+            tensor_name, origin, round_number, report, tags = tensor_key
             # Strip the collaborator label, and lookup aggregated tensor
             new_tags = tuple(tags[:-1])
             agg_tensor_key = TensorKey(tensor_name, origin, round_number, report, new_tags)
-            agg_tensor_name, agg_origin, agg_round_number, agg_report, agg_tags = agg_tensor_key
-            agg_results = self.tensor_db.get_aggregated_tensor(
-                agg_tensor_key, collaborator_weight_dict, aggregation_function=agg_function)
+            agg_results = None
+            if self._streams(tensor_key, agg_function):
+                agg_results = self.tensor_db.get_accumulated_tensor(
+                    agg_tensor_key, collaborator_weight_dict.keys())
+            if agg_results is None:
+                agg_results = self.tensor_db.get_aggregated_tensor(
+                    agg_tensor_key, collaborator_weight_dict, aggregation_function=agg_function)
+            tensor_items = []
+            if 'trained' in tags:
+                tensor_items = self._prepare_trained(
+                    tensor_name, origin, round_number, report, agg_results)
+            return agg_results, tensor_items
+
+        # Layers are aggregated, turned into deltas and compressed in
+        # parallel, then their tensors are committed to TensorDB in one batch
+        results = self._map_layers(aggregate, tensor_keys)
+        self.tensor_db.cache_tensors(
+            item for _, tensor_items in results for item in tensor_items)
+
+        for tensor_key, (agg_results, _) in zip(tensor_keys, results):
+            tensor_name, origin, round_number, report, tags = tensor_key
+            agg_tensor_name = tensor_name
             if report:
                 # Print the aggregated metric
                 metric_dict = {
@@ -808,8 +882,12 @@ class Aggregator:
                                            f'model with score {agg_results:f}')
                         self.best_model_score = agg_results
                         self._save_model(round_number, self.best_state_path)
-            if 'trained' in tags:
-                self._prepare_trained(tensor_name, origin, round_number, report, agg_results)
+
+    def _map_layers(self, func, tensor_keys):
+        """Apply func to every tensor key, in the aggregation threads if there are any."""
+        if self.aggregation_executor is None:
+            return [func(tensor_key) for tensor_key in tensor_keys]
+        return list(self.aggregation_executor.map(func, tensor_keys))
 
     def _end_of_round_check(self):
         """
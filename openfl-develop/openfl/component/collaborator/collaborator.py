@@ -209,8 +209,9 @@ class Collaborator:
             **kwargs)
 
         # Save global and local output_tensor_dicts to TensorDB
-        self.tensor_db.cache_tensor(global_output_tensor_dict)
-        self.tensor_db.cache_tensor(local_output_tensor_dict)
+        self.tensor_db.cache_tensors(
+            [*global_output_tensor_dict.items(), *local_output_tensor_dict.items()]
+        )
 
         # send the results for this tasks; delta and compression will occur in
         # this function
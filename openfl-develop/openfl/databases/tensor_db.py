@@ -17,40 +17,62 @@ class TensorDB:
     """
     The TensorDB stores a tensor key and the data that it corresponds to.
 
-    It is built on top of a pandas dataframe
-    for it's easy insertion, retreival and aggregation capabilities. Each
-    collaborator and aggregator has its own TensorDB.
+    Tensors are kept in a dictionary keyed by TensorKey, so a lookup does not
+    depend on the number of tensors stored. A secondary index by round is used
+    for cleaning up and for iterating over the history. Each collaborator and
+    aggregator has its own TensorDB.
+
+    The compressed form of a tensor (bytes and transformer metadata) can be
+    kept next to it, keyed by the uncompressed tensor key, so that it is
+    compressed once and sent many times.
+
+    For streaming aggregation, a running weighted sum of the collaborator
+    tensors is kept under the aggregated tensor key instead of the tensors.
     """
 
+    columns = ['tensor_name', 'origin', 'round', 'report', 'tags', 'nparray']
+
     def __init__(self):
         """Initialize."""
-        self.tensor_db = pd.DataFrame([], columns=[
-            'tensor_name', 'origin', 'round', 'report', 'tags', 'nparray'
-        ])
+        self.tensors = {}
+        self.compressed = {}  # tensor_key -> (compressed_tensor_key, data, metadata)
+        self.accumulators = {}  # tensor_key -> [weighted sum, total weight, collaborators]
+        self.rounds = {}  # round -> {tensor_key: None}, keys in insertion order
         self.mutex = Lock()
 
     def __repr__(self):
         """Representation of the object."""
+        with self.mutex:
+            rows = [list(tensor_key) for tensor_key in self.tensors]
+        content = pd.DataFrame(rows, columns=self.columns[:-1])
         with pd.option_context('display.max_rows', None):
-            content = self.tensor_db[['tensor_name', 'origin', 'round', 'report', 'tags']]
             return f'TensorDB contents:\n{content}'
 
     def __str__(self):
         """Printable string representation."""
         return self.__repr__()
 
+    def __len__(self):
+        """Return the number of tensors stored."""
+        return len(self.tensors)
+
     def clean_up(self, remove_older_than=1):
         """Remove old entries from database preventing the db from becoming too large and slow."""
         if remove_older_than < 0:
             # Getting a negative argument calls off cleaning
             return
-        current_round = int(self.tensor_db['round'].max())
-        self.tensor_db = self.tensor_db[
-            self.tensor_db['round'] > current_round - remove_older_than
-        ].reset_index(drop=True)
+        with self.mutex:
+            if not self.rounds:
+                return
+            current_round = int(max(self.rounds))
+            for fl_round in [r for r in self.rounds if r <= current_round - remove_older_than]:
+                for tensor_key in self.rounds.pop(fl_round):
+                    self.tensors.pop(tensor_key, None)
+                    self.compressed.pop(tensor_key, None)
+                    self.accumulators.pop(tensor_key, None)
 
     def cache_tensor(self, tensor_key_dict):
-        """Insert tensor into TensorDB (dataframe).
+        """Insert tensor into TensorDB.
 
         Args:
             tensor_key_dict: The Tensor Key
@@ -58,27 +80,105 @@ class TensorDB:
         Returns:
             None
         """
-        entries_to_add = []
+        self.cache_tensors(tensor_key_dict)
+
+    def cache_tensors(self, tensor_items):
+        """Insert many tensors into TensorDB while holding the mutex once.
+
+        Each insert is a dictionary assignment, so a batch of n tensors
+        costs O(n) whatever the size of the TensorDB.
+
+        Args:
+            tensor_items: dict {TensorKey: nparray} or iterable of
+                          (TensorKey, nparray) pairs
+
+        Returns:
+            None
+        """
+        if isinstance(tensor_items, dict):
+            tensor_items = tensor_items.items()
         with self.mutex:
-            for tensor_key, nparray in tensor_key_dict.items():
-                tensor_name, origin, fl_round, report, tags = tensor_key
-                entries_to_add.append(
-                    pd.DataFrame([
-                        [tensor_name, origin, fl_round, report, tags, nparray]
-                    ],
-                        columns=[
-                            'tensor_name',
-                            'origin',
-                            'round',
-                            'report',
-                            'tags',
-                            'nparray']
-                    )
-                )
-
-            self.tensor_db = pd.concat(
-                [self.tensor_db, *entries_to_add], ignore_index=True
-            )
+            for tensor_key, nparray in tensor_items:
+                tensor_key = TensorKey(*tensor_key)
+                # The first tensor cached for a key is kept, as with the first matching row
+                if tensor_key in self.tensors:
+                    continue
+                self.tensors[tensor_key] = nparray
+                self.rounds.setdefault(tensor_key.round_number, {})[tensor_key] = None
+
+    def cache_compressed_tensor(self, tensor_key, compressed_tensor_key, data, metadata):
+        """Insert the compressed form of a tensor into TensorDB.
+
+        Args:
+            tensor_key: TensorKey of the uncompressed tensor
+            compressed_tensor_key: TensorKey returned by the TensorCodec,
+                                   with a 'compressed' or 'lossy_compressed' tag
+            data: compressed bytes
+            metadata: transformer metadata needed for decompression
+
+        Returns:
+            None
+        """
+        tensor_key = TensorKey(*tensor_key)
+        with self.mutex:
+            self.compressed[tensor_key] = (compressed_tensor_key, data, metadata)
+            self.rounds.setdefault(tensor_key.round_number, {})[tensor_key] = None
+
+    def get_compressed_tensor_from_cache(self, tensor_key):
+        """
+        Perform a lookup of the compressed form of tensor_key in the TensorDB.
+
+        Returns (compressed_tensor_key, data, metadata) if it is available
+        Otherwise, it returns 'None'
+        """
+        return self.compressed.get(TensorKey(*tensor_key))
+
+    def accumulate_tensor(self, tensor_key, col_name, nparray, weight):
+        """Add a collaborator tensor to the running weighted sum of tensor_key.
+
+        Args:
+            tensor_key: TensorKey of the aggregated tensor, without the
+                        collaborator tag
+            col_name: collaborator that sent the tensor
+            nparray: tensor of the collaborator
+            weight: weight of the collaborator, e.g. its data size
+
+        Returns:
+            None
+        """
+        tensor_key = TensorKey(*tensor_key)
+        weighted = np.multiply(nparray, weight, dtype=np.float64)
+        with self.mutex:
+            accumulator = self.accumulators.get(tensor_key)
+            if accumulator is None:
+                self.accumulators[tensor_key] = [weighted, weight, {col_name}]
+                self.rounds.setdefault(tensor_key.round_number, {})[tensor_key] = None
+            else:
+                accumulator[0] += weighted
+                accumulator[1] += weight
+                accumulator[2].add(col_name)
+
+    def get_accumulated_tensor(self, tensor_key, collaborator_names):
+        """
+        Finish the streaming aggregation of tensor_key.
+
+        The weighted average is cached under tensor_key and returned if every
+        collaborator has sent its tensor. Otherwise, it returns 'None'
+        """
+        tensor_key = TensorKey(*tensor_key)
+        with self.mutex:
+            accumulator = self.accumulators.get(tensor_key)
+            if accumulator is None:
+                return None
+            weighted_sum, total_weight, col_names = accumulator
+            for col in collaborator_names:
+                if col not in col_names:
+                    print(f'No results for collaborator {col}, TensorKey={tensor_key}')
+                    return None
+            del self.accumulators[tensor_key]
+        agg_nparray = weighted_sum / total_weight
+        self.cache_tensor({tensor_key: agg_nparray})
+        return np.array(agg_nparray)
 
     def get_tensor_from_cache(self, tensor_key):
         """
@@ -87,18 +187,11 @@ class TensorDB:
         Returns the nparray if it is available
         Otherwise, it returns 'None'
         """
-        tensor_name, origin, fl_round, report, tags = tensor_key
-
         # TODO come up with easy way to ignore compression
-        df = self.tensor_db[(self.tensor_db['tensor_name'] == tensor_name)
-                            & (self.tensor_db['origin'] == origin)
-                            & (self.tensor_db['round'] == fl_round)
-                            & (self.tensor_db['report'] == report)
-                            & (self.tensor_db['tags'] == tags)]
-
-        if len(df) == 0:
+        nparray = self.tensors.get(TensorKey(*tensor_key))
+        if nparray is None:
             return None
-        return np.array(df['nparray'].iloc[0])
+        return np.array(nparray)
 
     def get_aggregated_tensor(self, tensor_key, collaborator_weight_dict,
                               aggregation_function):
@@ -132,31 +225,22 @@ class TensorDB:
         # Check if the aggregated tensor is already present in TensorDB
         tensor_name, origin, fl_round, report, tags = tensor_key
 
-        raw_df = self.tensor_db[(self.tensor_db['tensor_name'] == tensor_name)
-                                & (self.tensor_db['origin'] == origin)
-                                & (self.tensor_db['round'] == fl_round)
-                                & (self.tensor_db['report'] == report)
-                                & (self.tensor_db['tags'] == tags)]['nparray']
-        if len(raw_df) > 0:
-            return np.array(raw_df.iloc[0]), {}
+        nparray = self.tensors.get(TensorKey(*tensor_key))
+        if nparray is not None:
+            return np.array(nparray), {}
 
         for col in collaborator_names:
             if type(tags) == str:
                 new_tags = tuple([tags] + [col])
             else:
                 new_tags = tuple(list(tags) + [col])
-            raw_df = self.tensor_db[
-                (self.tensor_db['tensor_name'] == tensor_name)
-                & (self.tensor_db['origin'] == origin)
-                & (self.tensor_db['round'] == fl_round)
-                & (self.tensor_db['report'] == report)
-                & (self.tensor_db['tags'] == new_tags)]['nparray']
-            if len(raw_df) == 0:
-                tk = TensorKey(tensor_name, origin, report, fl_round, new_tags)
+            tk = TensorKey(tensor_name, origin, fl_round, report, new_tags)
+            nparray = self.tensors.get(tk)
+            if nparray is None:
                 print(f'No results for collaborator {col}, TensorKey={tk}')
                 return None
             else:
-                agg_tensor_dict[col] = raw_df.iloc[0]
+                agg_tensor_dict[col] = nparray
 
         local_tensors = [LocalTensor(col_name=col_name,
                                      tensor=agg_tensor_dict[col_name],
@@ -175,8 +259,18 @@ class TensorDB:
 
         return np.array(agg_nparray)
 
-    def _iterate(self, order_by='round', ascending=False):
-        columns = ['round', 'nparray', 'tensor_name', 'tags']
-        rows = self.tensor_db[columns].sort_values(by=order_by, ascending=ascending).iterrows()
-        for _, row in rows:
-            yield row
+    def _iterate(self, ascending=False):
+        """Yield rows with the columns round, nparray, tensor_name and tags ordered by round."""
+        with self.mutex:
+            tensor_keys = [tensor_key
+                           for fl_round in sorted(self.rounds, reverse=not ascending)
+                           for tensor_key in self.rounds[fl_round]]
+        for tensor_key in tensor_keys:
+            nparray = self.tensors.get(tensor_key)
+            if nparray is None:
+                # removed by clean_up while iterating
+                continue
+            yield pd.Series({'round': tensor_key.round_number,
+                             'nparray': nparray,
+                             'tensor_name': tensor_key.tensor_name,
+                             'tags': tensor_key.tags})
@@ -2,14 +2,19 @@
 # SPDX-License-Identifier: Apache-2.0
 """Aggregator tests module."""
 
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
+import numpy as np
 import pytest
 
 from openfl.component import aggregator
+from openfl.component.aggregation_functions import Median
+from openfl.component.aggregation_functions import WeightedAverage
 from openfl.component.assigner import Assigner
 from openfl.protocols import ModelProto
 from openfl.utilities import TaskResultKey
+from openfl.utilities import TensorKey
 
 
 @pytest.fixture
@@ -151,6 +156,73 @@ def test_get_aggregated_tensor(agg):
             collaborator_name, tensor_name, round_number, report, tags, require_lossless)
 
 
+def test_get_aggregated_tensor_compressed_once(agg, mocker):
+    """Test that the delta compressed at round end is served to every collaborator."""
+    model_tk = TensorKey('test_tensor_name', agg.uuid, 0, False, ('model',))
+    agg.tensor_db.cache_tensor({model_tk: np.zeros(4, dtype=np.float32)})
+    agg.tensor_db.cache_tensors(agg._prepare_trained(
+        'test_tensor_name', agg.uuid, 0, False, np.ones(4, dtype=np.float32)))
+    compress = mocker.spy(agg.tensor_codec, 'compress')
+
+    named_tensors = [
+        agg.get_aggregated_tensor(
+            col, 'test_tensor_name', 1, False, ['aggregated', 'delta'], False)
+        for col in ('col1', 'col2')
+    ]
+
+    compress.assert_not_called()
+    assert named_tensors[0] == named_tensors[1]
+    assert named_tensors[0].data_bytes == np.ones(4, dtype=np.float32).tobytes()
+
+
+def test_prepare_trained_returns_tensors(agg):
+    """Test that _prepare_trained returns the aggregated, delta and model tensors."""
+    model_tk = TensorKey('test_tensor_name', agg.uuid, 0, False, ('model',))
+    agg.tensor_db.cache_tensor({model_tk: np.zeros(4, dtype=np.float32)})
+
+    tensor_items = agg._prepare_trained(
+        'test_tensor_name', agg.uuid, 0, False, np.ones(4, dtype=np.float32))
+
+    assert [tk.tags for tk, _ in tensor_items] == [
+        ('aggregated',), ('aggregated', 'delta'), ('model',)]
+    assert all(tk.round_number == 1 for tk, _ in tensor_items)
+    assert np.array_equal(tensor_items[-1][1], np.ones(4))
+
+
+@pytest.mark.parametrize('aggregation_workers', [1, 4])
+def test_map_layers(agg, aggregation_workers):
+    """Test that layers are processed in order with and without aggregation threads."""
+    if aggregation_workers > 1:
+        agg.aggregation_executor = ThreadPoolExecutor(max_workers=aggregation_workers)
+    tensor_keys = [TensorKey(f'layer_{i}', agg.uuid, 0, False, ('trained',)) for i in range(16)]
+
+    results = agg._map_layers(lambda tensor_key: tensor_key.tensor_name, tensor_keys)
+
+    assert results == [f'layer_{i}' for i in range(16)]
+
+
+@pytest.mark.parametrize('agg_function,streams', [(WeightedAverage(), True), (Median(), False)])
+def test_send_local_task_results_streaming(agg, mocker, agg_function, streams):
+    """Test that streamed tensors are averaged as they arrive and not stored."""
+    agg.streaming_aggregation = True
+    mocker.patch.object(agg.assigner, 'get_aggregation_type_for_task', return_value=agg_function)
+    mocker.patch.object(agg, '_end_of_task_check')
+    agg_tensor_key = TensorKey('test_tensor_name', agg.uuid, 0, False, ('trained',))
+    for col, value, data_size in (('col1', 1.0, 1), ('col2', 4.0, 3)):
+        tensor_key = agg_tensor_key._replace(tags=('trained', col))
+        mocker.patch.object(agg, '_process_named_tensor',
+                            return_value=(tensor_key, np.full(4, value)))
+        agg.send_local_task_results(col, 0, 'train', data_size, [mock.Mock(round_number=0)])
+
+    assert (agg.tensor_db.get_tensor_from_cache(tensor_key) is None) == streams
+    agg_nparray = agg.tensor_db.get_accumulated_tensor(agg_tensor_key, ['col1', 'col2'])
+    if streams:
+        assert np.allclose(agg_nparray, np.full(4, 3.25))
+        assert np.array_equal(agg.tensor_db.get_tensor_from_cache(agg_tensor_key), agg_nparray)
+    else:
+        assert agg_nparray is None
+
+
 def test_collaborator_task_completed_none(agg):
     """Test that returns False if there are not collaborator tasks results."""
     round_num = 0
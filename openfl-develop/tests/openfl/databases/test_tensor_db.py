@@ -2,6 +2,9 @@
 # SPDX-License-Identifier: Apache-2.0
 """Collaborator tests module."""
 
+import os
+import timeit
+
 import numpy as np
 import pytest
 
@@ -69,6 +72,17 @@ def test_cache_and_get_tensor(nparray, tensor_key):
     assert np.array_equal(nparray, cached_nparray)
 
 
+def test_cache_tensors(nparray, tensor_key):
+    """Test that cache_tensors inserts pairs and keeps the first tensor of a key."""
+    db = TensorDB()
+    other_key = tensor_key._replace(tags=('model',))
+    db.cache_tensors([(tensor_key, nparray), (other_key, nparray), (tensor_key, nparray + 1)])
+
+    assert len(db) == 2
+    assert np.array_equal(db.get_tensor_from_cache(tensor_key), nparray)
+    assert np.array_equal(db.get_tensor_from_cache(other_key), nparray)
+
+
 def test_tensor_from_cache_empty(tensor_key):
     """Test get works returns None if tensor key is not in the db."""
     db = TensorDB()
@@ -81,7 +95,7 @@ def test_clean_up(nparray, tensor_key):
     db = TensorDB()
 
     db.cache_tensor({tensor_key: nparray})
-    db.tensor_db['round'] = 2
+    db.cache_tensor({tensor_key._replace(round_number=2): nparray})
     db.clean_up()
     cached_nparray = db.get_tensor_from_cache(tensor_key)
 
@@ -104,14 +118,45 @@ def test_clean_up_not_clean_up_with_negative_argument(nparray, tensor_key):
     db = TensorDB()
 
     db.cache_tensor({tensor_key: nparray})
-    db.tensor_db['round'] = 2
+    db.cache_tensor({tensor_key._replace(round_number=2): nparray})
     db.clean_up(remove_older_than=-1)
-    db.tensor_db['round'] = 0
     cached_nparray = db.get_tensor_from_cache(tensor_key)
 
     assert np.array_equal(nparray, cached_nparray)
 
 
+def test_cache_compressed_tensor(nparray, tensor_key):
+    """Test that the compressed form of a tensor is cached and cleaned up with its round."""
+    db = TensorDB()
+    compressed_key = tensor_key._replace(tags=('compressed',))
+    db.cache_compressed_tensor(tensor_key, compressed_key, b'data', [{'int_list': [1, 8]}])
+
+    assert db.get_tensor_from_cache(tensor_key) is None
+    assert db.get_compressed_tensor_from_cache(tensor_key) == (
+        compressed_key, b'data', [{'int_list': [1, 8]}])
+
+    db.cache_tensor({tensor_key._replace(round_number=2): nparray})
+    db.clean_up()
+
+    assert db.get_compressed_tensor_from_cache(tensor_key) is None
+
+
+def test_accumulate_tensor(nparray, tensor_key):
+    """Test that accumulated tensors give the weighted average of the collaborators."""
+    db = TensorDB()
+    agg_tensor_key = tensor_key._replace(tags=('trained',))
+    db.accumulate_tensor(agg_tensor_key, 'col1', nparray, 1)
+
+    assert db.get_accumulated_tensor(agg_tensor_key, ['col1', 'col2']) is None
+
+    db.accumulate_tensor(agg_tensor_key, 'col2', nparray * 2, 3)
+    agg_nparray = db.get_accumulated_tensor(agg_tensor_key, ['col1', 'col2'])
+
+    assert np.allclose(agg_nparray, np.average([nparray, nparray * 2], weights=[1, 3], axis=0))
+    assert np.array_equal(db.get_tensor_from_cache(agg_tensor_key), agg_nparray)
+    assert db.get_accumulated_tensor(agg_tensor_key, ['col1', 'col2']) is None
+
+
 def test_get_aggregated_tensor_directly(nparray, tensor_key):
     """Test that get_aggregated_tensor returns tensors directly."""
     db = TensorDB()
@@ -226,3 +271,78 @@ def test_get_aggregated_tensor_new_aggregation_function(tensor_db):
         tensor_key, collaborator_weight_dict, Sum())
 
     assert np.array_equal(agg_nparray, np.array([2, 4, 6, 8, 10]))
+
+
+def test_iterate_by_round(tensor_db):
+    """Test that _iterate yields the history from the latest round."""
+    tensor_db.cache_tensor({TensorKey('tensor_name', 'agg', 1, False, ('model',)): np.zeros(5)})
+
+    rows = list(tensor_db._iterate())
+
+    assert [row['round'] for row in rows] == [1, 0, 0]
+    assert rows[1]['tags'] == ('col1',)
+    assert np.array_equal(rows[2]['nparray'], np.array([2, 3, 4, 5, 6]))
+
+
+class _NoScanDict(dict):
+    """Dictionary that fails when its content is iterated over."""
+
+    def __iter__(self):
+        raise AssertionError('the tensors were scanned')
+
+    def keys(self):
+        raise AssertionError('the tensors were scanned')
+
+    def values(self):
+        raise AssertionError('the tensors were scanned')
+
+    def items(self):
+        raise AssertionError('the tensors were scanned')
+
+
+def test_lookup_does_not_scan_tensors():
+    """Test that lookups are done by key without scanning the stored tensors."""
+    db = TensorDB()
+    db.cache_tensor({
+        TensorKey(f'layer_{i}', 'agg', i // 100, False, ('model',)): np.full(1, i)
+        for i in range(1000)
+    })
+    db.tensors = _NoScanDict(db.tensors)
+
+    tensor_key = TensorKey('layer_512', 'agg', 5, False, ('model',))
+    missing_key = TensorKey('layer_512', 'agg', 6, False, ('model',))
+
+    assert db.get_tensor_from_cache(tensor_key)[0] == 512
+    assert db.get_tensor_from_cache(missing_key) is None
+    assert db.get_aggregated_tensor(tensor_key, {}, WeightedAverage())[0][0] == 512
+
+
+def _lookup_seconds(size, lookups=1000, repeat=5):
+    """Fill a TensorDB with size tensors and time lookups of the same keys."""
+    db = TensorDB()
+    db.cache_tensor({
+        TensorKey(f'layer_{i}', 'agg', i // 100, False, ('model',)): np.zeros(1)
+        for i in range(size)
+    })
+    tensor_keys = [TensorKey(f'layer_{i}', 'agg', i // 100, False, ('model',))
+                   for i in range(min(size, lookups))]
+    cached = min(
+        timeit.timeit(lambda: [db.get_tensor_from_cache(tk) for tk in tensor_keys], number=1)
+        for _ in range(repeat)
+    )
+    aggregated = min(
+        timeit.timeit(lambda: [db.get_aggregated_tensor(tk, {}, WeightedAverage())
+                               for tk in tensor_keys], number=1)
+        for _ in range(repeat)
+    )
+    return cached, aggregated
+
+
+@pytest.mark.skipif(not os.environ.get('OPENFL_BENCHMARK'),
+                    reason='microbenchmark, set OPENFL_BENCHMARK=1 to run it')
+def test_lookup_cost_benchmark():
+    """Microbenchmark: print the cost of lookups with 1k and 100k cached tensors."""
+    for size in (1000, 100000):
+        cached, aggregated = _lookup_seconds(size)
+        print(f'1000 lookups with {size} tensors: get_tensor_from_cache {cached * 1e3:.2f} ms, '
+              f'get_aggregated_tensor {aggregated * 1e3:.2f} ms')